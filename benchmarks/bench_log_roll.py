@@ -0,0 +1,58 @@
+"""Memory footprint and read cost of ``LogRoll``.
+
+Fills a ``LogRoll`` with synthetic compose log lines and compares the memory it
+holds (measured with ``tracemalloc``) against the equivalent list of
+``(source, text)`` tuples, then times the per-stream reads. The UTF-8 text
+itself is the floor: besides it a ``LogRoll`` spends about nine bytes per line
+(a separator and two 32-bit index entries), so the saving shrinks as lines get
+longer.
+
+Run with::
+
+    python benchmarks/bench_log_roll.py --lines 200000
+"""
+
+import argparse
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+
+from dokker.log_watcher import LogRoll
+
+
+def synthetic_lines(count: int) -> List[Tuple[str, str]]:
+    """Lines shaped like ``docker compose logs`` output, 1 in 10 on stderr."""
+    return [("STDERR" if i % 10 == 0 else "STDOUT", f'web-1  | 172.18.0.1 - - "GET /api/items/{i} HTTP/1.1" 200 {i % 997}') for i in range(count)]
+
+
+def measure(build: Callable[[], object]) -> Tuple[object, int]:
+    """Return the object *build* creates and the bytes it holds on to."""
+    tracemalloc.start()
+    obj = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current
+
+
+def main(count: int) -> None:
+    """Compare a list of tuples with a LogRoll holding the same lines."""
+    # Generate the lines as the streaming layer would: fresh str objects.
+    _, list_bytes = measure(lambda: synthetic_lines(count))
+    roll, roll_bytes = measure(lambda: LogRoll(synthetic_lines(count)))
+    assert isinstance(roll, LogRoll)
+
+    print(f"lines={count}")
+    print(f"list of tuples: {list_bytes / 1e6:8.2f} MB ({list_bytes / count:6.1f} B/line)")
+    print(f"LogRoll:        {roll_bytes / 1e6:8.2f} MB ({roll_bytes / count:6.1f} B/line)  {list_bytes / roll_bytes:.1f}x smaller")
+
+    for name in ("stdout", "stdout_list", "stderr_list"):
+        start = time.perf_counter()
+        getattr(roll, name)
+        print(f"{name}: {(time.perf_counter() - start) * 1000:7.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=200_000, help="number of log lines")
+    args = parser.parse_args()
+    main(args.lines)
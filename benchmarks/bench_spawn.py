@@ -0,0 +1,77 @@
+"""Per-call spawn overhead of ``astream_command``: exec vs shell mode.
+
+Runs a few hundred ``docker compose version`` calls against a stub ``docker``
+binary (a tiny shell script, so no docker daemon or CLI is needed) and reports
+the wall time per call for both process-spawning strategies. The difference is
+the cost of the extra ``/bin/sh`` fork + exec that shell mode pays on every
+compose invocation.
+
+Run with::
+
+    python benchmarks/bench_spawn.py --calls 300
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import stat
+import tempfile
+import time
+from typing import List
+
+from dokker.command import astream_command
+
+STUB = """#!/bin/sh
+echo "Docker Compose version v2.27.0"
+"""
+
+
+def write_stub(directory: str) -> str:
+    """Write an executable stub ``docker`` into *directory* and return its path."""
+    path = os.path.join(directory, "docker")
+    with open(path, "w") as f:
+        f.write(STUB)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+async def time_calls(command: List[str], calls: int, shell: bool) -> List[float]:
+    """Run *command* ``calls`` times sequentially and return per-call seconds."""
+    timings: List[float] = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        async for _ in astream_command(command, shell=shell):
+            pass
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: List[float]) -> float:
+    """Print a one-line summary for *timings* and return the mean in ms."""
+    mean = statistics.fmean(timings) * 1000
+    median = statistics.median(timings) * 1000
+    p95 = sorted(timings)[int(len(timings) * 0.95) - 1] * 1000
+    print(f"{name:<6} calls={len(timings):<5} mean={mean:7.3f}ms median={median:7.3f}ms p95={p95:7.3f}ms")
+    return mean
+
+
+async def main(calls: int) -> None:
+    """Benchmark both modes against the stub binary."""
+    with tempfile.TemporaryDirectory() as directory:
+        command = [write_stub(directory), "compose", "version"]
+
+        # Warm up the page cache / event loop child watcher before measuring.
+        await time_calls(command, 5, shell=False)
+
+        exec_mean = report("exec", await time_calls(command, calls, shell=False))
+        shell_mean = report("shell", await time_calls(command, calls, shell=True))
+
+    print(f"shell overhead per call: {shell_mean - exec_mean:+.3f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300, help="number of calls per mode")
+    args = parser.parse_args()
+    asyncio.run(main(args.calls))
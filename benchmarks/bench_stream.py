@@ -0,0 +1,94 @@
+"""Throughput of ``astream_command``.
+
+Writes a synthetic compose log to a temporary file and streams it through a
+local ``cat`` process, once with ``astream_command`` and once with the previous
+line-at-a-time reader (one ``readline``, decode and queue handoff per line over
+an unbounded queue), and once more in raw (undecoded) mode, and reports
+lines/s and MB/s for each.
+
+Run with::
+
+    python benchmarks/bench_stream.py --megabytes 100
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import tempfile
+import time
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from dokker.command import astream_command
+
+LINE = 'web-1  | 172.18.0.1 - - "GET /api/items/{i} HTTP/1.1" 200 {size}\n'
+
+
+def write_log(path: str, megabytes: int) -> int:
+    """Write about *megabytes* MB of log lines to *path*, return the line count."""
+    target = megabytes * 1_000_000
+    written = lines = 0
+    with open(path, "w") as f:
+        while written < target:
+            chunk = "".join(LINE.format(i=lines + i, size=(lines + i) % 997) for i in range(10_000))
+            f.write(chunk)
+            written += len(chunk)
+            lines += 10_000
+    return lines
+
+
+async def line_at_a_time(command: List[str]) -> AsyncIterator[Tuple[str, str]]:
+    """The per-line reader ``astream_command`` used before batching."""
+    proc = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    assert proc.stdout is not None and proc.stderr is not None
+    queue: "asyncio.Queue[Optional[Tuple[str, str]]]" = asyncio.Queue()
+
+    async def read(stream: asyncio.StreamReader, name: str) -> None:
+        async for line in stream:
+            await queue.put((name, line.decode("utf-8").strip()))
+        await queue.put(None)
+
+    readers = [asyncio.create_task(read(proc.stdout, "STDOUT")), asyncio.create_task(read(proc.stderr, "STDERR"))]
+    finished = 0
+    while finished < len(readers):
+        item = await queue.get()
+        if item is None:
+            finished += 1
+            continue
+        yield item
+    await proc.wait()
+
+
+async def consume(stream: Callable[[List[str]], AsyncIterator[Tuple[str, str]]], command: List[str]) -> Tuple[int, float]:
+    """Drain *stream* and return the line count and elapsed seconds."""
+    start = time.perf_counter()
+    count = 0
+    async for _ in stream(command):
+        count += 1
+    return count, time.perf_counter() - start
+
+
+async def main(megabytes: int) -> None:
+    """Stream the same log through every reader and compare."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "compose.log")
+        expected = write_log(path, megabytes)
+        size = os.path.getsize(path) / 1e6
+        print(f"log: {size:.1f} MB, {expected} lines")
+
+        readers = (
+            ("line-at-a-time", line_at_a_time),
+            ("batched", astream_command),
+            ("batched raw", functools.partial(astream_command, raw=True)),
+        )
+        for name, stream in readers:
+            count, elapsed = await consume(stream, ["cat", path])
+            assert count == expected, (name, count, expected)
+            print(f"{name:>15}: {elapsed:6.2f}s  {count / elapsed / 1e6:5.2f}M lines/s  {size / elapsed:7.1f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=int, default=100, help="size of the synthetic log")
+    args = parser.parse_args()
+    asyncio.run(main(args.megabytes))
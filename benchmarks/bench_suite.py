@@ -0,0 +1,328 @@
+"""dokker's own overhead, measured against a fake ``docker`` binary.
+
+Every benchmark drives the real dokker code paths (``CLI``, ``LogWatcher``,
+``Deployment``) against the scriptable stand-in of ``fake_docker.py``, so no
+docker daemon is needed and the numbers are dokker's overhead only:
+
+``stream``
+    Lines/s and MB/s of ``CLI.astream_docker_logs`` over a large log.
+``fanout``
+    Watchers following the same logs, sharing one stream through a
+    ``LogHub`` vs each spawning its own ``logs --follow``: seconds until
+    every watcher has seen the last line, and the CPU seconds the docker
+    processes used. The wall time is bound by every watcher collecting every
+    line, so the hub mostly saves the extra compose processes.
+``spec``
+    Parsing a ``docker compose config`` of many services into a
+    ``ComposeSpec`` and looking one service up, eagerly and lazily in
+    process, and end to end (``CLI.ainspect_config``).
+``health``
+    How long after a service turns healthy ``Deployment.arun_check`` notices,
+    against a local HTTP server answering 503 until then.
+``teardown``
+    Time a ``Deployment`` spends exiting beyond the ``down`` call itself.
+
+Each run also measures the spawn ``baseline`` (a fake call printing nothing),
+which the end-to-end numbers include. ``--json`` writes every result to a
+file, to track regressions across commits.
+
+Run with::
+
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --only stream,spec --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import AsyncExitStack
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiohttp import web
+
+from dokker import CLI, Deployment, LogWatcher
+from dokker.command import astream_command
+from dokker.compose_spec import ComposeSpec
+from dokker.log_hub import LogHub
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_docker import install
+
+LINE = 'web-1  | 172.18.0.1 - - "GET /api/items/{i} HTTP/1.1" 200 {size}\n'
+
+Result = Dict[str, float]
+
+
+class Bench:
+    """The fake docker of one benchmark, in its own directory."""
+
+    def __init__(self, directory: str, scenario: Dict[str, Any]) -> None:
+        """Install a fake docker replaying *scenario* into *directory*."""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.compose_file = os.path.join(directory, "docker-compose.yml")
+        with open(self.compose_file, "w") as f:
+            f.write("services: {}\n")
+        self.client_call = install(directory, scenario)
+
+    def cli(self) -> CLI:
+        """A CLI calling the fake docker."""
+        return CLI(compose_files=[self.compose_file], client_call=self.client_call, compose_project_name="bench")
+
+    async def aget_cli(self) -> CLI:
+        """Be a ``CLIBearer``."""
+        return self.cli()
+
+
+class BenchProject:
+    """A ``Project`` whose CLI calls the fake docker of a ``Bench``."""
+
+    def __init__(self, bench: Bench) -> None:
+        """Create a project for *bench*."""
+        self.bench = bench
+
+    async def ainititialize(self) -> CLI:
+        """Return the CLI of the bench."""
+        return self.bench.cli()
+
+    async def atear_down(self, cli: CLI) -> None:
+        """Nothing to clean up."""
+
+    async def abefore_pull(self) -> None:
+        """Nothing to prepare."""
+
+    async def abefore_up(self) -> None:
+        """Nothing to prepare."""
+
+    async def abefore_enter(self) -> None:
+        """Nothing to prepare."""
+
+    async def abefore_down(self) -> None:
+        """Nothing to prepare."""
+
+    async def abefore_stop(self) -> None:
+        """Nothing to prepare."""
+
+
+def write_log(path: str, lines: int) -> int:
+    """Write *lines* log lines to *path*, return its size in bytes."""
+    with open(path, "w") as f:
+        for first in range(0, lines, 10_000):
+            f.write("".join(LINE.format(i=i, size=i % 997) for i in range(first, min(first + 10_000, lines))))
+    return os.path.getsize(path)
+
+
+def write_text(path: str, text: str) -> None:
+    """Write *text* to *path*."""
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def compose_config(services: int) -> Dict[str, Any]:
+    """A ``docker compose config`` with *services* services of realistic size."""
+    config: Dict[str, Any] = {"name": "bench", "services": {}, "networks": {"default": {"name": "bench_default"}}}
+    for i in range(services):
+        config["services"][f"service{i}"] = {
+            "image": f"registry.example.com/team/service{i}:1.{i}",
+            "command": ["serve", "--port", "8000"],
+            "environment": {f"VAR_{j}": f"value-{j}" for j in range(10)},
+            "labels": {"dokker.role": "backend" if i % 2 else "frontend", "dokker.index": str(i)},
+            "ports": [{"mode": "ingress", "protocol": "tcp", "target": 8000, "published": 20000 + i}],
+            "depends_on": {f"service{i - 1}": {"condition": "service_started"}} if i else {},
+            "volumes": [{"type": "bind", "source": f"/srv/service{i}", "target": "/data", "bind": {"create_host_path": True}}],
+            "networks": {"default": None},
+        }
+    return config
+
+
+def children_cpu() -> float:
+    """CPU seconds the reaped child processes (the fake docker calls) used so far."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def timed(call: Callable[[], Awaitable[Any]]) -> float:
+    """Await *call* and return the seconds it took."""
+    start = time.perf_counter()
+    await call()
+    return time.perf_counter() - start
+
+
+async def bench_baseline(tmp: str, calls: int) -> Result:
+    """Seconds per fake docker call that prints nothing."""
+    cli = Bench(os.path.join(tmp, "baseline"), {"default": {}}).cli()
+
+    async def call() -> None:
+        async for _ in astream_command(cli.docker_cmd + ["version"], shell=cli.shell):
+            pass
+
+    times = [await timed(call) for _ in range(calls)]
+    return {"seconds": statistics.median(times)}
+
+
+async def bench_stream(tmp: str, lines: int) -> Result:
+    """Lines/s and MB/s of ``astream_docker_logs``."""
+    directory = os.path.join(tmp, "stream")
+    os.makedirs(directory, exist_ok=True)
+    log = os.path.join(directory, "compose.log")
+    size = write_log(log, lines)
+    # The fake prints the prepared file in one go, so it is never the bottleneck.
+    cli = Bench(directory, {"logs": {"stdout_file": log, "hold": False}}).cli()
+
+    count = 0
+
+    async def drain() -> None:
+        nonlocal count
+        async for _ in cli.astream_docker_logs():
+            count += 1
+
+    elapsed = await timed(drain)
+    assert count == lines, (count, lines)
+    return {"seconds": elapsed, "lines_per_s": lines / elapsed, "mb_per_s": size / 1e6 / elapsed}
+
+
+async def bench_fanout(tmp: str, watchers: int, lines: int) -> Result:
+    """Seconds until every watcher saw the last line, with and without a hub."""
+    directory = os.path.join(tmp, "fanout")
+    os.makedirs(directory, exist_ok=True)
+    log = os.path.join(directory, "compose.log")
+    write_log(log, lines)
+    bench = Bench(directory, {"logs": {"stdout_file": log}})
+    last = f"/api/items/{lines - 1} "
+
+    async def follow(hub: Any) -> Tuple[float, float]:
+        before = children_cpu()
+        async with AsyncExitStack() as stack:
+            start = time.perf_counter()
+            started = [await stack.enter_async_context(LogWatcher(cli_bearer=bench, hub=hub, wait_for_first_log=False, max_lines=1000)) for _ in range(watchers)]
+            await asyncio.gather(*(watcher.await_pattern(last, timeout=120) for watcher in started))
+            elapsed = time.perf_counter() - start
+        if hub is not None:
+            await hub.aclose()
+        return elapsed, children_cpu() - before
+
+    separate, separate_cpu = await follow(None)
+    shared, shared_cpu = await follow(LogHub(bench))
+    return {
+        "separate_seconds": separate,
+        "shared_seconds": shared,
+        "separate_lines_per_s": watchers * lines / separate,
+        "shared_lines_per_s": watchers * lines / shared,
+        "separate_docker_cpu_seconds": separate_cpu,
+        "shared_docker_cpu_seconds": shared_cpu,
+    }
+
+
+async def bench_spec(tmp: str, services: int, repeat: int) -> Result:
+    """Seconds to parse a compose config into a ``ComposeSpec``."""
+    directory = os.path.join(tmp, "spec")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "config.json")
+    text = json.dumps(compose_config(services), indent=2)
+    await asyncio.to_thread(write_text, path, text)
+    cli = Bench(directory, {"config": {"stdout_file": path}}).cli()
+
+    def parse(lazy: bool) -> float:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ComposeSpec.from_json(text, lazy=lazy).find_service("service0")
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    end_to_end = [await timed(cli.ainspect_config) for _ in range(repeat)]
+    return {"parse_seconds": parse(False), "lazy_parse_seconds": parse(True), "inspect_seconds": statistics.median(end_to_end), "kilobytes": len(text) / 1e3}
+
+
+async def bench_health(tmp: str, delays: List[float]) -> Result:
+    """Seconds between a service turning healthy and ``arun_check`` returning."""
+    ready_at = 0.0
+
+    async def health(request: web.Request) -> web.Response:
+        return web.Response(status=200 if time.monotonic() >= ready_at else 503)
+
+    app = web.Application()
+    app.router.add_get("/health", health)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+
+    config = os.path.join(tmp, "health.json")
+    await asyncio.to_thread(write_text, config, json.dumps({"services": {"web": {"image": "web"}}}))
+    bench = Bench(os.path.join(tmp, "health"), {"config": {"stdout_file": config}})
+    deployment = Deployment(project=BenchProject(bench))
+    check = deployment.add_health_check(f"http://127.0.0.1:{port}/health", service="web", max_retries=1000, timeout=60)
+
+    try:
+        await deployment.ainspect()
+        late = []
+        for delay in delays:
+            ready_at = time.monotonic() + delay
+            late.append(await timed(lambda: deployment.arun_check(check)) - delay)
+    finally:
+        await deployment.health_check_runner.aclose()
+        await runner.cleanup()
+    return {"mean_late_seconds": statistics.mean(late), "max_late_seconds": max(late)}
+
+
+async def bench_teardown(tmp: str, latency: float, repeat: int) -> Result:
+    """Seconds a deployment takes to exit beyond its ``down`` call."""
+    bench = Bench(os.path.join(tmp, "teardown"), {"down": {"latency": latency}, "default": {}})
+    overheads = []
+    for _ in range(repeat):
+        deployment = Deployment(project=BenchProject(bench), policy="testing")
+        await deployment.__aenter__()
+        await deployment.aup()
+        elapsed = await timed(lambda deployment=deployment: deployment.__aexit__(None, None, None))
+        overheads.append(elapsed - latency)
+    return {"overhead_seconds": statistics.median(overheads)}
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Result]:
+    """Run the selected benchmarks and print their results."""
+    benchmarks: Dict[str, Callable[[str], Awaitable[Result]]] = {
+        "baseline": lambda tmp: bench_baseline(tmp, 20),
+        "stream": lambda tmp: bench_stream(tmp, args.lines),
+        "fanout": lambda tmp: bench_fanout(tmp, args.watchers, args.lines // 10),
+        "spec": lambda tmp: bench_spec(tmp, args.services, 5),
+        "health": lambda tmp: bench_health(tmp, [0.1, 0.3, 0.5, 1.0]),
+        "teardown": lambda tmp: bench_teardown(tmp, 0.1, 5),
+    }
+    selected = ["baseline"] + [name for name in (args.only.split(",") if args.only else benchmarks) if name != "baseline"]
+    unknown = set(selected) - set(benchmarks)
+    if unknown:
+        raise SystemExit(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results: Dict[str, Result] = {}
+    path = os.environ.get("PATH", "")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in selected:
+                results[name] = await benchmarks[name](tmp)
+                metrics = "  ".join(f"{key}={value:.4g}" for key, value in results[name].items())
+                print(f"{name:>9}: {metrics}")
+    finally:
+        os.environ["PATH"] = path
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", help="comma separated benchmarks to run (default: all)")
+    parser.add_argument("--lines", type=int, default=500_000, help="log lines to stream (a tenth of it per watcher)")
+    parser.add_argument("--watchers", type=int, default=8, help="watchers following the logs")
+    parser.add_argument("--services", type=int, default=200, help="services of the parsed compose config")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    results = asyncio.run(main(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,145 @@
+"""A scriptable stand-in for the ``docker`` executable.
+
+``install`` writes a ``docker`` shim into a directory, puts the directory at
+the front of ``PATH`` (so builders and ``LocalProject``, which call
+``docker compose``, pick it up) and returns the ``client_call`` to pass to a
+``CLI`` explicitly. Every invocation runs this file, which looks up the
+compose subcommand (``logs``, ``config``, ``up``, ``down``, ...) in a JSON
+scenario and replays what the scenario scripts for it:
+
+``latency``
+    Seconds to wait before the first byte of output.
+``lines`` / ``line``
+    How many lines to print, and their template (formatted with ``i``, the
+    line number, and ``service``, cycling through ``services``).
+``rate``
+    Lines per second (0, the default, prints as fast as possible).
+``stderr_every``
+    Print every n-th line to stderr instead of stdout.
+``stdout_file``
+    Print the contents of this file (e.g. the JSON of ``config``).
+``exit_code``
+    The exit code, 0 by default.
+``hold``
+    Keep running once done, until killed (the default for ``--follow``).
+
+Subcommands missing from the scenario fall back to its ``"default"`` entry.
+Nothing here needs docker, so the benchmarks measure dokker's own overhead.
+"""
+
+import json
+import os
+import shlex
+import stat
+import sys
+import time
+from typing import Any, Dict, List
+
+# Compose (and docker) options that take a value, so the value is no subcommand.
+_VALUE_OPTIONS = {
+    "--file",
+    "-f",
+    "--project-name",
+    "-p",
+    "--project-directory",
+    "--env-file",
+    "--profile",
+    "--config",
+    "--context",
+    "-c",
+    "--host",
+    "-H",
+    "--log-level",
+    "-l",
+    "--tlscacert",
+    "--tlscert",
+    "--tlskey",
+    "--ansi",
+    "--parallel",
+    "--progress",
+}
+
+SHIM = """#!/bin/sh
+FAKE_DOCKER_SCENARIO={scenario} exec {python} {script} "$@"
+"""
+
+
+def install(directory: str, scenario: Dict[str, Any]) -> List[str]:
+    """Install a fake ``docker`` replaying *scenario* in *directory*; return its ``client_call``."""
+    scenario_path = os.path.join(directory, "scenario.json")
+    with open(scenario_path, "w") as f:
+        json.dump(scenario, f)
+    path = os.path.join(directory, "docker")
+    with open(path, "w") as f:
+        f.write(SHIM.format(scenario=shlex.quote(scenario_path), python=shlex.quote(sys.executable), script=shlex.quote(os.path.abspath(__file__))))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.environ["PATH"] = directory + os.pathsep + os.environ.get("PATH", "")
+    return [path, "compose"]
+
+
+def subcommand(argv: List[str]) -> str:
+    """The compose subcommand in *argv* (the arguments after ``docker``)."""
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in _VALUE_OPTIONS:
+            skip = True
+        elif not arg.startswith("-") and arg != "compose":
+            return arg
+    return ""
+
+
+def replay(step: Dict[str, Any], argv: List[str]) -> int:
+    """Print what *step* scripts and return its exit code."""
+    out, err = sys.stdout.buffer, sys.stderr.buffer
+    if step.get("latency"):
+        time.sleep(step["latency"])
+    if step.get("stdout_file"):
+        with open(step["stdout_file"], "rb") as f:
+            out.write(f.read())
+
+    count = step.get("lines", 0)
+    template = step.get("line", "{service}-1  | line {i}") + "\n"
+    services = step.get("services", ["web"])
+    stderr_every = step.get("stderr_every", 0)
+    rate = step.get("rate", 0)
+    # Unthrottled output goes out in large writes; throttled output in bursts
+    # every 10ms, so the rate holds without a syscall per line.
+    burst = max(1, int(rate / 100)) if rate else 10_000
+    started = time.monotonic()
+    for first in range(0, count, burst):
+        stdout, stderr = [], []
+        for i in range(first, min(first + burst, count)):
+            line = template.format(i=i, service=services[i % len(services)])
+            (stderr if stderr_every and i % stderr_every == stderr_every - 1 else stdout).append(line)
+        out.write("".join(stdout).encode())
+        err.write("".join(stderr).encode())
+        if rate:
+            out.flush()
+            err.flush()
+            ahead = started + (first + burst) / rate - time.monotonic()
+            if ahead > 0:
+                time.sleep(ahead)
+    out.flush()
+    err.flush()
+
+    # "-f" before the subcommand is --file.
+    follow = "logs" in argv and any(arg in ("--follow", "-f") for arg in argv[argv.index("logs") :])
+    if step.get("hold", follow):
+        while True:
+            time.sleep(3600)
+    return int(step.get("exit_code", 0))
+
+
+def main() -> int:
+    """Replay the scenario step of the subcommand this process was called with."""
+    with open(os.environ["FAKE_DOCKER_SCENARIO"]) as f:
+        scenario = json.load(f)
+    argv = sys.argv[1:]
+    step = scenario.get(subcommand(argv), scenario.get("default", {}))
+    return replay(step, argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,7 +8,9 @@ sensible defaults for common docker-compose workflows.
 from .deployment import (
     Deployment,
     HealthCheck,
+    HealthCheckRunner,
     Logger,
+    UsageLogger,
     PolicyName,
     TeardownPolicy,
     TEARDOWN_POLICIES,
@@ -19,18 +21,30 @@ from .builders import (
     monitoring,
     local,
 )
+from .orchestrator import Orchestrator, OrchestrationError
+from .pool import DeploymentPool, PoolError, pool_fixture
 from .project import Project
 from .projects.local import LocalProject
+from .projects.mirror import MirrorMode
+from .log_archive import LogArchive
+from .tracing import OTLPJsonFileExporter, Span, Tracer
+from .log_hub import LogHub, LogSubscription
+from .log_record import LogRecord
 from .log_watcher import LogRoll, LogWatcher
-from .command import CommandError
-from .cli import CLI, CLIError
+from .command import CommandError, ResourceUsage
+from .cli import CLI, CLIBackend, CLIError
+from .containers import ComposeContainer
+from .engine import DockerEngineBackend, EngineError
+from .spec_cache import SpecCache
 from .errors import (
     DokkerError,
     HealthCheckError,
     LabelNotFoundError,
+    LogPatternNotFoundError,
     NotInitializedError,
     NotInspectableError,
     NotInspectedError,
+    NotReadyError,
     PortNotFoundError,
     ServiceNotFoundError,
     TearDownError,
@@ -39,7 +53,9 @@ from .errors import (
 __all__ = [
     "Deployment",
     "HealthCheck",
+    "HealthCheckRunner",
     "Logger",
+    "UsageLogger",
     "PolicyName",
     "TeardownPolicy",
     "TEARDOWN_POLICIES",
@@ -47,19 +63,40 @@ __all__ = [
     "testing",
     "monitoring",
     "local",
+    "Orchestrator",
+    "OrchestrationError",
+    "DeploymentPool",
+    "PoolError",
+    "pool_fixture",
     "Project",
     "LocalProject",
+    "MirrorMode",
+    "LogArchive",
+    "Tracer",
+    "Span",
+    "OTLPJsonFileExporter",
+    "LogHub",
+    "LogSubscription",
+    "LogRecord",
     "LogRoll",
     "LogWatcher",
     "CLI",
+    "CLIBackend",
     "CLIError",
+    "ComposeContainer",
+    "DockerEngineBackend",
+    "EngineError",
+    "SpecCache",
     "CommandError",
+    "ResourceUsage",
     "DokkerError",
     "HealthCheckError",
     "LabelNotFoundError",
+    "LogPatternNotFoundError",
     "NotInitializedError",
     "NotInspectableError",
     "NotInspectedError",
+    "NotReadyError",
     "PortNotFoundError",
     "ServiceNotFoundError",
     "TearDownError",
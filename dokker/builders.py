@@ -2,6 +2,7 @@ import uuid
 from .deployment import Deployment, HealthCheck, PolicyName
 from typing import List, Optional, TYPE_CHECKING, Union
 from dokker.projects.copy import CopyPathProject
+from dokker.projects.mirror import MirrorMode
 from dokker.projects.local import LocalProject
 from dokker.types import ValidPath
 
@@ -14,6 +15,7 @@ def mirror(
     health_checks: Optional[List[HealthCheck]] = None,
     project_name: Optional[str] = None,
     policy: PolicyName = "testing",
+    mirror_mode: MirrorMode = "reflink",
 ) -> Deployment:
     """Creates a Mirror Deployment
 
@@ -39,6 +41,11 @@ def mirror(
     policy : PolicyName, optional
         Teardown policy, ``"testing"`` by default (down + remove the temp-dir copy
         on exit). Override to e.g. ``"manual"`` to drive teardown yourself.
+    mirror_mode : MirrorMode, optional
+        How the files are mirrored, ``"reflink"`` by default (copy-on-write
+        clones where the filesystem supports them, copies otherwise). Use
+        ``"hardlink"`` on filesystems without reflinks if no container writes
+        into the project files in place. The compose files are always copied.
 
     Returns
     -------
@@ -48,7 +55,7 @@ def mirror(
     if health_checks is None:
         health_checks = []
 
-    project = CopyPathProject(project_path=local_path, project_name=project_name)
+    project = CopyPathProject(project_path=local_path, project_name=project_name, mirror_mode=mirror_mode)
     deployment = Deployment(
         project=project,
         health_checks=health_checks,
@@ -6,16 +6,24 @@ from typing import (
     runtime_checkable,
     Dict,
     Literal,
+    Any,
+    AsyncIterator,
+    Tuple,
+    overload,
 )
 from pydantic import Field, field_validator
 from koil.composition import KoiledModel
 from datetime import timedelta
 from .compose_spec import ComposeSpec
+from .containers import ComposeContainer
 import json
 import os
+import re
+import shlex
 from dokker.errors import DokkerError
-from dokker.types import ValidPath, LogStream
+from dokker.types import ValidPath, LogStream, RawLogStream
 from dokker.command import astream_command
+from dokker.log_record import LogRecord
 
 
 class CLIError(DokkerError):
@@ -36,6 +44,54 @@ class CLIBearer(Protocol):
         ...
 
 
+@runtime_checkable
+class CLIBackend(Protocol):
+    """A CLIBackend serves some ``CLI`` operations without the compose binary.
+
+    When a ``CLI`` has a backend, the container-level operations (logs, stop,
+    restart, inspect and exec) are delegated to it instead of forking a new
+    ``docker compose`` process. Project-level operations (up, down, pull, run,
+    config) always go through the compose CLI. Every method receives the
+    delegating ``CLI`` so the backend can resolve the compose project.
+    """
+
+    def astream_docker_logs(
+        self,
+        cli: "CLI",
+        tail: Optional[str] = None,
+        follow: bool = False,
+        no_log_prefix: bool = False,
+        timestamps: bool = False,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        services: Optional[List[str]] = None,
+        raw: bool = False,
+        errors: str = "strict",
+    ) -> Union[LogStream, RawLogStream]:
+        """Stream the logs of the project's containers (as bytes if *raw*)."""
+        ...
+
+    def astream_stop(self, cli: "CLI", services: Optional[List[str]] = None, timeout: Optional[int] = None) -> LogStream:
+        """Stop the project's containers."""
+        ...
+
+    def astream_restart(self, cli: "CLI", services: Optional[List[str]] = None) -> LogStream:
+        """Restart the project's containers."""
+        ...
+
+    def astream_exec(self, cli: "CLI", service: str, command: List[str], index: int = 1) -> LogStream:
+        """Run a command in a running container of a service."""
+        ...
+
+    async def ainspect_containers(self, cli: "CLI", services: Optional[List[str]] = None) -> List[ComposeContainer]:
+        """Return the state of the project's containers."""
+        ...
+
+    async def aclose(self) -> None:
+        """Release any resources (connections) the backend holds."""
+        ...
+
+
 class CLI(KoiledModel):
     """A CLI object that represents the docker-compose CLI.
 
@@ -62,6 +118,12 @@ class CLI(KoiledModel):
     compose_project_directory: Optional[ValidPath] = None
     compose_compatibility: Optional[bool] = None
     client_call: List[str] = Field(default_factory=lambda: ["docker", "compose"])
+    # Execute commands directly (no intermediate `/bin/sh`). Only opt into the
+    # shell when `client_call` itself relies on shell syntax.
+    shell: bool = False
+    # Serve logs/stop/restart/inspect/exec through e.g. the engine API instead
+    # of spawning `docker compose` for each of them.
+    backend: Optional[CLIBackend] = None
 
     @field_validator("compose_files")
     def _validate_compose_files(cls, v: str) -> list[ValidPath]:
@@ -74,12 +136,32 @@ class CLI(KoiledModel):
 
         return x
 
+    @property
+    def project_name(self) -> str:
+        """The compose project name this CLI operates on.
+
+        This is the explicit ``compose_project_name`` if set, otherwise the name
+        compose derives itself: ``COMPOSE_PROJECT_NAME`` or the normalized
+        basename of the project directory. A top-level ``name:`` inside the
+        compose file is not taken into account, so pass an explicit project
+        name when relying on it together with a backend.
+        """
+        if self.compose_project_name:
+            return self.compose_project_name
+
+        env_name = os.environ.get("COMPOSE_PROJECT_NAME")
+        if env_name:
+            return env_name
+
+        directory = self.compose_project_directory or os.path.dirname(os.path.abspath(self.compose_files[0]))
+        return re.sub(r"[^a-z0-9_-]", "", os.path.basename(os.path.abspath(directory)).lower())
+
     @property
     def docker_cmd(self) -> List[str]:
         """Builds the docker command. This is the base prepended
         command that will be run by the CLI.
         """
-        result = self.client_call
+        result = list(self.client_call)
 
         if self.compose_files:
             for compose_file in self.compose_files:
@@ -120,6 +202,49 @@ class CLI(KoiledModel):
 
         return result
 
+    @overload
+    def astream_docker_logs(
+        self,
+        tail: Optional[str] = None,
+        follow: bool = False,
+        no_log_prefix: bool = False,
+        timestamps: bool = False,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        services: Union[str, List[str]] = [],
+        raw: Literal[False] = False,
+        errors: str = "strict",
+    ) -> LogStream: ...
+
+    @overload
+    def astream_docker_logs(
+        self,
+        tail: Optional[str] = None,
+        follow: bool = False,
+        no_log_prefix: bool = False,
+        timestamps: bool = False,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        services: Union[str, List[str]] = [],
+        *,
+        raw: Literal[True],
+        errors: str = "strict",
+    ) -> RawLogStream: ...
+
+    @overload
+    def astream_docker_logs(
+        self,
+        tail: Optional[str] = None,
+        follow: bool = False,
+        no_log_prefix: bool = False,
+        timestamps: bool = False,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        services: Union[str, List[str]] = [],
+        raw: bool = False,
+        errors: str = "strict",
+    ) -> AsyncIterator[Tuple[str, Any]]: ...
+
     async def astream_docker_logs(
         self,
         tail: Optional[str] = None,
@@ -129,8 +254,35 @@ class CLI(KoiledModel):
         since: Optional[str] = None,
         until: Optional[str] = None,
         services: Union[str, List[str]] = [],
-    ) -> LogStream:
-        """Runs the docker logs command asynchronously."""
+        raw: bool = False,
+        errors: str = "strict",
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Runs the docker logs command asynchronously.
+
+        With *raw* the lines are yielded as undecoded bytes, which is cheaper
+        when logs are only forwarded and never fails on binary output; otherwise
+        they are decoded with the *errors* handler ("replace" to tolerate
+        invalid UTF-8). See ``astream_command``.
+        """
+        if isinstance(services, str):
+            services = [services]
+
+        if self.backend is not None:
+            async for line in self.backend.astream_docker_logs(
+                self,
+                tail=tail,
+                follow=follow,
+                no_log_prefix=no_log_prefix,
+                timestamps=timestamps,
+                since=since,
+                until=until,
+                services=services,
+                raw=raw,
+                errors=errors,
+            ):
+                yield line
+            return
+
         full_cmd = self.docker_cmd + ["logs", "--no-color"]
         if tail is not None:
             full_cmd += ["--tail", tail]
@@ -146,13 +298,38 @@ class CLI(KoiledModel):
             full_cmd += ["--until", until]
 
         if services:
-            if isinstance(services, str):
-                services = [services]
             full_cmd += services
 
-        async for line in astream_command(full_cmd):
+        async for line in astream_command(full_cmd, shell=self.shell, raw=raw, errors=errors):
             yield line
 
+    async def astream_log_records(
+        self,
+        tail: Optional[str] = None,
+        follow: bool = False,
+        timestamps: bool = False,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        services: Union[str, List[str]] = [],
+        errors: str = "strict",
+    ) -> AsyncIterator[LogRecord]:
+        """Stream the logs as ``LogRecord``s, parsed once as they arrive.
+
+        Like ``astream_docker_logs`` (always with the compose prefix, which
+        gives every record its service and replica); with *timestamps* every
+        record carries the time docker logged the line at.
+        """
+        async for log in self.astream_docker_logs(
+            tail=tail,
+            follow=follow,
+            timestamps=timestamps,
+            since=since,
+            until=until,
+            services=services,
+            errors=errors,
+        ):
+            yield LogRecord.parse(log, timestamps=timestamps)
+
     async def astream_down(
         self,
         remove_orphans: bool = False,
@@ -165,13 +342,13 @@ class CLI(KoiledModel):
         if remove_orphans:
             full_cmd.append("--remove-orphans")
         if remove_images is not None:
-            full_cmd.append(f"--rmi {remove_images}")
+            full_cmd += ["--rmi", remove_images]
         if timeout is not None:
-            full_cmd.append(f"--timeout {timeout}")
+            full_cmd += ["--timeout", str(timeout)]
         if volumes:
             full_cmd.append("--volumes")
 
-        async for line in astream_command(full_cmd):
+        async for line in astream_command(full_cmd, shell=self.shell):
             yield line
 
     async def astream_pull(
@@ -195,7 +372,7 @@ class CLI(KoiledModel):
                 services = [services]
             full_cmd += services
 
-        async for line in astream_command(full_cmd):
+        async for line in astream_command(full_cmd, shell=self.shell):
             yield line
 
     async def astream_stop(
@@ -204,19 +381,24 @@ class CLI(KoiledModel):
         timeout: Union[int, timedelta, None] = None,
     ) -> LogStream:
         """Runs the docker-compose stop command asynchronously."""
+        if isinstance(timeout, timedelta):
+            timeout = int(timeout.total_seconds())
+        if isinstance(services, str):
+            services = [services]
+
+        if self.backend is not None:
+            async for line in self.backend.astream_stop(self, services=services, timeout=timeout):
+                yield line
+            return
+
         full_cmd = self.docker_cmd + ["stop"]
         if timeout is not None:
-            if isinstance(timeout, timedelta):
-                timeout = int(timeout.total_seconds())
-
-            full_cmd.append(f"--timeout {timeout}")
+            full_cmd += ["--timeout", str(timeout)]
 
         if services:
-            if isinstance(services, str):
-                services = [services]
             full_cmd += services
 
-        async for line in astream_command(full_cmd):
+        async for line in astream_command(full_cmd, shell=self.shell):
             yield line
 
     async def astream_restart(
@@ -224,14 +406,20 @@ class CLI(KoiledModel):
         services: Union[str, List[str], None] = None,
     ) -> LogStream:
         """Runs the docker-compose restart command asynchronously."""
+        if isinstance(services, str):
+            services = [services]
+
+        if self.backend is not None:
+            async for line in self.backend.astream_restart(self, services=services):
+                yield line
+            return
+
         full_cmd = self.docker_cmd + ["restart"]
 
         if services:
-            if isinstance(services, str):
-                services = [services]
             full_cmd += services
 
-        async for line in astream_command(full_cmd):
+        async for line in astream_command(full_cmd, shell=self.shell):
             yield line
 
     async def astream_up(
@@ -267,7 +455,7 @@ class CLI(KoiledModel):
         if abort_on_container_exit:
             full_cmd.append("--abort-on-container-exit")
         for service, scale in scales.items():
-            full_cmd.append(f"--scale {service}={scale}")
+            full_cmd += ["--scale", f"{service}={scale}"]
         if attach_dependencies:
             full_cmd.append("--attach-dependencies")
         if force_recreate:
@@ -294,23 +482,25 @@ class CLI(KoiledModel):
             if isinstance(no_attach_services, str):
                 no_attach_services = [no_attach_services]
             for service in no_attach_services:
-                full_cmd.append(f"--no-attach {service}")
+                full_cmd += ["--no-attach", service]
         if pull is not None:
-            full_cmd.append(f"--pull {pull}")
+            full_cmd += ["--pull", pull]
 
         if services:
             if isinstance(services, str):
                 services = [services]
             full_cmd += services
 
-        async for line in astream_command(full_cmd):
+        async for line in astream_command(full_cmd, shell=self.shell):
             yield line
 
     async def astream_run(self, service: str, command: List[str] | str, remove: bool = True) -> LogStream:
         """Runs the docker-compose run command asynchronously."""
         full_cmd = self.docker_cmd + ["run"]
         if isinstance(command, str):
-            command = [command]
+            # Without a shell in between, a command string has to be split into
+            # its argv here the same way the shell would have done it.
+            command = [command] if self.shell else shlex.split(command)
         if not command:
             raise ValueError("Command must be a non-empty list or string.")
 
@@ -321,12 +511,76 @@ class CLI(KoiledModel):
         if command:
             full_cmd += command
 
-        async for line in astream_command(full_cmd):
+        async for line in astream_command(full_cmd, shell=self.shell):
+            yield line
+
+    async def astream_exec(self, service: str, command: List[str] | str, index: int = 1) -> LogStream:
+        """Runs a command in a running container of a service (docker-compose exec)."""
+        if isinstance(command, str):
+            command = [command] if self.shell else shlex.split(command)
+        if not command:
+            raise ValueError("Command must be a non-empty list or string.")
+
+        if self.backend is not None:
+            async for line in self.backend.astream_exec(self, service=service, command=command, index=index):
+                yield line
+            return
+
+        full_cmd = self.docker_cmd + ["exec", "--no-TTY"]
+        if index != 1:
+            full_cmd += ["--index", str(index)]
+        full_cmd.append(service)
+        full_cmd += command
+
+        async for line in astream_command(full_cmd, shell=self.shell):
             yield line
 
+    async def ainspect_containers(self, services: Union[str, List[str], None] = None) -> List[ComposeContainer]:
+        """Inspect the state of the project's containers.
+
+        Returns
+        -------
+        List[ComposeContainer]
+            One entry per container (including stopped ones) of the requested
+            services, or of the whole project if no services are given.
+
+        Raises
+        ------
+        CLIError
+            An error that is raised when the output cannot be parsed.
+        """
+        if isinstance(services, str):
+            services = [services]
+
+        if self.backend is not None:
+            return await self.backend.ainspect_containers(self, services=services)
+
+        full_cmd = self.docker_cmd + ["ps", "--all", "--format", "json"]
+        if services:
+            full_cmd += services
+
+        stdout_lines: list[str] = []
+        async for source, line in astream_command(full_cmd, shell=self.shell):
+            if source == "STDOUT" and line:
+                stdout_lines.append(line)
+
+        try:
+            # Older compose versions print a single JSON array, newer ones one
+            # JSON object per line.
+            if stdout_lines and stdout_lines[0].startswith("["):
+                entries = json.loads("\n".join(stdout_lines))
+            else:
+                entries = [json.loads(line) for line in stdout_lines]
+            return [ComposeContainer.from_ps(entry) for entry in entries]
+        except Exception as e:
+            raise CLIError(f"Could not inspect containers! Error while parsing the json: {stdout_lines}") from e
+
     async def ainspect_config(self) -> ComposeSpec:
         """Inspect the config of the docker-compose project.
 
+        The spec validates its services lazily, each on its first lookup
+        (see ``ComposeSpec.from_json``).
+
         Returns
         -------
         ComposeSpec
@@ -339,9 +593,10 @@ class CLI(KoiledModel):
         """
         full_cmd = self.docker_cmd + ["config", "--format", "json"]
 
-        stdout_lines: list[str] = []
+        stdout_lines: list[bytes] = []
 
-        async for source, line in astream_command(full_cmd):
+        # Raw lines skip decoding: the JSON decoder takes the bytes as they are.
+        async for source, line in astream_command(full_cmd, shell=self.shell, raw=True):
             if source == "STDERR":
                 continue
             elif source == "STDOUT":
@@ -349,9 +604,9 @@ class CLI(KoiledModel):
             else:
                 raise ValueError(f"Unknown source: {source}")
 
-        result = "\n".join(stdout_lines)
+        result = b"\n".join(stdout_lines)
 
         try:
-            return ComposeSpec(**json.loads(result))
+            return ComposeSpec.from_json(result)
         except Exception as e:
-            raise CLIError(f"Could not inspect! Error while parsing the json: {result}") from e
+            raise CLIError(f"Could not inspect! Error while parsing the json: {result.decode('utf-8', 'replace')}") from e
@@ -1,15 +1,117 @@
 import asyncio
 import os
+import shlex
 import signal
-from typing import List, Optional, Union
-from dokker.types import LogStream
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, Iterator, List, Literal, Optional, Set, Tuple, Union, overload
+from dokker.types import LogStream, RawLogStream
 from dokker.errors import DokkerError
+from dokker.tracing import start_command_span
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None  # type: ignore[assignment]
 
 # Safety net for reaping a subprocess we have asked to die. After killing the
 # process group `proc.wait()` should resolve almost immediately; this bounds it
 # so a teardown can never block forever if the process is not reaped.
 KILL_TIMEOUT = 5.0
 
+# How many trailing lines per stream a CommandError carries. The lines are only
+# kept to explain a failure, and a long-running follow-stream must not buffer
+# its entire output for that.
+MAX_ERROR_LINES = 10_000
+
+# How much a reader pulls off a pipe per ``read`` call. Lines are split out of
+# each chunk in bulk and handed over as one batch.
+READ_CHUNK_SIZE = 64 * 1024
+
+# How many batches may wait in the queue between the readers and the consumer.
+# Once it is full the readers stop draining the pipes, so a service flooding
+# its output is throttled by the OS pipe buffer instead of growing our memory.
+MAX_QUEUED_BATCHES = 16
+
+Batch = Union[List[Tuple[str, Any]], BaseException, None]
+
+
+@dataclass(frozen=True)
+class ResourceUsage:
+    """What running a command cost.
+
+    ``wall_time`` is measured from spawning the process until it was reaped.
+    ``user_time`` and ``system_time`` (CPU seconds) are what the children of
+    this process that were reaped meanwhile cost (``getrusage``), which
+    includes the children the command waited for itself (e.g. the compose
+    plugin behind ``docker``). They are None where ``resource`` is missing,
+    and when another command was reaped while this one ran, since children
+    usage cannot be told apart. ``max_rss`` (peak resident memory, in bytes)
+    is a high-water mark over all children, so it is only known (else None)
+    when this command raised it.
+    """
+
+    command: str
+    wall_time: float
+    user_time: Optional[float] = None
+    system_time: Optional[float] = None
+    max_rss: Optional[int] = None
+
+    @property
+    def cpu_time(self) -> Optional[float]:
+        """User plus system CPU seconds."""
+        if self.user_time is None or self.system_time is None:
+            return None
+        return self.user_time + self.system_time
+
+    def __str__(self) -> str:
+        """A one-line summary, e.g. ``wall 1.20s, user 0.25s, sys 0.06s, max rss 42.1 MiB``."""
+        parts = [f"wall {self.wall_time:.2f}s"]
+        if self.user_time is not None and self.system_time is not None:
+            parts.append(f"user {self.user_time:.2f}s, sys {self.system_time:.2f}s")
+        if self.max_rss is not None:
+            parts.append(f"max rss {self.max_rss / 2**20:.1f} MiB")
+        return ", ".join(parts)
+
+    @classmethod
+    def combine(cls, usages: Iterable["ResourceUsage"]) -> Optional["ResourceUsage"]:
+        """The usage of several commands run one after the other: times add up, the peak RSS is the largest."""
+        usages = list(usages)
+        if not usages:
+            return None
+        if len(usages) == 1:
+            return usages[0]
+
+        def total(values: List[Optional[float]]) -> Optional[float]:
+            return None if any(value is None for value in values) else sum(value for value in values if value is not None)
+
+        peaks = [usage.max_rss for usage in usages if usage.max_rss is not None]
+        return cls(
+            command="; ".join(usage.command for usage in usages),
+            wall_time=sum(usage.wall_time for usage in usages),
+            user_time=total([usage.user_time for usage in usages]),
+            system_time=total([usage.system_time for usage in usages]),
+            max_rss=max(peaks) if peaks else None,
+        )
+
+
+_usage_sink: ContextVar[Optional[List[ResourceUsage]]] = ContextVar("dokker_usage_sink", default=None)
+
+
+@contextmanager
+def collect_usage() -> Iterator[List[ResourceUsage]]:
+    """Collect the ``ResourceUsage`` of every command streamed in the block (in this task)."""
+    usages: List[ResourceUsage] = []
+    token = _usage_sink.set(usages)
+    try:
+        yield usages
+    finally:
+        _usage_sink.reset(token)
+
 
 class CommandError(DokkerError):
     """An error raised when a command fails to execute.
@@ -28,12 +130,14 @@ class CommandError(DokkerError):
         returncode: Optional[int] = None,
         stdout: Optional[List[str]] = None,
         stderr: Optional[List[str]] = None,
+        usage: Optional[ResourceUsage] = None,
     ) -> None:
-        """Create a CommandError carrying the failed command's streams."""
+        """Create a CommandError carrying the failed command's streams (and what it cost)."""
         self.command = command
         self.returncode = returncode
         self.stdout: List[str] = stdout if stdout is not None else []
         self.stderr: List[str] = stderr if stderr is not None else []
+        self.usage = usage
         super().__init__(message)
 
 
@@ -61,11 +165,12 @@ def _format_command_error(
 def _kill_process_group(proc: "asyncio.subprocess.Process") -> None:
     """Forcibly kill *proc* and any children it spawned.
 
-    A streamed command such as ``docker compose logs --follow`` runs under a
-    shell wrapper and spawns further children; killing only the shell leaves the
-    real, never-ending process alive (reparented to init). Because the process
-    is started with ``start_new_session=True`` it is the leader of its own
-    process group, so we can take the whole tree down with a single ``killpg``.
+    A streamed command such as ``docker compose logs --follow`` may spawn
+    further children (the compose plugin, or the real process behind a shell
+    wrapper in ``shell`` mode); killing only the direct child leaves the
+    never-ending process alive (reparented to init). Because the process is
+    started with ``start_new_session=True`` it is the leader of its own process
+    group, so we can take the whole tree down with a single ``killpg``.
 
     Falls back to killing just the process on platforms without ``killpg``
     (e.g. Windows); the bounded wait in the caller covers that path.
@@ -86,71 +191,220 @@ def _kill_process_group(proc: "asyncio.subprocess.Process") -> None:
 
 async def _aread_stream(
     stream: asyncio.StreamReader,
-    queue: asyncio.Queue[Union[tuple[str, str], None]],
+    queue: "asyncio.Queue[Batch]",
     name: str,
+    raw: bool = False,
+    errors: str = "strict",
+    sizes: Optional[Dict[str, int]] = None,
 ) -> None:
-    """Asynchronously read a stream and put lines into a queue."""
-    async for line in stream:
-        await queue.put((name, line.decode("utf-8").strip()))
+    """Asynchronously read a stream and put batches of lines into a queue.
+
+    The stream is read in chunks of ``READ_CHUNK_SIZE``; every complete line in
+    a chunk is decoded in one go (with the *errors* handler) and the lines are
+    queued as a single list. With *raw* the lines are queued as bytes, without
+    their line ending, and nothing is decoded or stripped. A trailing partial
+    line is carried over to the next chunk (and flushed at EOF). A failure (e.g.
+    undecodable output) is queued in place of a batch so the consumer raises it
+    instead of waiting for a reader that is gone. The bytes read are counted
+    in *sizes* under *name*, if given.
+    """
+    pending = bytearray()
+    try:
+        while True:
+            chunk = await stream.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            if sizes is not None:
+                sizes[name] += len(chunk)
+            cut = chunk.rfind(b"\n")
+            if cut < 0:
+                # No line ending yet, keep accumulating.
+                pending += chunk
+                continue
+            pending += chunk[:cut]
+            if raw:
+                await queue.put([(name, line) for line in bytes(pending).split(b"\n")])
+            else:
+                await queue.put([(name, line.strip()) for line in pending.decode("utf-8", errors).split("\n")])
+            pending = bytearray(chunk[cut + 1 :])
+
+        if pending:
+            await queue.put([(name, bytes(pending) if raw else pending.decode("utf-8", errors).strip())])
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put(e)
+        return
 
     await queue.put(None)
 
 
-async def astream_command(command: List[str]) -> LogStream:
+def _as_text(lines: Deque[Any]) -> List[str]:
+    """Decode the lines kept for a CommandError, which are bytes in raw mode."""
+    return [line.decode("utf-8", "replace") if isinstance(line, bytes) else line for line in lines]
+
+
+async def _adrain(stream: asyncio.StreamReader) -> None:
+    """Read and discard *stream* until EOF."""
+    while await stream.read(READ_CHUNK_SIZE):
+        pass
+
+
+def _children_usage() -> Optional[Any]:
+    """What all reaped children of this process cost so far, None without ``resource``."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_CHILDREN)
+
+
+# Children usage cannot be split by process, so a command's CPU times are only
+# its own if no other command was reaped while it ran. The commands running
+# now, and a counter of those that ended, tell whether one was.
+_running: Set[Any] = set()
+_ended = 0
+
+
+def _usage_of(command: str, wall_time: float, before: Optional[Any], after: Optional[Any]) -> ResourceUsage:
+    if before is None or after is None:
+        return ResourceUsage(command=command, wall_time=wall_time)
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return ResourceUsage(
+        command=command,
+        wall_time=wall_time,
+        user_time=after.ru_utime - before.ru_utime,
+        system_time=after.ru_stime - before.ru_stime,
+        # The children's peak is a high-water mark: it only tells this
+        # command's peak when the command raised it.
+        max_rss=after.ru_maxrss * scale if after.ru_maxrss > before.ru_maxrss else None,
+    )
+
+
+def _account(proc: "asyncio.subprocess.Process", command: str, started: float, before: Optional[Any], ended: int) -> ResourceUsage:
+    """The usage of the reaped *proc*, spawned at *started* when ``_ended`` was *ended*."""
+    global _ended
+    after = _children_usage()
+    # Another command that ended in between (or was reaped and is about to)
+    # is mixed into the children usage: only the wall time is known then.
+    if _ended != ended or any(other.returncode is not None for other in _running if other is not proc):
+        after = None
+    _ended += 1
+    return _usage_of(command, time.monotonic() - started, before, after)
+
+
+async def _aspawn(str_command: List[str], shell: bool) -> "asyncio.subprocess.Process":
+    """Start *str_command* with both output streams piped.
+
+    By default the argv is executed directly, so no intermediate ``/bin/sh``
+    is forked and arguments containing spaces or shell metacharacters reach
+    the program verbatim. In ``shell`` mode the argv is joined with spaces and
+    handed to the shell instead, which is only useful if you rely on shell
+    syntax (pipes, redirects, globbing) in the command.
+
+    """
+    if shell:
+        return await asyncio.create_subprocess_shell(
+            " ".join(str_command),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # Run in its own session/process group so a follow-stream and any
+            # children it spawns can be torn down as a group on cancellation.
+            start_new_session=True,
+        )
+
+    return await asyncio.create_subprocess_exec(
+        *str_command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+    )
+
+
+@overload
+def astream_command(command: List[str], shell: bool = False, raw: Literal[False] = False, errors: str = "strict") -> LogStream: ...
+
+
+@overload
+def astream_command(command: List[str], shell: bool = False, *, raw: Literal[True], errors: str = "strict") -> RawLogStream: ...
+
+
+@overload
+def astream_command(command: List[str], shell: bool = False, raw: bool = False, errors: str = "strict") -> AsyncIterator[Tuple[str, Any]]: ...
+
+
+async def astream_command(command: List[str], shell: bool = False, raw: bool = False, errors: str = "strict") -> AsyncIterator[Tuple[str, Any]]:
     """Asynchronously stream the output of a command.
 
     Parameters
     ----------
     command : List[str]
         The command to run as a list of strings.
+    shell : bool, optional
+        Run the command through the shell (joined with spaces) instead of
+        executing the argv directly, by default False. Opt in only when the
+        command needs shell syntax; it costs an extra ``/bin/sh`` process per
+        call and breaks on arguments containing spaces.
+    raw : bool, optional
+        Yield every line as undecoded ``bytes`` (without its line ending and
+        unstripped) instead of ``str``, by default False. Use this when output
+        is only forwarded somewhere, or may not be text at all.
+    errors : str, optional
+        The error handler used when decoding lines, by default "strict", which
+        raises on invalid UTF-8. Pass "replace" to substitute invalid bytes
+        instead. Ignored in raw mode.
+
+    Inside a span of a ``Tracer`` (see ``dokker.tracing``) the command is
+    recorded as a ``command`` span with its argv, exit code and output bytes.
     """
-    # Create the subprocess using asyncio's subprocess
-
     # Convert command items to strings
     str_command = [str(c) for c in command]
-    full_cmd = " ".join(str_command)
+    full_cmd = " ".join(str_command) if shell else shlex.join(str_command)
+    span = start_command_span(str_command)
+    started = time.monotonic()
+    before, ended = _children_usage(), _ended
 
     try:
-        proc = await asyncio.create_subprocess_shell(
-            full_cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            # Run in its own session/process group so a follow-stream and any
-            # children it spawns can be torn down as a group on cancellation.
-            start_new_session=True,
-        )
+        proc = await _aspawn(str_command, shell)
     except Exception as e:
-        raise CommandError(f"Failed to start command {command}: {e}")
+        error = CommandError(f"Failed to start command {full_cmd}: {e}", command=full_cmd)
+        if span is not None:
+            span.end(error)
+        raise error
+    _running.add(proc)
 
-    # Use a queue to stream both stdout and stderr sequentially
-    queue: asyncio.Queue[Union[tuple[str, str], None]] = asyncio.Queue()
+    # Both readers feed one bounded queue, so stdout and stderr are yielded
+    # interleaved roughly in the order they were produced.
+    queue: "asyncio.Queue[Batch]" = asyncio.Queue(maxsize=MAX_QUEUED_BATCHES)
 
     if proc.stdout is None or proc.stderr is None:
         raise CommandError(f"Failed to get stdout or stderr from subprocess {command}")
 
+    sizes = {"STDOUT": 0, "STDERR": 0}
     # Create tasks to read from stdout and stderr asynchronously
     readers: list[asyncio.Task[None]] = [
-        asyncio.create_task(_aread_stream(proc.stdout, queue, "STDOUT")),
-        asyncio.create_task(_aread_stream(proc.stderr, queue, "STDERR")),
+        asyncio.create_task(_aread_stream(proc.stdout, queue, "STDOUT", raw, errors, sizes)),
+        asyncio.create_task(_aread_stream(proc.stderr, queue, "STDERR", raw, errors, sizes)),
     ]
+    failure: Optional[BaseException] = None
+    usage: Optional[ResourceUsage] = None
 
     try:
-        stdout_logs: list[str] = []
-        stderr_logs: list[str] = []
+        stdout_logs: Deque[Any] = deque(maxlen=MAX_ERROR_LINES)
+        stderr_logs: Deque[Any] = deque(maxlen=MAX_ERROR_LINES)
 
         # Track the number of readers that are finished
         finished_readers = 0
         while finished_readers < len(readers):
-            line = await queue.get()
-            if line is None:
+            batch = await queue.get()
+            if batch is None:
                 finished_readers += 1  # One reader has finished
                 continue
-            source, text = line
-            if source == "STDERR":
-                stderr_logs.append(text)
-            else:
-                stdout_logs.append(text)
-            yield line
+            if isinstance(batch, BaseException):
+                raise batch
+            # A batch always comes from a single stream.
+            (stderr_logs if batch[0][0] == "STDERR" else stdout_logs).extend(text for _, text in batch)
+            for line in batch:
+                yield line
 
         # Cleanup: cancel any remaining reader tasks
         for reader in readers:
@@ -161,24 +415,32 @@ async def astream_command(command: List[str]) -> LogStream:
                 pass
 
         await proc.wait()
+        usage = _account(proc, full_cmd, started, before, ended)
 
         if proc.returncode != 0:
             # When the command fails, surface the streams separately so callers
             # can tell apart the diagnostic output (stderr) from regular output.
+            stdout, stderr = _as_text(stdout_logs), _as_text(stderr_logs)
             raise CommandError(
-                _format_command_error(full_cmd, proc.returncode, stdout_logs, stderr_logs),
+                _format_command_error(full_cmd, proc.returncode, stdout, stderr),
                 command=full_cmd,
                 returncode=proc.returncode,
-                stdout=stdout_logs,
-                stderr=stderr_logs,
+                stdout=stdout,
+                stderr=stderr,
+                usage=usage,
             )
 
-    except asyncio.CancelledError:
+    except BaseException as e:
+        failure = e
         # A follow-stream (e.g. `docker compose logs --follow`) only ends via
-        # cancellation. Stop the reader tasks first so nothing is left blocked
-        # on the pipes, kill the whole process group (killing only the shell
-        # wrapper leaves the real, never-ending child alive), then reap it under
-        # a bounded wait so teardown can never hang waiting on `proc.wait()`.
+        # cancellation, and a consumer that stops iterating early closes the
+        # generator. Either way (or when a reader failed) nobody drains the
+        # bounded queue any more, so the readers would block forever. Stop the
+        # reader tasks first so nothing is left blocked on the pipes, kill the
+        # whole process group (killing only the direct child leaves e.g. the
+        # compose plugin alive), then reap it under a bounded wait so teardown
+        # can never hang waiting on `proc.wait()`. For a command that already
+        # exited (a CommandError) all of this is a no-op.
         for reader in readers:
             reader.cancel()
         for reader in readers:
@@ -189,11 +451,25 @@ async def astream_command(command: List[str]) -> LogStream:
 
         _kill_process_group(proc)
         try:
-            await asyncio.wait_for(proc.wait(), timeout=KILL_TIMEOUT)
+            # The process only counts as finished once its pipes are closed,
+            # and a pipe nobody reads stays paused, so drain what is left.
+            await asyncio.wait_for(
+                asyncio.gather(_adrain(proc.stdout), _adrain(proc.stderr), proc.wait()),
+                timeout=KILL_TIMEOUT,
+            )
         except asyncio.TimeoutError:
             pass
 
         raise
-
-    except Exception as e:
-        raise e
+    finally:
+        if usage is None and proc.returncode is not None:
+            usage = _account(proc, full_cmd, started, before, ended)
+        _running.discard(proc)
+        sink = _usage_sink.get()
+        if sink is not None and usage is not None:
+            sink.append(usage)
+        if span is not None:
+            span.set(exit_code=proc.returncode, stdout_bytes=sizes["STDOUT"], stderr_bytes=sizes["STDERR"], pid=proc.pid)
+            if usage is not None:
+                span.set(wall_time=usage.wall_time, user_time=usage.user_time, system_time=usage.system_time, max_rss=usage.max_rss)
+            span.end(failure)
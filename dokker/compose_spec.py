@@ -1,11 +1,45 @@
+import json
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr, SerializerFunctionWrapHandler, field_serializer
 from typing_extensions import Annotated
 
 from dokker.errors import LabelNotFoundError, PortNotFoundError, ServiceNotFoundError
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional, the json module is used instead
+    orjson = None  # type: ignore[assignment]
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Decode JSON, with ``orjson`` if it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class _Cache:
+    """A value derived from (and kept as long as) *key*: a private cache of a model.
+
+    Always equal to another cache, so a model compares equal with or without
+    its caches filled.
+    """
+
+    __slots__ = ("key", "value")
+
+    def __init__(self) -> None:
+        """Create an empty cache."""
+        self.key: Any = None
+        self.value: Any = None
+
+    def __eq__(self, other: object) -> bool:
+        """Caches never make models unequal."""
+        return isinstance(other, _Cache)
+
+    __hash__ = None  # type: ignore[assignment]
+
 
 class ServicePlacement(BaseModel):
     """Service placement constraints."""
@@ -102,6 +136,8 @@ class ComposeConfigService(BaseModel):
     ports: Optional[List[ComposeServicePort]] = None
     volumes: Optional[List[ComposeServiceVolume]] = None
 
+    _port_index: _Cache = PrivateAttr(default_factory=_Cache)
+
     def get_label(self, label: str) -> str:
         """Get the label of the service.
 
@@ -131,12 +167,26 @@ class ComposeConfigService(BaseModel):
         if not self.ports:
             raise PortNotFoundError("No ports found in the service. Please check the service configuration.")
 
-        for i in self.ports:
-            if i.target == port:
-                return i
+        mapping = self.port_index.get(port)
+        if mapping is None:
+            raise PortNotFoundError(f"No published port found for internal port {port}. Mapped internal ports: {sorted(self.port_index)}")
+        return mapping
 
-        available = sorted(p.target for p in self.ports if p.target is not None)
-        raise PortNotFoundError(f"No published port found for internal port {port}. Mapped internal ports: {available}")
+    @property
+    def port_index(self) -> Dict[int, "ComposeServicePort"]:
+        """The port mappings of the service by internal (target) port.
+
+        Built on first use and kept until ``ports`` is replaced; the first
+        mapping of a target port wins, as in ``get_port_for_internal``.
+        """
+        cache = self._port_index
+        if cache.value is None or cache.key is not self.ports:
+            index: Dict[int, ComposeServicePort] = {}
+            for mapping in self.ports or ():
+                if mapping.target is not None:
+                    index.setdefault(mapping.target, mapping)
+            cache.key, cache.value = self.ports, index
+        return cache.value
 
 
 class ComposeConfigNetwork(BaseModel):
@@ -163,6 +213,100 @@ class ComposeConfigVolume(BaseModel):
     name: Optional[str] = None
 
 
+class LazyServices(Mapping[str, ComposeConfigService]):
+    """The services of a ``ComposeSpec``, each validated when first looked up.
+
+    Holds the decoded JSON of every service and validates one into a
+    ``ComposeConfigService`` (once, it is kept) when it is looked up, e.g. by
+    ``find_service``. Listing the names, ``len`` and ``in`` validate nothing,
+    so services a caller never looks at cost nothing; a service whose JSON is
+    invalid only raises (a pydantic ``ValidationError``) when looked up.
+    """
+
+    __slots__ = ("_raw", "_validated")
+
+    def __init__(self, raw: Dict[str, Any]) -> None:
+        """Wrap the decoded JSON of the services, keyed by name."""
+        self._raw = raw
+        self._validated: Dict[str, ComposeConfigService] = {}
+
+    def __getitem__(self, name: str) -> ComposeConfigService:
+        """The service called *name*, validated on the first lookup."""
+        service = self._validated.get(name)
+        if service is None:
+            service = ComposeConfigService.model_validate(self._raw[name])
+            self._validated[name] = service
+        return service
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate the service names."""
+        return iter(self._raw)
+
+    def __len__(self) -> int:
+        """The number of services."""
+        return len(self._raw)
+
+    def __contains__(self, name: object) -> bool:
+        """Whether there is a service called *name*."""
+        return name in self._raw
+
+    def raw(self, name: str) -> Dict[str, Any]:
+        """The decoded, unvalidated JSON of the service called *name*."""
+        return self._raw[name]
+
+    @property
+    def validated(self) -> List[str]:
+        """The names of the services validated so far."""
+        return list(self._validated)
+
+    def materialize(self) -> Dict[str, ComposeConfigService]:
+        """Validate every service and return them as a plain dict."""
+        return {name: self[name] for name in self._raw}
+
+    def __repr__(self) -> str:
+        """Representation of the lazy services."""
+        return f"LazyServices({list(self._raw)!r}, validated={self.validated!r})"
+
+
+class ComposeSpecIndex:
+    """Lookup tables over the services of a ``ComposeSpec``.
+
+    Built in one pass by ``ComposeSpec.index``: the services by label (and by
+    label value), by image, and the ``depends_on`` graph in both directions.
+    Services are listed in the order of the spec. Lazy services are indexed
+    from their JSON, without validating them.
+    """
+
+    __slots__ = ("labels", "label_values", "images", "dependencies", "dependents")
+
+    def __init__(self, services: Mapping[str, ComposeConfigService]) -> None:
+        """Index *services*."""
+        self.labels: Dict[str, List[str]] = {}
+        self.label_values: Dict[Tuple[str, str], List[str]] = {}
+        self.images: Dict[str, List[str]] = {}
+        self.dependencies: Dict[str, List[str]] = {}
+        self.dependents: Dict[str, List[str]] = {name: [] for name in services}
+
+        for name in services:
+            labels, image, depends_on = self._fields(services, name)
+            for label, value in labels.items():
+                self.labels.setdefault(label, []).append(name)
+                self.label_values.setdefault((label, value), []).append(name)
+            if image:
+                self.images.setdefault(image, []).append(name)
+            self.dependencies[name] = list(depends_on)
+            for dependency in depends_on:
+                self.dependents.setdefault(dependency, []).append(name)
+
+    @staticmethod
+    def _fields(services: Mapping[str, ComposeConfigService], name: str) -> Tuple[Dict[str, str], Optional[str], Iterable[str]]:
+        if isinstance(services, LazyServices):
+            raw = services.raw(name)
+            return raw.get("labels") or {}, raw.get("image"), raw.get("depends_on") or ()
+        service = services[name]
+        return service.labels or {}, service.image, service.depends_on or ()
+
+
 class ComposeSpec(BaseModel):
     """Docker Compose specification."""
 
@@ -172,6 +316,45 @@ class ComposeSpec(BaseModel):
     configs: Any = None
     secrets: Any = None
 
+    _index: _Cache = PrivateAttr(default_factory=_Cache)
+
+    @classmethod
+    def from_json(cls, data: Union[str, bytes], lazy: bool = True) -> "ComposeSpec":
+        """Parse the JSON ``docker compose config --format json`` prints.
+
+        The JSON is decoded once (with ``orjson`` if it is installed). With
+        *lazy* (the default) the networks and volumes are validated at once
+        but the services one by one as they are looked up (see
+        ``LazyServices``), so inspecting a project of many services costs
+        little more than decoding its JSON.
+
+        Parameters
+        ----------
+        data : Union[str, bytes]
+            The JSON of the config.
+        lazy : bool, optional
+            Validate services on their first lookup, by default True.
+
+        Returns
+        -------
+        ComposeSpec
+            The compose spec.
+        """
+        config = loads(data)
+        if not lazy or not isinstance(config, dict):
+            return cls.model_validate(config)
+        services = config.pop("services", None)
+        spec = cls.model_validate(config)
+        if services is not None:
+            spec.services = LazyServices(services)  # type: ignore[assignment]
+        return spec
+
+    @field_serializer("services", mode="wrap")
+    def _serialize_services(self, services: Any, handler: SerializerFunctionWrapHandler) -> Any:
+        if isinstance(services, LazyServices):
+            services = services.materialize()
+        return handler(services)
+
     def find_service(self, name: Optional[str] = None) -> ComposeConfigService:
         """Find a service by name.
 
@@ -193,4 +376,96 @@ class ComposeSpec(BaseModel):
                 raise ServiceNotFoundError(f"No service found with name {name}. Available services: {sorted(self.services)}")
             return service
 
-        return self.services[list(self.services.keys())[0]]
+        return self.services[next(iter(self.services))]
+
+    @property
+    def index(self) -> ComposeSpecIndex:
+        """The lookup tables over the services, built on first use.
+
+        They are kept until ``services`` is replaced, so do not mutate the
+        services of a spec in place once you queried it.
+        """
+        cache = self._index
+        if cache.value is None or cache.key is not self.services:
+            cache.key, cache.value = self.services, ComposeSpecIndex(self.services or {})
+        return cache.value
+
+    def services_with_label(self, label: str, value: Optional[str] = None) -> List[str]:
+        """The names of the services carrying *label* (set to *value*, if given)."""
+        if value is None:
+            return list(self.index.labels.get(label, ()))
+        return list(self.index.label_values.get((label, value), ()))
+
+    def services_with_image(self, image: str) -> List[str]:
+        """The names of the services running *image*."""
+        return list(self.index.images.get(image, ()))
+
+    def dependencies(self, service: str, recursive: bool = False) -> List[str]:
+        """The services *service* depends on.
+
+        Parameters
+        ----------
+        service : str
+            The name of the service.
+        recursive : bool, optional
+            Include the dependencies of the dependencies, by default False.
+            They are listed dependencies first (a valid startup order).
+
+        Raises
+        ------
+        ServiceNotFoundError
+            If there is no such service.
+        """
+        return self._walk(self.index.dependencies, service, recursive)
+
+    def dependents(self, service: str, recursive: bool = False) -> List[str]:
+        """The services depending on *service* (see ``dependencies``)."""
+        return self._walk(self.index.dependents, service, recursive)
+
+    def _walk(self, graph: Dict[str, List[str]], service: str, recursive: bool) -> List[str]:
+        if service not in (self.services or {}):
+            raise ServiceNotFoundError(f"No service found with name {service}. Available services: {sorted(self.services or {})}")
+        if not recursive:
+            return list(graph.get(service, ()))
+
+        order: List[str] = []
+        seen = {service}
+
+        def visit(name: str) -> None:
+            for neighbour in graph.get(name, ()):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    visit(neighbour)
+                    order.append(neighbour)
+
+        visit(service)
+        return order
+
+    def published_port(self, service: str, internal: int) -> int:
+        """The host port the internal (target) port *internal* of *service* is published on.
+
+        Raises
+        ------
+        ServiceNotFoundError
+            If there is no such service.
+        PortNotFoundError
+            If the port is not mapped, or mapped without a published port.
+        """
+        published = self.find_service(service).get_port_for_internal(internal).published
+        if published is None:
+            raise PortNotFoundError(f"Internal port {internal} of {service} is not published.")
+        return published
+
+    def published_ports(self, services: Optional[Iterable[str]] = None) -> Dict[str, Dict[int, int]]:
+        """The published ports of *services* (all by default), by internal port.
+
+        Services without published ports map to an empty dict. Only the
+        services asked for are validated (see ``LazyServices``).
+
+        Raises
+        ------
+        ServiceNotFoundError
+            If one of the services does not exist.
+        """
+        names = list(self.services or {}) if services is None else services
+        return {name: {target: mapping.published for target, mapping in self.find_service(name).port_index.items() if mapping.published is not None} for name in names}
@@ -0,0 +1,102 @@
+from typing import Any, Dict, Optional
+from pydantic import BaseModel
+
+PROJECT_LABEL = "com.docker.compose.project"
+SERVICE_LABEL = "com.docker.compose.service"
+NUMBER_LABEL = "com.docker.compose.container-number"
+
+
+def _parse_label_string(labels: str) -> Dict[str, str]:
+    """Parse the ``k=v,k=v`` label string emitted by ``docker compose ps``."""
+    parsed: Dict[str, str] = {}
+    for item in labels.split(","):
+        key, sep, value = item.partition("=")
+        if sep:
+            parsed[key] = value
+    return parsed
+
+
+class ComposeContainer(BaseModel):
+    """The runtime state of a single container of a compose project.
+
+    This is the common shape returned by ``CLI.ainspect_containers``, whether
+    the state was read through ``docker compose ps`` or directly from the
+    docker engine API.
+    """
+
+    id: str
+    name: str
+    service: str
+    project: Optional[str] = None
+    number: Optional[int] = None
+    state: str
+    health: Optional[str] = None
+    exit_code: Optional[int] = None
+    tty: bool = False
+
+    @property
+    def log_prefix(self) -> str:
+        """The name compose uses to prefix this container's log lines."""
+        if self.number is None:
+            return self.service
+        return f"{self.service}-{self.number}"
+
+    @property
+    def status(self) -> str:
+        """The state, with the health status if the container has a healthcheck."""
+        return f"{self.state} ({self.health})" if self.health else self.state
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether the container is up (and healthy, if it has a healthcheck).
+
+        A container that ran to completion with exit code 0 (e.g. a migration)
+        counts as ready too, like ``docker compose up --wait`` treats it.
+        """
+        if self.state == "running":
+            return self.health in (None, "healthy")
+        return self.state == "exited" and self.exit_code == 0
+
+    @property
+    def has_failed(self) -> bool:
+        """Whether the container can no longer become ready on its own."""
+        if self.state == "running":
+            return self.health == "unhealthy"
+        return self.state == "dead" or (self.state == "exited" and self.exit_code != 0)
+
+    @classmethod
+    def from_ps(cls, data: Dict[str, Any]) -> "ComposeContainer":
+        """Build a container from one entry of ``docker compose ps --format json``."""
+        labels = data.get("Labels") or ""
+        parsed = _parse_label_string(labels) if isinstance(labels, str) else dict(labels)
+        number = parsed.get(NUMBER_LABEL)
+        return cls(
+            id=data["ID"],
+            name=data["Name"],
+            service=data["Service"],
+            project=data.get("Project"),
+            number=int(number) if number else None,
+            state=data.get("State", ""),
+            health=data.get("Health") or None,
+            exit_code=data.get("ExitCode"),
+        )
+
+    @classmethod
+    def from_inspect(cls, data: Dict[str, Any]) -> "ComposeContainer":
+        """Build a container from the engine's ``GET /containers/{id}/json``."""
+        config = data.get("Config") or {}
+        labels = config.get("Labels") or {}
+        state = data.get("State") or {}
+        health = state.get("Health") or {}
+        number = labels.get(NUMBER_LABEL)
+        return cls(
+            id=data["Id"],
+            name=data.get("Name", "").lstrip("/"),
+            service=labels.get(SERVICE_LABEL, ""),
+            project=labels.get(PROJECT_LABEL),
+            number=int(number) if number else None,
+            state=state.get("Status", ""),
+            health=health.get("Status") or None,
+            exit_code=state.get("ExitCode"),
+            tty=bool(config.get("Tty", False)),
+        )
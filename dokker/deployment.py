@@ -2,26 +2,35 @@ from types import TracebackType
 import aiohttp.client_exceptions
 import aiohttp.http_exceptions
 from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
-from typing import Awaitable, Dict, Literal, Optional, List, Protocol, Self, Type, runtime_checkable
+from typing import Any, Awaitable, ContextManager, Dict, FrozenSet, Iterable, Iterator, Literal, Optional, List, Protocol, Self, Type, TypeVar, cast, runtime_checkable
 from koil.composition import KoiledModel
+from contextlib import contextmanager, nullcontext
 from dataclasses import dataclass
 import asyncio
+import functools
+import itertools
+import time
+import random
 from pathlib import Path
 from dokker.compose_spec import ComposeSpec
 from dokker.project import Project
 from typing import Union
 from koil import unkoil
-from dokker.cli import CLI
+from dokker.cli import CLI, CLIBackend
+from dokker.containers import ComposeContainer
 from dokker.loggers.void import VoidLogger
-from dokker.types import LogFunction
+from dokker.spec_cache import SpecCache
+from dokker.tracing import Span, Tracer, current_span
+from dokker.types import LogFunction, RawLogFunction
+from .log_hub import DEFAULT_HISTORY, LogHub
 from .log_watcher import LogRoll, LogWatcher
 import aiohttp
 import certifi
 from ssl import SSLContext
 import ssl
 from typing import Callable
-from dokker.errors import NotInitializedError, NotInspectedError, HealthCheckError, TearDownError
-from dokker.command import CommandError
+from dokker.errors import NotInitializedError, NotInspectedError, NotReadyError, HealthCheckError, TearDownError
+from dokker.command import CommandError, ResourceUsage, collect_usage
 import logging
 
 
@@ -72,20 +81,64 @@ TEARDOWN_POLICIES: Dict[str, TeardownPolicy] = {
 }
 
 
+@dataclass(frozen=True)
+class _CleanupStep:
+    """One registered on-exit teardown (see ``Deployment._register_cleanup``)."""
+
+    factory: Callable[[], Awaitable[None]]
+    name: str
+    key: Optional[str] = None
+    after: Optional[FrozenSet[str]] = None
+    group: Optional[str] = None
+
+
+_Phase = TypeVar("_Phase", bound=Callable[..., Awaitable[Any]])
+
+
+def _traced(name: str) -> Callable[[_Phase], _Phase]:
+    """Record every call of a deployment phase as a span of the deployment's ``tracer``."""
+
+    def decorator(method: _Phase) -> _Phase:
+        @functools.wraps(method)
+        async def wrapper(self: "Deployment", *args: Any, **kwargs: Any) -> Any:
+            with self._span(name):
+                return await method(self, *args, **kwargs)
+
+        return cast(_Phase, wrapper)
+
+    return decorator
+
+
+class _DependencyFailed(Exception):
+    """A cleanup was skipped because a step it depends on failed."""
+
+
 class HealthCheck(BaseModel):
     """A health check for a service.
 
     This class is used to check the health of a service by making a request to a given URL.
     The URL can be a string or a callable that takes the compose spec as an argument and returns a string.
-    The health check will be retried a given number of times with a given timeout between retries.
-    If the health check fails, an error will be raised.
+    If the health check keeps failing, an error will be raised.
+
+    Failed attempts are retried on a schedule: the first retry comes after
+    ``initial_interval`` seconds, and every further interval grows by
+    ``backoff_factor`` up to ``timeout``, each shortened by a random ``jitter``
+    so checks started together do not poll in lockstep. Retries stop once the
+    ``deadline`` has passed (by default the ``max_retries * timeout`` the fixed
+    schedule took at most). Set ``initial_interval`` to None (and leave
+    ``deadline`` unset) for the fixed schedule: ``max_retries`` retries with
+    ``timeout`` seconds between them.
     """
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
     url: Union[str, Callable[[ComposeSpec], str]] = Field(description="The url to check. Can be a string or a callable that takes the compose spec as an argument and returns a string.")
     service: str = Field(description="The service to check.")
-    max_retries: int = Field(default=3, description="The maximum number of retries before failing.")
-    timeout: int = Field(default=10, description="The timeout between retries.")
+    max_retries: int = Field(default=3, description="The maximum number of retries before failing (fixed schedule), or the number of `timeout`s the default deadline spans.")
+    timeout: int = Field(default=10, description="The timeout between retries, and the longest interval the backoff grows to.")
+    initial_interval: Optional[float] = Field(default=0.25, description="Seconds before the first retry, growing by `backoff_factor` after that. None for the fixed schedule.")
+    backoff_factor: float = Field(default=2.0, description="The factor the retry interval grows by after every failed attempt.")
+    jitter: float = Field(default=0.1, description="The fraction (0 to 1) of every retry interval that is randomly cut off.")
+    deadline: Optional[float] = Field(default=None, description="Stop retrying after this many seconds since the first attempt. Defaults to `max_retries * timeout` when backing off.")
     error_with_logs: bool = Field(
         default=True,
         description="Should we error with the logs of the service (will inspect container logs of the service).",
@@ -94,16 +147,50 @@ class HealthCheck(BaseModel):
         default_factory=lambda: {"Content-Type": "application/json"},
         description="Headers to use for the request",
     )
-    ssl_context: SSLContext = Field(
-        default_factory=lambda: ssl.create_default_context(cafile=certifi.where()),
-        description="SSL Context to use for the request",
+    ssl_context: Optional[SSLContext] = Field(
+        default=None,
+        description="SSL Context to use for the request. Defaults to a shared context trusting `ca_file`.",
+    )
+    ca_file: Optional[str] = Field(
+        default=None,
+        description="The CA bundle to verify TLS against when no `ssl_context` is given. Defaults to the certifi bundle. Contexts are built once per path and shared.",
     )
     valid_statuses: list[int] = Field(
         default_factory=lambda: [200],
         description="The valid statuses for the health check. Defaults to 200.",
     )
 
-    async def acheck(self, spec: ComposeSpec) -> str:
+    @property
+    def budget(self) -> Optional[float]:
+        """The overall retry deadline in seconds, None for a fixed retry count."""
+        if self.deadline is not None:
+            return self.deadline
+        if self.initial_interval is None:
+            return None
+        return float(self.max_retries * self.timeout)
+
+    def schedule(self) -> Iterator[float]:
+        """The intervals to sleep between attempts, in order.
+
+        Finite (``max_retries`` times ``timeout``) for the fixed schedule;
+        otherwise endless, and the caller stops at the ``budget``.
+        """
+        if self.budget is None:
+            yield from itertools.repeat(float(self.timeout), self.max_retries)
+            return
+
+        interval = self.initial_interval if self.initial_interval is not None else float(self.timeout)
+        while True:
+            yield interval * (1 - self.jitter * random.random())
+            interval = min(interval * self.backoff_factor, float(self.timeout))
+
+    def resolve_ssl_context(self) -> SSLContext:
+        """The SSL context requests of this check are verified with."""
+        if self.ssl_context is not None:
+            return self.ssl_context
+        return _ssl_context_for(self.ca_file or certifi.where())
+
+    async def acheck(self, spec: ComposeSpec, session: Optional[aiohttp.ClientSession] = None) -> str:
         """Check the health of the service.
 
         This method will make a request to the given URL and check the response status.
@@ -112,23 +199,73 @@ class HealthCheck(BaseModel):
         ----------
         spec : ComposeSpec
             The compose spec to use for the health check.
+        session : Optional[aiohttp.ClientSession]
+            The session to make the request with, e.g. the pooled session of a
+            ``HealthCheckRunner``. Without one a session is created (and closed)
+            just for this request.
         """
-        async with aiohttp.ClientSession(
-            headers=self.headers,
-            connector=aiohttp.TCPConnector(ssl=self.ssl_context),
-        ) as session:
-            # get json from endpoint
-            url = self.url if isinstance(self.url, str) else self.url(spec)
+        if session is None:
+            async with aiohttp.ClientSession() as own_session:
+                return await self.acheck(spec, session=own_session)
 
-            try:
-                async with session.get(url) as resp:
-                    if resp.status not in self.valid_statuses:
-                        raise HealthCheckError(f"Status is not in valid statuses. Got {resp.status}, wants on of {self.valid_statuses} ")
-                    return await resp.text()
-            except aiohttp.http_exceptions.BadHttpMessage as e:
-                raise HealthCheckError("Health test Failed") from e
-            except aiohttp.client_exceptions.ClientError as e:
-                raise HealthCheckError("Health test failed") from e
+        # get json from endpoint
+        url = self.url if isinstance(self.url, str) else self.url(spec)
+
+        try:
+            async with session.get(url, headers=self.headers, ssl=self.resolve_ssl_context()) as resp:
+                if resp.status not in self.valid_statuses:
+                    raise HealthCheckError(f"Status is not in valid statuses. Got {resp.status}, wants on of {self.valid_statuses} ")
+                return await resp.text()
+        except aiohttp.http_exceptions.BadHttpMessage as e:
+            raise HealthCheckError("Health test Failed") from e
+        except aiohttp.client_exceptions.ClientError as e:
+            raise HealthCheckError("Health test failed") from e
+
+
+@functools.lru_cache(maxsize=None)
+def _ssl_context_for(cafile: str) -> SSLContext:
+    """Build the SSL context for a CA bundle once, parsing a bundle is slow."""
+    return ssl.create_default_context(cafile=cafile)
+
+
+class HealthCheckRunner(BaseModel):
+    """Runs health checks over one pooled, keep-alive HTTP session.
+
+    Creating a session per attempt means a new connection (and, for https, a
+    TLS handshake) on every retry of every check. The runner keeps a single
+    ``aiohttp`` session whose connector pools and reuses connections, and
+    bounds how many requests are in flight at once across all checks. A
+    ``Deployment`` owns one and closes it when its context exits.
+    """
+
+    max_concurrency: int = Field(default=10, description="The maximum number of health check requests in flight at once.")
+    pool_size: int = Field(default=100, description="The maximum number of pooled connections (0 for no limit).")
+    keepalive_timeout: float = Field(default=30.0, description="How long an idle pooled connection is kept open, in seconds.")
+
+    _session: Optional[aiohttp.ClientSession] = PrivateAttr(default=None)
+    _semaphore: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+
+    async def asession(self) -> aiohttp.ClientSession:
+        """Return the pooled session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout),
+            )
+        return self._session
+
+    async def acheck(self, check: HealthCheck, spec: ComposeSpec) -> str:
+        """Run a single attempt of *check*, waiting for a free slot first."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await check.acheck(spec, session=await self.asession())
+
+    async def aclose(self) -> None:
+        """Close the pooled session and its connections."""
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+        self._semaphore = None
 
 
 @runtime_checkable
@@ -156,6 +293,18 @@ class Logger(Protocol):
         ...
 
 
+@runtime_checkable
+class UsageLogger(Protocol):
+    """A logger that also receives the resource usage of the deployment's operations.
+
+    This is optional: a ``Logger`` that also defines ``on_usage`` gets it.
+    """
+
+    def on_usage(self, operation: str, usage: ResourceUsage) -> None:
+        """When an operation's compose process(es) finished, this method is called with their cost."""
+        ...
+
+
 class Deployment(KoiledModel):
     """A deployment is a set of services that are deployed together."""
 
@@ -197,9 +346,17 @@ class Deployment(KoiledModel):
             "containers stop faster. None (the default) disables this guard."
         ),
     )
+    max_log_lines: Optional[int] = Field(
+        default=None,
+        description="Cap the number of lines kept in the `LogRoll`s returned by commands and collected by watchers. Older lines are evicted (and counted in `LogRoll.dropped`) once the cap is reached. None (the default) keeps every line.",
+    )
+    max_log_bytes: Optional[int] = Field(
+        default=None,
+        description="Cap the total text size in bytes kept in the `LogRoll`s returned by commands and collected by watchers, evicting the oldest lines first. None (the default) keeps every line.",
+    )
     threadpool_workers: int = Field(
         default=10,
-        description="The number of workers to use for the threadpool. This is used for the health checks and the log watcher.",
+        description="The number of workers to use for the threadpool. This is used for the health checks (as the maximum number of concurrent health check requests), by an `Orchestrator` (as the maximum number of concurrent compose invocations) and the log watcher.",
     )
 
     pull_logs: Optional[List[str]] = Field(
@@ -221,14 +378,36 @@ class Deployment(KoiledModel):
     )
 
     logger: Logger = Field(default_factory=VoidLogger)
+    spec_cache: Optional[SpecCache] = Field(
+        default=None,
+        description="An optional content-addressed cache for the compose spec. When set, `inspect()` only runs `docker compose config` if the compose files, env file, profiles or project name changed since the last inspect. Share one instance between deployments to share its entries.",
+    )
+    backend: Optional[CLIBackend] = Field(
+        default=None,
+        description="An optional backend (e.g. `DockerEngineBackend`) that serves logs, stop, restart, container inspection and exec without spawning `docker compose`. It is attached to the CLI on initialize and closed on context-manager exit.",
+    )
+
+    tracer: Optional[Tracer] = Field(
+        default=None,
+        description="An optional `Tracer` recording a timing span for every lifecycle phase (initialize, inspect, pull, up, health checks, down, stop, each teardown step) and every compose subprocess they run. See `timeline` and `dokker.tracing`.",
+    )
 
     _spec: Optional[ComposeSpec] = None
     _cli: Optional[CLI] = None
-    _cleanup_stack: List[Callable[[], Awaitable[None]]] = PrivateAttr(default_factory=list)
+    _cleanup_stack: List[_CleanupStep] = PrivateAttr(default_factory=list)
     _registered_keys: set[str] = PrivateAttr(default_factory=set)
+    _teardown_durations: Dict[str, float] = PrivateAttr(default_factory=dict)
     _entered: bool = PrivateAttr(default=False)
+    _health_runner: Optional[HealthCheckRunner] = PrivateAttr(default=None)
+    _log_hub: Optional[LogHub] = PrivateAttr(default=None)
 
-    def _register_cleanup(self, coro_factory: Callable[[], Awaitable[None]], key: Optional[str] = None) -> None:
+    def _register_cleanup(
+        self,
+        coro_factory: Callable[[], Awaitable[None]],
+        key: Optional[str] = None,
+        after: Optional[Iterable[str]] = None,
+        group: Optional[str] = None,
+    ) -> None:
         """Register an on-exit teardown.
 
         ``coro_factory`` is a zero-argument callable returning a coroutine. It is
@@ -240,12 +419,99 @@ class Deployment(KoiledModel):
         ``key`` deduplicates: a teardown registered with a key already seen on this
         deployment is skipped, so calling e.g. ``up(down_on_exit=True)`` twice still
         downs only once. The first registration keeps its position in the stack.
+
+        Two options relax the LIFO order so independent steps overlap:
+
+        - ``after`` takes the step out of the LIFO chain. It then waits only for
+          the steps registered under the given keys (registered before or after
+          it; keys never registered are ignored) and runs concurrently with
+          everything else.
+        - ``group`` lets consecutive steps of the same group run concurrently
+          with each other; towards the other steps they keep their LIFO place.
         """
         if key is not None:
             if key in self._registered_keys:
                 return
             self._registered_keys.add(key)
-        self._cleanup_stack.append(coro_factory)
+        name = key or getattr(coro_factory, "__qualname__", None) or repr(coro_factory)
+        self._cleanup_stack.append(
+            _CleanupStep(
+                factory=coro_factory,
+                name=name,
+                key=key,
+                after=frozenset(after) if after is not None else None,
+                group=group,
+            )
+        )
+
+    def _discard_cleanup(self, *keys: str) -> None:
+        """Drop the on-exit teardowns registered under *keys*, e.g. once they were run by hand."""
+        self._cleanup_stack = [step for step in self._cleanup_stack if step.key not in keys]
+        self._registered_keys.difference_update(keys)
+
+    @property
+    def teardown_durations(self) -> Dict[str, float]:
+        """The seconds every step of the last teardown took, by key (or function name).
+
+        Steps that did not finish (they failed, timed out or were skipped after
+        a step they depend on failed) are missing.
+        """
+        return dict(self._teardown_durations)
+
+    @property
+    def timeline(self) -> List[Span]:
+        """The finished spans of the ``tracer`` ordered by their start (empty without one)."""
+        return self.tracer.timeline() if self.tracer is not None else []
+
+    def _span(self, name: str, **attributes: Any) -> ContextManager[Optional[Span]]:
+        """Time a block as a span of the ``tracer``, if the deployment has one."""
+        if self.tracer is None:
+            return nullcontext()
+        return self.tracer.span(name, **attributes)
+
+    def _annotate(self, **attributes: Any) -> None:
+        """Set attributes of the current span, if it is one of the ``tracer``'s."""
+        span = current_span()
+        if self.tracer is not None and span is not None and span.tracer is self.tracer:
+            span.set(**attributes)
+
+    @property
+    def log_hub(self) -> LogHub:
+        """The hub the watchers of this deployment share their follow streams through."""
+        if self._log_hub is None:
+            self._log_hub = LogHub(self, history=self.max_log_lines if self.max_log_lines is not None else DEFAULT_HISTORY)
+            if self._entered:
+                # Stopping the follow streams waits for nothing, so it overlaps
+                # the down/stop of the containers.
+                self._register_cleanup(self._aclose_log_hub, key="log_hub", after=())
+        return self._log_hub
+
+    async def _aclose_log_hub(self) -> None:
+        hub, self._log_hub = self._log_hub, None
+        if hub is not None:
+            await hub.aclose()
+
+    @property
+    def health_check_runner(self) -> HealthCheckRunner:
+        """The runner (and pooled HTTP session) the health checks are run with."""
+        if self._health_runner is None:
+            self._health_runner = HealthCheckRunner(max_concurrency=self.threadpool_workers)
+        return self._health_runner
+
+    def _new_log_roll(self) -> LogRoll:
+        """Create a LogRoll honouring the deployment's log caps."""
+        return LogRoll(max_lines=self.max_log_lines, max_bytes=self.max_log_bytes)
+
+    @contextmanager
+    def _accounting(self, operation: str, logs: LogRoll) -> Iterator[None]:
+        """Attach the resource usage of the commands run in the block to *logs*, and report it to the logger."""
+        with collect_usage() as usages:
+            try:
+                yield
+            finally:
+                logs.usage = ResourceUsage.combine(usages)
+                if logs.usage is not None and isinstance(self.logger, UsageLogger):
+                    self.logger.on_usage(operation, logs.usage)
 
     @property
     def spec(self) -> ComposeSpec:
@@ -271,6 +537,7 @@ class Deployment(KoiledModel):
             raise NotInspectedError("Deployment not inspected. Call await deployment.ainspect() first.")
         return self._spec
 
+    @_traced("initialize")
     async def ainitialize(self) -> "CLI":
         """Initialize the deployment.
 
@@ -284,13 +551,17 @@ class Deployment(KoiledModel):
            The CLI object.
         """
         self._cli = await self.project.ainititialize()
+        if self.backend is not None and self._cli.backend is None:
+            self._cli.backend = self.backend
         # If we are inside a context manager and the policy tears the project
         # down, make sure whatever the project created at initialize time (e.g. a
         # CopyPathProject temp-dir copy) is removed on exit. ``atear_down`` is a
         # no-op for projects that create nothing (LocalProject/DokkerProject).
         if self._entered and TEARDOWN_POLICIES[self.policy].tear_down_project:
             cli = self._cli
-            self._register_cleanup(lambda: self.project.atear_down(cli), key="project_teardown")
+            # Runs once compose is done with the project (``down`` reads its
+            # files), but does not wait for unrelated steps.
+            self._register_cleanup(lambda: self.project.atear_down(cli), key="project_teardown", after=("down", "stop"))
         return self._cli
 
     async def aretrieve_cli(self) -> "CLI":
@@ -303,6 +574,7 @@ class Deployment(KoiledModel):
 
         return self._cli
 
+    @_traced("run")
     async def arun(
         self,
         service: str,
@@ -342,13 +614,15 @@ class Deployment(KoiledModel):
             If ``raise_on_error`` is True and the command exits with a code
             different from ``expected_exit_code``.
         """
+        self._annotate(service=service)
         cli = await self.aretrieve_cli()
-        logs = LogRoll()
+        logs = self._new_log_roll()
         error: Optional[CommandError] = None
         try:
-            async for log in cli.astream_run(service=service, command=command):
-                logs.append(log)
-                self.logger.on_logs(log)
+            with self._accounting("run", logs):
+                async for log in cli.astream_run(service=service, command=command):
+                    logs.append(log)
+                    self.logger.on_logs(log)
         except CommandError as e:
             # A failure that is not about the exit code (e.g. the subprocess
             # could not be spawned) carries no return code and must always raise.
@@ -372,6 +646,7 @@ class Deployment(KoiledModel):
                 returncode=returncode,
                 stdout=logs.stdout_list,
                 stderr=logs.stderr_list,
+                usage=logs.usage,
             )
 
         return logs
@@ -423,6 +698,7 @@ class Deployment(KoiledModel):
             expected_exit_code=expected_exit_code,
         )
 
+    @_traced("inspect")
     async def ainspect(self) -> ComposeSpec:
         """Inspect the deployment.
 
@@ -440,7 +716,10 @@ class Deployment(KoiledModel):
             If the deployment has not been initialized.
         """
         cli = await self.aretrieve_cli()
-        self._spec = await cli.ainspect_config()
+        if self.spec_cache is not None:
+            self._spec = await self.spec_cache.ainspect(cli)
+        else:
+            self._spec = await cli.ainspect_config()
         return self._spec
 
     def inspect(self) -> ComposeSpec:
@@ -468,6 +747,8 @@ class Deployment(KoiledModel):
         max_retries: int = 3,
         timeout: int = 10,
         error_with_logs: bool = True,
+        initial_interval: Optional[float] = 0.25,
+        deadline: Optional[float] = None,
     ) -> "HealthCheck":
         """Add a health check to the deployment.
 
@@ -480,9 +761,15 @@ class Deployment(KoiledModel):
         max_retries : int, optional
             The maximum retries before the healtch checks fails, by default 3
         timeout : int, optional
-            The timeout between retries, by default 10
+            The longest interval between retries, by default 10
         error_with_logs : bool, optional
             Should we error with the logs of the service (will inspect container logs of the service), by default True
+        initial_interval : Optional[float], optional
+            Seconds before the first retry, backing off up to ``timeout`` after
+            that, by default 0.25. None retries every ``timeout`` seconds.
+        deadline : Optional[float], optional
+            Stop retrying after this many seconds, by default
+            ``max_retries * timeout``.
 
         Returns
         -------
@@ -496,46 +783,74 @@ class Deployment(KoiledModel):
             max_retries=max_retries,
             timeout=timeout,
             error_with_logs=error_with_logs,
+            initial_interval=initial_interval,
+            deadline=deadline,
         )
 
         self.health_checks.append(check)
         return check
 
+    @_traced("health_check")
     async def arun_check(self, check: HealthCheck, retry: int = 0) -> None:
         """Run a health check.
 
-        This method will make a request to the given URL and check the response status.
-        If the status is not in the valid statuses, an error will be raised.
+        This method will make a request to the given URL and check the response status,
+        retrying on the check's schedule (see ``HealthCheck``) until it passes.
+        If it still fails when the schedule is exhausted, an error will be raised.
         Parameters
         ----------
         check : HealthCheck
             The health check to run.
         retry : int
-            The number of retries already done.
+            The number of retries already done (skips that many intervals of
+            the schedule).
         """
 
+        self._annotate(service=check.service)
         if not self._spec:
             self._spec = await self.ainspect()
 
         if not self._cli:
             self._cli = await self.ainitialize()
 
-        try:
-            await check.acheck(self._spec)
-        except HealthCheckError as e:
-            if retry < check.max_retries:
-                await asyncio.sleep(check.timeout)
-                await self.arun_check(check, retry=retry + 1)
-            else:
-                if not check.error_with_logs:
-                    raise HealthCheckError(f"Health check failed after {check.max_retries} retries. Logs are disabled.") from e
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        budget = check.budget
+        intervals = itertools.islice(check.schedule(), retry, None)
+        attempts = 0
 
-                logs = LogRoll()
-
-                async for log in self._cli.astream_docker_logs(services=[check.service]):
-                    logs.append(log)
+        while True:
+            attempts += 1
+            self._annotate(attempts=attempts)
+            try:
+                await self.health_check_runner.acheck(check, self._spec)
+                return
+            except HealthCheckError as e:
+                error = e
+
+            interval = next(intervals, None)
+            if budget is not None:
+                remaining = started + budget - loop.time()
+                if remaining <= 0:
+                    break
+                # The last interval is cut short so the final attempt lands
+                # on the deadline rather than after it.
+                interval = min(interval, remaining) if interval is not None else None
+            if interval is None:
+                break
+            await asyncio.sleep(interval)
+
+        elapsed = loop.time() - started
+        failure = f"Health check failed after {attempts} attempts in {elapsed:.1f}s."
+        if not check.error_with_logs:
+            raise HealthCheckError(f"{failure} Logs are disabled.") from error
+
+        logs = self._new_log_roll()
+
+        async for log in self._cli.astream_docker_logs(services=[check.service]):
+            logs.append(log)
 
-                raise HealthCheckError(f"Health check failed after {check.max_retries} retries. Logs:\n" + "\n".join(i for _, i in logs)) from e
+        raise HealthCheckError(f"{failure} Logs:\n" + "\n".join(i for _, i in logs)) from error
 
     async def acheck_health(self, timeout: int = 3, retry: int = 0, services: Optional[List[str]] = None) -> None:
         """Check the health of the deployment.
@@ -584,10 +899,18 @@ class Deployment(KoiledModel):
         wait_for_first_log: bool = True,
         wait_for_logs: bool = False,
         wait_for_logs_timeout: int = 10,
-        log_function: Optional[LogFunction] = None,
+        log_function: Optional[Union[LogFunction, RawLogFunction]] = None,
         append_to_traceback: bool = True,
         capture_stdout: bool = True,
         rich_traceback: bool = True,
+        max_lines: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        raw: bool = False,
+        errors: str = "strict",
+        share: bool = True,
+        structured: bool = False,
+        archive: bool = False,
+        archive_dir: Optional[str] = None,
     ) -> LogWatcher:
         """Get a logswatcher for a service.
 
@@ -620,6 +943,35 @@ class Deployment(KoiledModel):
         ----------
         service_name : Union[List[str], str]
             The name of the service(s) to watch the logs for.
+        max_lines : Optional[int]
+            Keep at most this many lines in ``collected_logs``, evicting the
+            oldest first. Defaults to the deployment's ``max_log_lines``.
+        max_bytes : Optional[int]
+            Keep at most this many bytes of log text in ``collected_logs``.
+            Defaults to the deployment's ``max_log_bytes``.
+        raw : bool
+            Pass lines to ``log_function`` as undecoded bytes, e.g. to forward
+            them to a file or socket. ``collected_logs`` stores the bytes as
+            they are and only decodes them (leniently) when read.
+        errors : str
+            How to decode invalid UTF-8 when not ``raw``: "strict" (the
+            default) raises, "replace" substitutes the invalid bytes.
+        share : bool
+            Follow the logs through the deployment's ``log_hub``, sharing one
+            ``docker compose logs --follow`` process with every other watcher
+            of the same stream options, instead of spawning one of its own.
+        structured : bool
+            Parse every line once into a ``LogRecord`` (service, replica,
+            stream, timestamp, message). ``log_function`` then gets the
+            records, and ``watcher.select(...)`` filters them by service,
+            stream or time window.
+        archive : bool
+            Also append every line to a compressed, indexed ``LogArchive``
+            on disk (``watcher.log_archive``), e.g. together with a small
+            ``max_lines`` for long runs.
+        archive_dir : Optional[str]
+            Where to archive; by default a new directory per run under
+            ``.dokker/<project>/logs``.
 
         Returns
         -------
@@ -646,6 +998,14 @@ class Deployment(KoiledModel):
             append_to_traceback=append_to_traceback,
             capture_stdout=capture_stdout,
             rich_traceback=rich_traceback,
+            max_lines=max_lines if max_lines is not None else self.max_log_lines,
+            max_bytes=max_bytes if max_bytes is not None else self.max_log_bytes,
+            raw=raw,
+            errors=errors,
+            hub=self.log_hub if share else None,
+            structured=structured,
+            archive=archive,
+            archive_dir=archive_dir,
         )
 
     def _resolve_exit_action(
@@ -669,11 +1029,16 @@ class Deployment(KoiledModel):
             return "stop"
         return None
 
+    @_traced("up")
     async def aup(
         self,
         detach: bool = True,
         down_on_exit: Optional[bool] = None,
         stop_on_exit: Optional[bool] = None,
+        wait: bool = False,
+        wait_timeout: float = 60,
+        service_timeouts: Optional[Dict[str, float]] = None,
+        compose_wait: bool = False,
     ) -> LogRoll:
         """Up the deployment.
 
@@ -693,6 +1058,18 @@ class Deployment(KoiledModel):
             Local override: ``True`` registers a ``stop`` (containers stopped but
             not removed) on exit. ``None`` (the default) follows the ``policy``.
             Mutually exclusive with ``down_on_exit`` (down already stops them).
+        wait : bool, optional
+            Readiness mode: after the up, poll the containers' state until every
+            service reports running (and healthy, if it defines a compose
+            ``healthcheck``), by default False. See ``await_until_ready``.
+        wait_timeout : float, optional
+            How long each service may take to become ready in readiness mode,
+            in seconds, by default 60.
+        service_timeouts : Optional[Dict[str, float]], optional
+            Per-service overrides of ``wait_timeout``.
+        compose_wait : bool, optional
+            Pass ``--wait`` to ``docker compose up`` so compose itself blocks
+            until the services are running/healthy, by default False.
 
         Returns
         -------
@@ -703,23 +1080,122 @@ class Deployment(KoiledModel):
 
         cli = await self.aretrieve_cli()
         await self.project.abefore_up()
-        logs = LogRoll()
-        async for log in cli.astream_up(detach=detach):
-            logs.append(log)
-            self.logger.on_up(log)
+        logs = self._new_log_roll()
+        with self._accounting("up", logs):
+            async for log in cli.astream_up(detach=detach, wait=compose_wait):
+                logs.append(log)
+                self.logger.on_up(log)
 
         if action == "down":
             self._register_cleanup(self.adown, key="down")
         elif action == "stop":
             self._register_cleanup(self.astop, key="stop")
 
+        if wait:
+            await self.await_until_ready(timeout=wait_timeout, service_timeouts=service_timeouts)
+
         return logs
 
+    async def await_until_ready(
+        self,
+        services: Union[List[str], str, None] = None,
+        timeout: float = 60,
+        service_timeouts: Optional[Dict[str, float]] = None,
+        poll_interval: float = 0.5,
+    ) -> List[ComposeContainer]:
+        """Wait until the containers of the services report ready.
+
+        Polls the container state (through ``docker compose ps``, or the
+        deployment's ``backend``) and returns as soon as every container of
+        every service is running and, if the service defines a compose
+        ``healthcheck``, healthy. Containers that ran to completion with exit
+        code 0 count as ready. Every change of a container's state is passed to
+        the logger's ``on_up``.
+
+        Parameters
+        ----------
+        services : Union[List[str], str, None], optional
+            The services to wait for, by default every service with a container
+            (at least one container has to appear).
+        timeout : float, optional
+            How long each service may take to become ready, in seconds, by
+            default 60.
+        service_timeouts : Optional[Dict[str, float]], optional
+            Per-service overrides of ``timeout``.
+        poll_interval : float, optional
+            Seconds between two polls, by default 0.5.
+
+        Returns
+        -------
+        List[ComposeContainer]
+            The containers of the services, all ready.
+
+        Raises
+        ------
+        NotReadyError
+            If a service is not ready within its timeout, or one of its
+            containers failed (non-zero exit, dead or unhealthy).
+        """
+        if isinstance(services, str):
+            services = [services]
+        service_timeouts = service_timeouts or {}
+
+        cli = await self.aretrieve_cli()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        seen: Dict[str, str] = {}
+
+        while True:
+            containers = await cli.ainspect_containers(services)
+            by_service: Dict[str, List[ComposeContainer]] = {service: [] for service in services or []}
+            for container in containers:
+                by_service.setdefault(container.service, []).append(container)
+                if seen.get(container.name) != container.status:
+                    seen[container.name] = container.status
+                    self.logger.on_up(("STDOUT", f"{container.name}: {container.status}"))
+
+            failed = [c for c in containers if c.has_failed]
+            if failed:
+                raise NotReadyError("Containers failed while waiting for readiness: " + ", ".join(f"{c.name} ({c.status}, exit code {c.exit_code})" for c in failed))
+
+            pending = [service for service, members in by_service.items() if not members or not all(c.is_ready for c in members)]
+            # Right after ``up`` compose may not list any container yet; with
+            # no services given that is not "every service is ready".
+            if not pending and containers:
+                return containers
+
+            elapsed = loop.time() - started
+            if not containers and services is None and elapsed >= timeout:
+                raise NotReadyError(f"No containers appeared in time ({elapsed:.1f}s)")
+            overdue = [service for service in pending if elapsed >= service_timeouts.get(service, timeout)]
+            if overdue:
+                states = "; ".join(f"{service}: " + (", ".join(f"{c.name} {c.status}" for c in by_service[service]) or "no containers") for service in overdue)
+                raise NotReadyError(f"Services did not become ready in time ({elapsed:.1f}s): {states}")
+
+            await asyncio.sleep(poll_interval)
+
+    def wait_until_ready(
+        self,
+        services: Union[List[str], str, None] = None,
+        timeout: float = 60,
+        service_timeouts: Optional[Dict[str, float]] = None,
+        poll_interval: float = 0.5,
+    ) -> List[ComposeContainer]:
+        """Wait until the containers of the services report ready.
+
+        See ``await_until_ready``.
+        """
+        return unkoil(self.await_until_ready, services=services, timeout=timeout, service_timeouts=service_timeouts, poll_interval=poll_interval)
+
     def up(
         self,
         detach: bool = True,
         down_on_exit: Optional[bool] = None,
         stop_on_exit: Optional[bool] = None,
+        wait: bool = False,
+        wait_timeout: float = 60,
+        service_timeouts: Optional[Dict[str, float]] = None,
+        compose_wait: bool = False,
     ) -> LogRoll:
         """Up the deployment.
 
@@ -737,6 +1213,14 @@ class Deployment(KoiledModel):
         stop_on_exit : Optional[bool], optional
             Local override: ``True`` stops on exit, ``None`` (default) follows the
             ``policy``. Mutually exclusive with ``down_on_exit``.
+        wait : bool, optional
+            Wait until every service reports running/healthy, by default False.
+        wait_timeout : float, optional
+            How long each service may take to become ready, by default 60.
+        service_timeouts : Optional[Dict[str, float]], optional
+            Per-service overrides of ``wait_timeout``.
+        compose_wait : bool, optional
+            Pass ``--wait`` to ``docker compose up``, by default False.
 
         Returns
         -------
@@ -744,7 +1228,16 @@ class Deployment(KoiledModel):
             The logs of the up command.
         """
 
-        return unkoil(self.aup, detach=detach, down_on_exit=down_on_exit, stop_on_exit=stop_on_exit)
+        return unkoil(
+            self.aup,
+            detach=detach,
+            down_on_exit=down_on_exit,
+            stop_on_exit=stop_on_exit,
+            wait=wait,
+            wait_timeout=wait_timeout,
+            service_timeouts=service_timeouts,
+            compose_wait=compose_wait,
+        )
 
     async def arestart(
         self,
@@ -776,9 +1269,10 @@ class Deployment(KoiledModel):
         if isinstance(services, str):
             services = [services]
 
-        logs = LogRoll()
-        async for log in cli.astream_restart(services=services):
-            logs.append(log)
+        logs = self._new_log_roll()
+        with self._accounting("restart", logs):
+            async for log in cli.astream_restart(services=services):
+                logs.append(log)
 
         if await_health:
             await asyncio.sleep(await_health_timeout)
@@ -819,6 +1313,7 @@ class Deployment(KoiledModel):
             await_health_timeout=await_health_timeout,
         )
 
+    @_traced("pull")
     async def apull(self) -> LogRoll:
         """Pull the deployment.
 
@@ -837,9 +1332,10 @@ class Deployment(KoiledModel):
         cli = await self.aretrieve_cli()
         await self.project.abefore_pull()
 
-        logs = LogRoll()
-        async for log in cli.astream_pull():
-            logs.append(log)
+        logs = self._new_log_roll()
+        with self._accounting("pull", logs):
+            async for log in cli.astream_pull():
+                logs.append(log)
 
         return logs
 
@@ -858,6 +1354,7 @@ class Deployment(KoiledModel):
         """
         return unkoil(self.apull)
 
+    @_traced("down")
     async def adown(
         self,
         timeout: Optional[int] = None,
@@ -868,7 +1365,8 @@ class Deployment(KoiledModel):
 
         Will call docker-compose down on the deployment.
         This runs automatically on context exit if you started the stack with
-        ``up(down_on_exit=True)``.
+        ``up(down_on_exit=True)``. Once the stack is down, a pending on-exit
+        ``down``/``stop`` is dropped.
 
         Parameters
         ----------
@@ -894,11 +1392,13 @@ class Deployment(KoiledModel):
         if remove_orphans is None:
             remove_orphans = self.remove_orphans_on_down
 
-        logs = LogRoll()
-        async for log in cli.astream_down(timeout=timeout, volumes=volumes, remove_orphans=remove_orphans):
-            logs.append(log)
-            self.logger.on_down(log)
+        logs = self._new_log_roll()
+        with self._accounting("down", logs):
+            async for log in cli.astream_down(timeout=timeout, volumes=volumes, remove_orphans=remove_orphans):
+                logs.append(log)
+                self.logger.on_down(log)
 
+        self._discard_cleanup("down", "stop")
         return logs
 
     async def aremove(self) -> None:
@@ -933,7 +1433,8 @@ class Deployment(KoiledModel):
 
         Will call docker-compose down on the deployment.
         This runs automatically on context exit if you started the stack with
-        ``up(down_on_exit=True)``.
+        ``up(down_on_exit=True)``. Once the stack is down, a pending on-exit
+        ``down``/``stop`` is dropped.
 
         Parameters
         ----------
@@ -952,6 +1453,7 @@ class Deployment(KoiledModel):
         """
         return unkoil(self.adown, timeout=timeout, volumes=volumes, remove_orphans=remove_orphans)
 
+    @_traced("stop")
     async def astop(self, timeout: Optional[int] = None) -> LogRoll:
         """Stop the deployment.
 
@@ -975,10 +1477,11 @@ class Deployment(KoiledModel):
         if timeout is None:
             timeout = self.shutdown_timeout
 
-        logs = LogRoll()
-        async for log in cli.astream_stop(timeout=timeout):
-            logs.append(log)
-            self.logger.on_stop(log)
+        logs = self._new_log_roll()
+        with self._accounting("stop", logs):
+            async for log in cli.astream_stop(timeout=timeout):
+                logs.append(log)
+                self.logger.on_stop(log)
 
         return logs
 
@@ -1026,19 +1529,88 @@ class Deployment(KoiledModel):
         self._entered = True
         self._cleanup_stack = []
         self._registered_keys = set()
+        self._teardown_durations = {}
         return self
 
+    def _cleanup_dependencies(self, steps: List[_CleanupStep]) -> List[List[int]]:
+        """For every step, the indices of the steps it has to wait for."""
+        by_key = {step.key: index for index, step in enumerate(steps) if step.key is not None}
+        dependencies: List[List[int]] = []
+        for index, step in enumerate(steps):
+            if step.after is not None:
+                dependencies.append(sorted(by_key[key] for key in step.after if key in by_key and by_key[key] != index))
+                continue
+            # LIFO: wait for every later step of the chain, except for the run of
+            # steps sharing this step's group right after it.
+            later = index + 1
+            if step.group is not None:
+                while later < len(steps) and steps[later].after is None and steps[later].group == step.group:
+                    later += 1
+            dependencies.append([other for other in range(later, len(steps)) if steps[other].after is None])
+
+        remaining = {index: set(needed) for index, needed in enumerate(dependencies)}
+        while remaining:
+            ready = [index for index, needed in remaining.items() if not needed & remaining.keys()]
+            if not ready:
+                cycle = ", ".join(steps[index].name for index in sorted(remaining))
+                raise TearDownError(f"The teardown steps {cycle} wait for each other (check their `after` keys).")
+            for index in ready:
+                del remaining[index]
+        return dependencies
+
+    @_traced("teardown")
     async def _arun_teardown(self) -> None:
         """Run the registered on-exit teardown steps.
 
         Cleanups registered by the body (``up(down_on_exit=True)``, project
         initialization, ...) are run in LIFO order, so the last resource created
-        is the first torn down. Factored out of ``__aexit__`` so it can be
-        wrapped in an overall ``teardown_timeout`` guard.
+        is the first torn down, except where a step declared ``after`` or
+        ``group`` (see ``_register_cleanup``): every step starts as soon as the
+        steps it depends on are done, so independent steps overlap. The duration
+        of every step is recorded in ``teardown_durations``.
+
+        If a step fails, the steps depending on it are skipped, the others
+        still run, and the first failure (in teardown order) is raised. Factored
+        out of ``__aexit__`` so it can be wrapped in an overall
+        ``teardown_timeout`` guard, which cancels every step still running.
         """
-        while self._cleanup_stack:
-            cleanup = self._cleanup_stack.pop()
-            await cleanup()
+        steps, self._cleanup_stack = self._cleanup_stack, []
+        self._teardown_durations = {}
+        if not steps:
+            return
+        dependencies = self._cleanup_dependencies(steps)
+        tasks: Dict[int, "asyncio.Task[None]"] = {}
+
+        async def run(index: int) -> None:
+            needed = [tasks[other] for other in dependencies[index]]
+            if needed:
+                await asyncio.wait(needed)
+                if any(task.cancelled() or task.exception() is not None for task in needed):
+                    raise _DependencyFailed(steps[index].name)
+            step = steps[index]
+            started = time.monotonic()
+            with self._span("teardown_step", step=step.name):
+                await step.factory()
+            duration = time.monotonic() - started
+            name = step.name if step.name not in self._teardown_durations else f"{step.name}#{index}"
+            self._teardown_durations[name] = duration
+            logger.debug("Teardown step %s took %.3fs", name, duration)
+
+        # Started in LIFO order, so steps free to go at once begin newest first.
+        for index in reversed(range(len(steps))):
+            tasks[index] = asyncio.ensure_future(run(index))
+        try:
+            await asyncio.wait(list(tasks.values()))
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        for index in reversed(range(len(steps))):
+            error = tasks[index].exception()
+            if error is not None and not isinstance(error, _DependencyFailed):
+                raise error
 
     async def __aexit__(
         self,
@@ -1049,7 +1621,8 @@ class Deployment(KoiledModel):
         """Async exit method for the deployment.
 
         Will run every teardown the body registered (``up(down_on_exit=True)``,
-        project initialization, ...) in LIFO order.
+        project initialization, ...) in LIFO order, overlapping the steps that
+        declared themselves independent (see ``_arun_teardown``).
 
         Teardown is bounded: every ``stop``/``down`` carries the
         ``shutdown_timeout`` grace period, and the whole sequence is wrapped in
@@ -1070,7 +1643,7 @@ class Deployment(KoiledModel):
                 logger.warning("%s (while another error was propagating, not raising)", message)
             else:
                 raise TearDownError(message) from e
-        except CommandError as e:
+        except (CommandError, TearDownError) as e:
             if exc_type is not None:
                 logger.warning("Deployment teardown failed (while another error was propagating, not raising): %s", e)
             else:
@@ -1080,3 +1653,8 @@ class Deployment(KoiledModel):
             self._registered_keys = set()
             self._entered = False
             self._cli = None
+            if self.backend is not None:
+                await self.backend.aclose()
+            if self._health_runner is not None:
+                await self._health_runner.aclose()
+            await self._aclose_log_hub()
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import logging
+import re
+import shlex
+import struct
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import aiohttp
+from koil.composition import KoiledModel
+
+from dokker.cli import CLI
+from dokker.command import CommandError, _format_command_error
+from dokker.containers import PROJECT_LABEL, SERVICE_LABEL, ComposeContainer
+from dokker.errors import DokkerError
+from dokker.types import LogStream
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "/var/run/docker.sock"
+
+# How many log lines may wait between the container streams and the consumer.
+# Once that many are waiting the streams stop reading, so a container flooding
+# its logs is throttled by the connection instead of growing our memory.
+MAX_QUEUED_LINES = 1024
+
+# Compose marks containers started by `docker compose run` as one-off; like
+# `docker compose ps`/`logs` we only ever operate on the service containers.
+ONEOFF_LABEL = "com.docker.compose.oneoff"
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ns|us|µs|ms|s|m|h)")
+_DURATIONS = re.compile(r"(?:\d+(?:\.\d+)?(?:ns|us|µs|ms|s|m|h))+")
+_DURATION_UNITS = {"ns": 1e-9, "us": 1e-6, "µs": 1e-6, "ms": 1e-3, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class EngineError(DokkerError):
+    """An error raised when the docker engine API rejects a request."""
+
+
+def _to_unix_timestamp(value: str) -> str:
+    """Convert a compose ``--since``/``--until`` value to a unix timestamp.
+
+    Compose accepts unix timestamps, RFC 3339 dates and relative durations
+    (``42m``, ``1h30m``); the engine API only accepts the first.
+    """
+    if re.fullmatch(r"\d+(\.\d+)?", value):
+        return value
+
+    if _DURATIONS.fullmatch(value):
+        seconds = sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in _DURATION.findall(value))
+        return str(int(time.time() - seconds))
+
+    try:
+        return str(int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()))
+    except ValueError as e:
+        raise EngineError(f"Could not interpret {value!r} as a timestamp, date or duration.") from e
+
+
+async def _ademux(content: aiohttp.StreamReader, tty: bool) -> AsyncIterator[Tuple[str, bytes]]:
+    """Split a docker log/attach stream into ``(source, line)`` pairs.
+
+    Without a TTY the engine multiplexes stdout and stderr into frames with an
+    8 byte header (stream type, padding, big-endian payload size). Frames do not
+    align with lines, so partial lines are buffered per stream. With a TTY the
+    stream is raw and everything is stdout.
+    """
+    buffers: Dict[str, bytes] = {"STDOUT": b"", "STDERR": b""}
+
+    if tty:
+        async for chunk in content.iter_any():
+            *lines, buffers["STDOUT"] = (buffers["STDOUT"] + chunk).split(b"\n")
+            for line in lines:
+                yield "STDOUT", line
+    else:
+        while True:
+            try:
+                header = await content.readexactly(8)
+            except asyncio.IncompleteReadError:
+                break
+            stream_type, size = struct.unpack(">BxxxL", header)
+            source = "STDERR" if stream_type == 2 else "STDOUT"
+            payload = await content.readexactly(size)
+            *lines, buffers[source] = (buffers[source] + payload).split(b"\n")
+            for line in lines:
+                yield source, line
+
+    for source, rest in buffers.items():
+        if rest:
+            yield source, rest
+
+
+class DockerEngineBackend(KoiledModel):
+    """A CLI backend that talks to the docker engine API directly.
+
+    Instead of forking a ``docker compose`` process (and paying for the Go
+    binary's startup) for every logs/stop/restart/inspect/exec call, this
+    backend sends HTTP requests over the engine's unix socket through one
+    pooled, keep-alive ``aiohttp`` session. Containers are resolved through the
+    compose labels of the CLI's project.
+
+    Attach it to a deployment with ``Deployment(backend=DockerEngineBackend())``
+    or directly to a ``CLI(backend=...)``. The session is created lazily and
+    closed with ``aclose`` (a deployment does this on context exit); it is
+    recreated transparently on the next call.
+
+    Unlike ``docker compose logs``, which writes every container's output to
+    its own stdout, the engine reports the real stream of each line, so
+    container stderr arrives tagged as ``STDERR``.
+    """
+
+    socket_path: str = DEFAULT_SOCKET_PATH
+    api_version: Optional[str] = None
+    pool_size: int = 10
+
+    _session: Optional[aiohttp.ClientSession] = None
+
+    def _url(self, path: str) -> str:
+        prefix = f"/v{self.api_version.lstrip('v')}" if self.api_version else ""
+        return f"http://docker{prefix}{path}"
+
+    async def asession(self) -> aiohttp.ClientSession:
+        """Return the pooled session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.UnixConnector(path=self.socket_path, limit=self.pool_size),
+                # Follow-streams never end on their own, so no overall timeout.
+                timeout=aiohttp.ClientTimeout(total=None),
+            )
+        return self._session
+
+    async def aclose(self) -> None:
+        """Close the pooled session and its connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _araise_for_status(self, resp: aiohttp.ClientResponse) -> None:
+        if resp.status < 400:
+            return
+        try:
+            message = (await resp.json()).get("message", "")
+        except (aiohttp.ClientError, ValueError, AttributeError):
+            # Not a JSON error object (e.g. a proxy's HTML page).
+            message = await resp.text()
+        raise EngineError(f"Docker engine returned {resp.status} for {resp.method} {resp.url.path}: {message}")
+
+    async def _arequest(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, str]] = None,
+        body: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        session = await self.asession()
+        async with session.request(method, self._url(path), params=params, json=body) as resp:
+            await self._araise_for_status(resp)
+            if resp.status in (204, 304):
+                return None
+            return await resp.json()
+
+    async def ainspect_containers(self, cli: CLI, services: Optional[List[str]] = None) -> List[ComposeContainer]:
+        """Return the state of the project's containers (running or not)."""
+        filters = {"label": [f"{PROJECT_LABEL}={cli.project_name}", f"{ONEOFF_LABEL}=False"]}
+        listed = await self._arequest(
+            "GET",
+            "/containers/json",
+            params={"all": "1", "filters": json.dumps(filters)},
+        )
+        ids = [item["Id"] for item in listed if not services or (item.get("Labels") or {}).get(SERVICE_LABEL) in services]
+
+        inspected = await asyncio.gather(*[self._arequest("GET", f"/containers/{id}/json") for id in ids])
+        containers = [ComposeContainer.from_inspect(data) for data in inspected]
+        return sorted(containers, key=lambda c: (c.service, c.number or 0))
+
+    async def _astream_container_logs(self, container: ComposeContainer, params: Dict[str, str]) -> AsyncIterator[Tuple[str, bytes]]:
+        session = await self.asession()
+        async with session.get(self._url(f"/containers/{container.id}/logs"), params=params) as resp:
+            await self._araise_for_status(resp)
+            async for source, line in _ademux(resp.content, container.tty):
+                yield source, line
+
+    async def astream_docker_logs(
+        self,
+        cli: CLI,
+        tail: Optional[str] = None,
+        follow: bool = False,
+        no_log_prefix: bool = False,
+        timestamps: bool = False,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        services: Optional[List[str]] = None,
+        raw: bool = False,
+        errors: str = "strict",
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Stream the logs of the project's containers, merged as they arrive."""
+        containers = await self.ainspect_containers(cli, services)
+
+        params = {
+            "stdout": "1",
+            "stderr": "1",
+            "follow": "1" if follow else "0",
+            "timestamps": "1" if timestamps else "0",
+        }
+        if tail is not None:
+            params["tail"] = tail
+        if since is not None:
+            params["since"] = _to_unix_timestamp(since)
+        if until is not None:
+            params["until"] = _to_unix_timestamp(until)
+
+        queue: asyncio.Queue[Union[Tuple[str, Any], BaseException, None]] = asyncio.Queue(maxsize=MAX_QUEUED_LINES)
+
+        async def pump(container: ComposeContainer) -> None:
+            prefix = f"{container.log_prefix}  | "
+            raw_prefix = prefix.encode()
+            # No finally: a cancelled pump must not wait for room in the queue.
+            try:
+                async for source, line in self._astream_container_logs(container, params):
+                    if raw:
+                        await queue.put((source, line if no_log_prefix else raw_prefix + line))
+                        continue
+                    text = line.decode("utf-8", errors).strip()
+                    await queue.put((source, text if no_log_prefix else prefix + text))
+            except Exception as e:
+                # Raised by the consumer, which then stops the other pumps.
+                logger.warning("Streaming the logs of %s failed: %s", container.name, e)
+                await queue.put(e)
+            else:
+                await queue.put(None)
+
+        pumps = [asyncio.create_task(pump(container)) for container in containers]
+        try:
+            finished = 0
+            while finished < len(pumps):
+                item = await queue.get()
+                if item is None:
+                    finished += 1
+                elif isinstance(item, BaseException):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for task in pumps:
+                task.cancel()
+            await asyncio.gather(*pumps, return_exceptions=True)
+
+    async def _astream_lifecycle(self, cli: CLI, services: Optional[List[str]], action: str, timeout: Optional[int]) -> LogStream:
+        containers = [c for c in await self.ainspect_containers(cli, services) if action == "restart" or c.state == "running"]
+        params = {"t": str(timeout)} if timeout is not None else None
+        progressive, done = {"stop": ("Stopping", "Stopped"), "restart": ("Restarting", "Started")}[action]
+
+        # Mirror compose, which reports container progress on stderr.
+        for container in containers:
+            yield ("STDERR", f"Container {container.name}  {progressive}")
+
+        await asyncio.gather(*[self._arequest("POST", f"/containers/{c.id}/{action}", params=params) for c in containers])
+
+        for container in containers:
+            yield ("STDERR", f"Container {container.name}  {done}")
+
+    async def astream_stop(self, cli: CLI, services: Optional[List[str]] = None, timeout: Optional[int] = None) -> LogStream:
+        """Stop the project's running containers concurrently."""
+        async for line in self._astream_lifecycle(cli, services, "stop", timeout):
+            yield line
+
+    async def astream_restart(self, cli: CLI, services: Optional[List[str]] = None) -> LogStream:
+        """Restart the project's containers concurrently."""
+        async for line in self._astream_lifecycle(cli, services, "restart", None):
+            yield line
+
+    async def astream_exec(self, cli: CLI, service: str, command: List[str], index: int = 1) -> LogStream:
+        """Run a command in the ``index``-th running container of a service.
+
+        Raises
+        ------
+        CommandError
+            If the command exits with a non-zero code.
+        EngineError
+            If no running container of the service exists.
+        """
+        candidates = [c for c in await self.ainspect_containers(cli, [service]) if c.state == "running" and (c.number or 1) == index]
+        if not candidates:
+            raise EngineError(f"No running container found for service {service} (index {index}) in project {cli.project_name}.")
+        container = candidates[0]
+
+        created = await self._arequest(
+            "POST",
+            f"/containers/{container.id}/exec",
+            body={"AttachStdout": True, "AttachStderr": True, "Tty": False, "Cmd": command},
+        )
+        exec_id = created["Id"]
+
+        stdout_logs: List[str] = []
+        stderr_logs: List[str] = []
+        session = await self.asession()
+        async with session.post(self._url(f"/exec/{exec_id}/start"), json={"Detach": False, "Tty": False}) as resp:
+            await self._araise_for_status(resp)
+            async for source, raw in _ademux(resp.content, tty=False):
+                text = raw.decode("utf-8").strip()
+                (stderr_logs if source == "STDERR" else stdout_logs).append(text)
+                yield (source, text)
+
+        returncode = (await self._arequest("GET", f"/exec/{exec_id}/json")).get("ExitCode")
+        if returncode != 0:
+            full_cmd = shlex.join(command)
+            raise CommandError(
+                _format_command_error(full_cmd, returncode, stdout_logs, stderr_logs),
+                command=full_cmd,
+                returncode=returncode,
+                stdout=stdout_logs,
+                stderr=stderr_logs,
+            )
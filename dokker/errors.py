@@ -18,6 +18,14 @@ class HealthCheckError(DokkerError):
     """Raised when a health check fails."""
 
 
+class NotReadyError(HealthCheckError):
+    """Raised when services do not report ready (running and healthy) in time.
+
+    Also raised early when a container fails for good: it exited with a
+    non-zero code, died, or its compose ``healthcheck`` reports unhealthy.
+    """
+
+
 class TearDownError(DokkerError):
     """Raised when tearing a deployment down fails or times out.
 
@@ -29,6 +37,10 @@ class TearDownError(DokkerError):
     """
 
 
+class LogPatternNotFoundError(DokkerError):
+    """Raised when no log line matched a pattern in time (or before the log stream ended)."""
+
+
 class ServiceNotFoundError(DokkerError):
     """Raised when a requested service cannot be found in the compose spec."""
 
@@ -0,0 +1,386 @@
+"""An on-disk archive of log records for long-running watchers.
+
+Records are appended to a directory of *segments*. A segment is a file of
+independently zlib-compressed *blocks* of about ``block_bytes`` of records
+each; a new segment is started once a segment reaches ``segment_bytes``.
+Next to every segment, a sparse index (``.idx``) holds one fixed-size entry
+per block: its offset and length in the segment, the number of its first
+line, its line count and the first and last timestamp in it.
+
+In a running event loop, append with ``aappend`` (and close with
+``aclose``): full blocks are then compressed and written in a worker thread,
+so archiving never blocks the loop.
+
+Reads memory-map the segments and only decompress the blocks a query needs:
+``tail`` walks the blocks backwards, ``between`` skips every block outside
+the time range by its index entry, and the stream generators decompress one
+block at a time. Archives of past runs are opened with ``LogArchive.open``.
+"""
+
+import asyncio
+import mmap
+import os
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Generator, Iterator, List, Optional, Tuple
+
+from dokker.log_record import LogRecord, as_utc, filter_records
+from dokker.types import ValidPath
+
+# offset, length, first line, line count, first and last timestamp (in
+# microseconds since the epoch; _NO_TIME when the block has none)
+_INDEX = struct.Struct("<QIQIqq")
+_NO_TIME = (2**63 - 1, -(2**63))
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+LOGS_DIR = "logs"
+"""The directory in ``<base_dir>/<project>`` the archived runs are kept in."""
+_LENGTH = struct.Struct("<I")
+_STREAMS = {"STDOUT": "O", "STDERR": "E"}
+_STREAM_NAMES = {code: name for name, code in _STREAMS.items()}
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n"})
+
+
+def _escape(text: str) -> str:
+    return text.translate(_ESCAPES)
+
+
+def _unescape(text: str) -> str:
+    if "\\" not in text:
+        return text
+    out, chars = [], iter(text)
+    for char in chars:
+        if char == "\\":
+            char = {"t": "\t", "n": "\n"}.get(next(chars, ""), "\\")
+        out.append(char)
+    return "".join(out)
+
+
+def _micros(timestamp: datetime) -> int:
+    # Naive timestamps are taken as UTC, on both sides of a comparison.
+    epoch = _EPOCH if timestamp.tzinfo is not None else _EPOCH.replace(tzinfo=None)
+    return (timestamp - epoch) // _MICROSECOND
+
+
+def _encode(record: LogRecord) -> str:
+    timestamp = record.timestamp.isoformat() if record.timestamp is not None else ""
+    replica = str(record.replica) if record.replica is not None else ""
+    return f"{_STREAMS[record.stream]}\t{timestamp}\t{_escape(record.service or '')}\t{replica}\t{_escape(record.message)}\n"
+
+
+def _decode(line: str) -> LogRecord:
+    stream, timestamp, service, replica, message = line.split("\t", 4)
+    return LogRecord(
+        _unescape(service) or None,
+        int(replica) if replica else None,
+        _STREAM_NAMES[stream],
+        datetime.fromisoformat(timestamp) if timestamp else None,
+        _unescape(message),
+    )
+
+
+class _Block:
+    """The index entry of one compressed block."""
+
+    __slots__ = ("segment", "offset", "length", "first_line", "count", "first_time", "last_time")
+
+    def __init__(self, segment: str, offset: int, length: int, first_line: int, count: int, first_time: int, last_time: int) -> None:
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+        self.first_line = first_line
+        self.count = count
+        self.first_time = first_time
+        self.last_time = last_time
+
+
+class LogArchive:
+    """A segmented, compressed, indexed on-disk store of ``LogRecord``s.
+
+    Append records with ``append`` and ``close`` the archive when done (the
+    records of the block being filled are also readable before that).
+    ``LogArchive.open`` reopens the archive of a past run read-only.
+
+    Parameters
+    ----------
+    directory : ValidPath
+        The directory the segments are written to; created if missing.
+    segment_bytes : int, optional
+        Start a new segment once one reaches this size, by default 64 MiB.
+    block_bytes : int, optional
+        Compress the records in blocks of about this many bytes, by default
+        64 KiB. Bigger blocks compress better, smaller ones make ``tail`` and
+        time-range reads decompress less.
+    """
+
+    def __init__(self, directory: ValidPath, segment_bytes: int = 64 * 1024 * 1024, block_bytes: int = 64 * 1024, writable: bool = True) -> None:
+        """Create (or, with ``writable=False``, only read) the archive in *directory*."""
+        self.directory = str(directory)
+        self.segment_bytes = segment_bytes
+        self.block_bytes = block_bytes
+        self.writable = writable
+        self._blocks: List[_Block] = []
+        self._pending: List[LogRecord] = []
+        self._pending_text: List[str] = []
+        self._pending_bytes = 0
+        # The records of the block a worker thread is writing (see aflush).
+        self._flushing: List[LogRecord] = []
+        self._writing: Optional["asyncio.Future[_Block]"] = None
+        self._lock = asyncio.Lock()
+        self._segment: Optional[str] = None
+        self._segment_size = 0
+        if writable:
+            os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    @classmethod
+    def open(cls, directory: ValidPath) -> "LogArchive":
+        """Open the archive in *directory* read-only, e.g. of a past run."""
+        return cls(directory, writable=False)
+
+    def _segments(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[: -len(".log")] for name in names if name.startswith("segment-") and name.endswith(".log"))
+
+    def _load_index(self) -> None:
+        for segment in self._segments():
+            try:
+                with open(os.path.join(self.directory, f"{segment}.idx"), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            usable = len(data) - len(data) % _INDEX.size
+            for entry in _INDEX.iter_unpack(data[:usable]):
+                self._blocks.append(_Block(segment, *entry))
+            self._segment = segment
+            self._segment_size = os.path.getsize(os.path.join(self.directory, f"{segment}.log"))
+
+    def __len__(self) -> int:
+        """The number of archived records."""
+        return self._lines_flushed + len(self._flushing) + len(self._pending)
+
+    @property
+    def _lines_flushed(self) -> int:
+        if not self._blocks:
+            return 0
+        last = self._blocks[-1]
+        return last.first_line + last.count
+
+    @property
+    def nbytes(self) -> int:
+        """The compressed size of the archive on disk."""
+        return sum(block.length + _LENGTH.size for block in self._blocks)
+
+    def _add(self, record: LogRecord) -> bool:
+        """Buffer *record*; whether its block is full."""
+        if not self.writable:
+            raise ValueError(f"The log archive in {self.directory} is read-only.")
+        text = _encode(record)
+        self._pending.append(record)
+        self._pending_text.append(text)
+        self._pending_bytes += len(text)
+        return self._pending_bytes >= self.block_bytes
+
+    def append(self, record: LogRecord) -> None:
+        """Archive one record."""
+        if self._add(record):
+            self.flush()
+
+    async def aappend(self, record: LogRecord) -> None:
+        """Archive one record, writing a full block in a worker thread (see ``aflush``)."""
+        if self._add(record):
+            await self.aflush()
+
+    def _take(self) -> Tuple[List[LogRecord], str]:
+        records, text = self._pending, "".join(self._pending_text)
+        self._pending, self._pending_text, self._pending_bytes = [], [], 0
+        return records, text
+
+    def _write(self, records: List[LogRecord], text: str) -> _Block:
+        """Compress *records* (encoded as *text*) into a block and write it and its index entry."""
+        if self._segment is None or self._segment_size >= self.segment_bytes:
+            self._segment = f"segment-{len(self._segments()) + 1:06d}"
+            self._segment_size = 0
+
+        data = zlib.compress(text.encode("utf-8", "surrogatepass"))
+        times = [_micros(record.timestamp) for record in records if record.timestamp is not None]
+        first_time, last_time = (min(times), max(times)) if times else _NO_TIME
+        block = _Block(
+            self._segment,
+            self._segment_size + _LENGTH.size,
+            len(data),
+            self._lines_flushed,
+            len(records),
+            first_time,
+            last_time,
+        )
+        with open(os.path.join(self.directory, f"{self._segment}.log"), "ab") as f:
+            f.write(_LENGTH.pack(len(data)) + data)
+        # The index entry goes last: a reader never finds a block that is
+        # not fully written yet.
+        with open(os.path.join(self.directory, f"{self._segment}.idx"), "ab") as f:
+            f.write(_INDEX.pack(block.offset, block.length, block.first_line, block.count, block.first_time, block.last_time))
+
+        self._segment_size += _LENGTH.size + len(data)
+        return block
+
+    def flush(self) -> None:
+        """Compress the records appended since the last block into a block."""
+        if not self._pending:
+            return
+        records, text = self._take()
+        try:
+            block = self._write(records, text)
+        except BaseException:
+            self._pending, self._pending_text, self._pending_bytes = records + self._pending, [text] + self._pending_text, len(text) + self._pending_bytes
+            raise
+        self._blocks.append(block)
+
+    async def aflush(self) -> None:
+        """Like ``flush``, but compress and write the block in a worker thread.
+
+        The records stay readable while they are written. Cancelling the
+        caller does not cancel the write; the block is still recorded.
+        """
+        async with self._lock:
+            if self._writing is not None and not self._writing.done():
+                await asyncio.wait([self._writing])
+            if not self._pending:
+                return
+            records, text = self._take()
+            self._flushing = records
+
+            def written(write: "asyncio.Future[_Block]") -> None:
+                self._flushing = []
+                if write.cancelled() or write.exception() is not None:
+                    self._pending, self._pending_text, self._pending_bytes = records + self._pending, [text] + self._pending_text, len(text) + self._pending_bytes
+                else:
+                    self._blocks.append(write.result())
+
+            self._writing = asyncio.ensure_future(asyncio.to_thread(self._write, records, text))
+            self._writing.add_done_callback(written)
+            await asyncio.shield(self._writing)
+
+    def close(self) -> None:
+        """Flush the last block; the archive stays readable."""
+        if self.writable:
+            self.flush()
+
+    async def aclose(self) -> None:
+        """Like ``close``, writing the last block in a worker thread."""
+        if self.writable:
+            await self.aflush()
+
+    def _read(self, blocks: List[_Block]) -> Iterator[List[LogRecord]]:
+        """Decompress *blocks* (in the given order) one at a time."""
+        maps = {}
+        try:
+            for block in blocks:
+                view = maps.get(block.segment)
+                if view is None:
+                    # The map stays valid once the file is closed.
+                    with open(os.path.join(self.directory, f"{block.segment}.log"), "rb") as f:
+                        view = maps[block.segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                text = zlib.decompress(view[block.offset : block.offset + block.length]).decode("utf-8", "surrogatepass")
+                yield [_decode(line) for line in text.split("\n") if line]
+        finally:
+            for view in maps.values():
+                view.close()
+
+    def __iter__(self) -> Iterator[LogRecord]:
+        """Iterate every record, oldest first, one block in memory at a time."""
+        blocks = list(self._blocks)
+        pending = self._flushing + self._pending
+        for records in self._read(blocks):
+            yield from records
+        yield from pending
+
+    def tail(self, n: int) -> List[LogRecord]:
+        """The last *n* records, decompressing only the blocks holding them."""
+        if n <= 0:
+            return []
+        records = (self._flushing + self._pending)[-n:]
+        needed = n - len(records)
+        blocks = []
+        for block in reversed(self._blocks):
+            if needed <= 0:
+                break
+            blocks.append(block)
+            needed -= block.count
+        for block_records in self._read(blocks):
+            records = block_records + records
+        return records[-n:]
+
+    def between(self, since: Optional[datetime] = None, until: Optional[datetime] = None, service: Optional[str] = None) -> Iterator[LogRecord]:
+        """The records logged within ``[since, until)`` (of *service*), skipping blocks by their index.
+
+        Naive bounds are taken as UTC.
+        """
+        since = as_utc(since) if since is not None else None
+        until = as_utc(until) if until is not None else None
+        blocks = list(self._blocks)
+        # Records without a timestamp never match a time range, so neither do
+        # blocks without any (their _NO_TIME bounds are always out of range).
+        if since is not None:
+            low = _micros(since)
+            blocks = [block for block in blocks if block.last_time >= low]
+        if until is not None:
+            high = _micros(until)
+            blocks = [block for block in blocks if block.first_time < high]
+        pending = self._flushing + self._pending
+        for records in self._read(blocks):
+            yield from filter_records(records, service=service, since=since, until=until)
+        yield from filter_records(pending, service=service, since=since, until=until)
+
+    def _stream_gen(self, stream: str) -> Generator[str, None, None]:
+        for record in self:
+            if record.stream == stream:
+                yield record.as_log()[1]
+
+    @property
+    def stdout_gen(self) -> Generator[str, None, None]:
+        """Generator for stdout lines, decompressing one block at a time."""
+        return self._stream_gen("STDOUT")
+
+    @property
+    def stderr_gen(self) -> Generator[str, None, None]:
+        """Generator for stderr lines, decompressing one block at a time."""
+        return self._stream_gen("STDERR")
+
+    @property
+    def stdout(self) -> str:
+        """String of stdout lines joined by new lines (reads the whole archive)."""
+        return "\n".join(self.stdout_gen)
+
+    @property
+    def stderr(self) -> str:
+        """String of stderr lines joined by new lines (reads the whole archive)."""
+        return "\n".join(self.stderr_gen)
+
+    def __repr__(self) -> str:
+        """Representation of the archive."""
+        return f"LogArchive({self.directory!r}, records={len(self)}, blocks={len(self._blocks)})"
+
+
+def archive_path(base_dir: ValidPath, project_name: str, run: Optional[str] = None) -> str:
+    """The directory of one archived run: ``<base_dir>/<project>/logs/<run>``.
+
+    *run* defaults to the current local time, so runs sort chronologically.
+    """
+    if run is None:
+        run = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    return os.path.join(str(base_dir), project_name, LOGS_DIR, run)
+
+
+def archived_runs(base_dir: ValidPath, project_name: str) -> List[str]:
+    """The directories of the archived runs of *project_name*, oldest first."""
+    logs = os.path.join(str(base_dir), project_name, LOGS_DIR)
+    try:
+        return [os.path.join(logs, run) for run in sorted(os.listdir(logs))]
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,414 @@
+import asyncio
+import logging
+from collections import deque
+from types import TracebackType
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Self, Tuple, Type, Union
+
+from dokker.cli import CLIBearer
+from dokker.log_record import LogRecord, parse_prefix, split_prefix, split_raw_prefix
+
+logger = logging.getLogger(__name__)
+
+# How many lines a hub keeps at most for subscribers joining a running stream,
+# unless it is given another ``history``.
+DEFAULT_HISTORY = 1000
+
+# How many lines wait at most in a subscriber's queue (fewer if it keeps fewer
+# itself). While a subscriber's queue is full the shared stream waits, so a
+# slow subscriber throttles the compose process instead of growing our memory.
+MAX_QUEUED_LINES = 1000
+
+LogKey = Tuple[Optional[str], bool, Optional[str], Optional[str], bool, str]
+"""The stream options that must match for subscribers to share a stream:
+``(tail, timestamps, since, until, raw, errors)``."""
+
+
+class _Stream:
+    """One ``docker compose logs --follow`` over some (or, if empty, all) services."""
+
+    def __init__(self, services: List[str], skip: Dict[Optional[str], int]) -> None:
+        self.services = services
+        # How many lines per compose prefix the stream replaced by this one
+        # already delivered; this one prints them again first.
+        self.skip = skip
+        self.done = False
+        self.replaced = False
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    def covers(self, services: List[str]) -> bool:
+        """Whether the stream delivers every line of *services* (all if empty)."""
+        return not self.services or (bool(services) and set(services) <= set(self.services))
+
+
+class _Group:
+    """The stream and subscribers sharing one set of stream options."""
+
+    def __init__(self, history: Optional[int]) -> None:
+        self.stream: Optional[_Stream] = None
+        self.subscribers: List["LogSubscription"] = []
+        # How many lines per compose prefix the group's streams delivered.
+        self.delivered: Dict[Optional[str], int] = {}
+        self.history: Deque[Tuple[Optional[str], Tuple[str, Any]]] = deque()
+        self.history_bytes = 0
+        # The hub's cap, and the caps the subscribers' own buffers need.
+        self.max_history = history
+        self.max_lines = history
+        self.max_bytes: Optional[int] = None
+        self.services: Dict[str, str] = {}
+
+    def union(self) -> List[str]:
+        """The services the subscribers ask for, all (empty) if any asks for all."""
+        if any(not subscriber.services for subscriber in self.subscribers):
+            return []
+        return list(dict.fromkeys(service for subscriber in self.subscribers for service in subscriber.services))
+
+    def bound(self) -> None:
+        """Size the history to what the subscribers would keep of it themselves.
+
+        That is the most lines (and bytes) any of them keeps, never more than
+        the hub's ``history``; a subscriber without a cap needs the hub's.
+        """
+        lines = [subscriber.max_lines or self.max_history for subscriber in self.subscribers]
+        if not lines or None in lines:
+            self.max_lines = self.max_history
+        else:
+            self.max_lines = max(line for line in lines if line is not None)
+            if self.max_history is not None:
+                self.max_lines = min(self.max_lines, self.max_history)
+        sizes = [subscriber.max_bytes for subscriber in self.subscribers]
+        self.max_bytes = None if not sizes or None in sizes else max(size for size in sizes if size is not None)
+        self.trim()
+
+    def remember(self, service: Optional[str], log: Tuple[str, Any]) -> None:
+        """Keep a delivered line for subscribers joining later."""
+        self.history.append((service, log))
+        self.history_bytes += len(log[1])
+        self.trim()
+
+    def trim(self) -> None:
+        """Drop the oldest lines beyond the caps."""
+        while self.history and ((self.max_lines is not None and len(self.history) > self.max_lines) or (self.max_bytes is not None and self.history_bytes > self.max_bytes)):
+            self.history_bytes -= len(self.history.popleft()[1][1])
+
+
+class LogSubscription:
+    """A subscriber's view of the shared log stream of a ``LogHub``.
+
+    Use it as an async context manager, and iterate it inside for the
+    ``(source, line)`` tuples of the subscribed services, exactly as
+    ``CLI.astream_docker_logs`` would have yielded them, or, if
+    ``structured``, for their ``LogRecord``. Iteration ends when the stream
+    ends.
+
+    At most ``max_lines`` (and ``max_bytes``) lines, never more than
+    ``MAX_QUEUED_LINES``, wait to be iterated; while that many are waiting,
+    the shared stream waits for this subscriber.
+    """
+
+    def __init__(
+        self,
+        hub: "LogHub",
+        key: LogKey,
+        services: List[str],
+        no_log_prefix: bool,
+        structured: bool = False,
+        max_lines: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        """Create a subscription; it only joins the hub on enter."""
+        self.hub = hub
+        self.key = key
+        self.services = services
+        self.no_log_prefix = no_log_prefix
+        self.structured = structured
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.ended = False
+        self._left = False
+        self._max_queued = min(max_lines, MAX_QUEUED_LINES) if max_lines is not None else MAX_QUEUED_LINES
+        self._queue: Deque[Tuple[Union[Tuple[str, Any], LogRecord, BaseException, None], int]] = deque()
+        self._queued_bytes = 0
+        self._arrived = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+    def wants(self, service: Optional[str]) -> bool:
+        """Whether lines of *service* (None for unprefixed lines) go to this subscriber."""
+        return not self.services or service is None or service in self.services
+
+    def _full(self) -> bool:
+        return len(self._queue) >= self._max_queued or (self.max_bytes is not None and bool(self._queue) and self._queued_bytes >= self.max_bytes)
+
+    def _put(self, item: Union[Tuple[str, Any], LogRecord, BaseException, None], size: int = 0) -> None:
+        self._queue.append((item, size))
+        self._queued_bytes += size
+        self._arrived.set()
+
+    def deliver(self, log: Tuple[str, Any], record: Optional[LogRecord] = None) -> None:
+        """Queue a line (or its parsed *record*), without its compose prefix if asked for.
+
+        This never waits, so only lines already bounded otherwise (the
+        history a joining subscriber replays) go through it; the stream
+        itself uses ``adeliver``.
+        """
+        size = len(log[1])
+        if self.structured:
+            self._put(record if record is not None else LogRecord.parse(log, timestamps=self.key[1]), size)
+            return
+        if self.no_log_prefix:
+            source, line = log
+            if isinstance(line, bytes):
+                prefix, raw = split_raw_prefix(line)
+                if prefix is not None:
+                    log = (source, raw)
+            else:
+                prefix, text = split_prefix(line)
+                if prefix is not None:
+                    log = (source, text.strip())
+        self._put(log, size)
+
+    async def adeliver(self, log: Tuple[str, Any], record: Optional[LogRecord] = None) -> None:
+        """Queue a line like ``deliver``, first waiting until the queue has room."""
+        while self._full() and not self._left:
+            self._drained.clear()
+            await self._drained.wait()
+        if not self._left:
+            self.deliver(log, record)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """End the iteration once the queued lines are through, raising *error* then if given."""
+        if self.ended:
+            return
+        self.ended = True
+        if error is not None:
+            self._put(error)
+        self._put(None)
+
+    def leave(self) -> None:
+        """Stop taking lines, so the stream no longer waits for this subscriber."""
+        self._left = True
+        self._drained.set()
+
+    async def __aenter__(self) -> Self:
+        """Join the hub, starting (or widening) the stream this subscription needs."""
+        await self.hub._ajoin(self)
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]], exc_val: Optional[BaseException], exc_tb: Optional[TracebackType]) -> None:
+        """Leave the hub, stopping the stream once nobody else reads from it."""
+        await self.hub._aleave(self)
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        """Yield the subscribed lines as they arrive."""
+        while True:
+            while not self._queue:
+                self._arrived.clear()
+                await self._arrived.wait()
+            item, size = self._queue.popleft()
+            self._queued_bytes -= size
+            if not self._full():
+                self._drained.set()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class LogHub:
+    """Shares ``docker compose logs --follow`` streams between log watchers.
+
+    Every follow-mode ``LogWatcher`` of a deployment subscribes to the
+    deployment's hub instead of spawning its own compose process. Subscribers
+    with the same stream options share one stream over the union of the
+    services they ask for (or all services). A subscriber asking for a
+    service the stream does not cover restarts it over the widened union;
+    the new process prints the logs again, so the lines the old one already
+    delivered are skipped. Lines are routed to the subscribers by the service
+    in their compose prefix (``web-1  | ...``), and the stream is stopped once
+    its last subscriber left.
+
+    A subscriber joining a running stream first gets the recent lines the
+    stream delivered for its services (with ``tail`` only the last ``tail``
+    per service), as a process of its own would have printed them. Only as
+    many lines are kept for that as the subscribers keep themselves (their
+    ``max_lines`` and ``max_bytes``), and never more than ``history`` lines
+    (None keeps them all while subscribers keep all).
+    """
+
+    def __init__(self, cli_bearer: CLIBearer, history: Optional[int] = DEFAULT_HISTORY) -> None:
+        """Create a hub streaming through the CLI of *cli_bearer*."""
+        self.cli_bearer = cli_bearer
+        self.history = history
+        self._groups: Dict[LogKey, _Group] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def streams(self) -> int:
+        """The number of follow streams currently running."""
+        return sum(1 for group in self._groups.values() if group.stream is not None and not group.stream.done)
+
+    def subscribe(
+        self,
+        services: Union[str, List[str], None] = None,
+        tail: Optional[str] = None,
+        timestamps: bool = False,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        no_log_prefix: bool = False,
+        raw: bool = False,
+        errors: str = "strict",
+        structured: bool = False,
+        max_lines: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> LogSubscription:
+        """Create a subscription to the logs of *services* (all if None or empty).
+
+        The options mean the same as for ``CLI.astream_docker_logs``; the
+        stream always follows. With *structured* the subscription yields a
+        ``LogRecord`` per line, parsed once for every structured subscriber.
+        *max_lines* and *max_bytes* are the caps of the subscriber's own
+        buffer, which bound the history the hub keeps for it and the lines
+        waiting in its queue.
+        Use the result as an async context manager.
+        """
+        if isinstance(services, str):
+            services = [services]
+        return LogSubscription(self, (tail, timestamps, since, until, raw, errors), list(services or []), no_log_prefix, structured, max_lines, max_bytes)
+
+    def _service_of(self, line: Union[str, bytes], stream: _Stream, group: _Group) -> Tuple[Optional[str], Optional[str]]:
+        """The compose prefix of *line* and the service it belongs to."""
+        prefix: Optional[str]
+        if isinstance(line, bytes):
+            prefix, _ = split_raw_prefix(line)
+        else:
+            prefix, _ = split_prefix(line)
+        if prefix is None:
+            return None, None
+        try:
+            return prefix, group.services[prefix]
+        except KeyError:
+            pass
+
+        # compose prefixes lines with the container name: "web-1" (or
+        # "project_web_1" for older versions).
+        name, _ = parse_prefix(prefix)
+        candidates = stream.services or {service for subscriber in group.subscribers for service in subscriber.services}
+        matches = [service for service in candidates if name == service or name.endswith(("-" + service, "_" + service))]
+        service = max(matches, key=len) if matches else name
+        group.services[prefix] = service
+        return prefix, service
+
+    async def _arun(self, key: LogKey, group: _Group, stream: _Stream) -> None:
+        tail, timestamps, since, until, raw, errors = key
+        try:
+            cli = await self.cli_bearer.aget_cli()
+            async for log in cli.astream_docker_logs(
+                tail=tail,
+                follow=True,
+                timestamps=timestamps,
+                since=since,
+                until=until,
+                services=stream.services,
+                raw=raw,
+                errors=errors,
+            ):
+                prefix, service = self._service_of(log[1], stream, group)
+                if stream.skip.get(prefix):
+                    # The stream this one replaced delivered it already.
+                    stream.skip[prefix] -= 1
+                    continue
+                group.delivered[prefix] = group.delivered.get(prefix, 0) + 1
+                group.remember(service, log)
+                record = None
+                for subscriber in list(group.subscribers):
+                    if not subscriber.ended and subscriber.wants(service):
+                        if subscriber.structured and record is None:
+                            record = LogRecord.parse(log, timestamps=timestamps)
+                            # The hub resolves older "project_web_1" prefixes too.
+                            record.service = service if service is not None else record.service
+                        await subscriber.adeliver(log, record)
+        except Exception as e:
+            logger.warning("The shared log stream of %s failed: %s", ", ".join(stream.services) or "all services", e)
+            for subscriber in group.subscribers:
+                subscriber.finish(e)
+        finally:
+            stream.done = True
+            if not stream.replaced:
+                for subscriber in group.subscribers:
+                    subscriber.finish()
+
+    async def _astart(self, key: LogKey, group: _Group) -> None:
+        """Start the group's stream over its subscribers' services, replacing the running one."""
+        skip: Dict[Optional[str], int] = {}
+        if group.stream is not None:
+            group.stream.replaced = True
+            await self._astop(group.stream)
+            # The new process prints the logs again: all of them, or with a
+            # numeric tail the last ``tail`` lines per container.
+            tail = key[0]
+            keep = int(tail) if tail is not None and tail.isdigit() else None
+            skip = {prefix: count if keep is None or prefix is None else min(keep, count) for prefix, count in group.delivered.items()}
+        stream = group.stream = _Stream(group.union(), skip)
+        stream.task = asyncio.create_task(self._arun(key, group, stream))
+
+    def _replay(self, subscriber: LogSubscription, group: _Group) -> None:
+        logs = [(service, log) for service, log in group.history if subscriber.wants(service)]
+        tail = subscriber.key[0]
+        if tail is not None and tail.isdigit():
+            keep = int(tail)
+            seen: Dict[Optional[str], int] = {}
+            kept = []
+            for service, log in reversed(logs):
+                seen[service] = seen.get(service, 0) + 1
+                if seen[service] <= keep:
+                    kept.append(log)
+            replay = list(reversed(kept))
+        else:
+            replay = [log for _, log in logs]
+        for log in replay:
+            subscriber.deliver(log)
+
+    async def _ajoin(self, subscriber: LogSubscription) -> None:
+        async with self._lock:
+            group = self._groups.get(subscriber.key)
+            if group is None:
+                group = self._groups[subscriber.key] = _Group(self.history)
+
+            self._replay(subscriber, group)
+            group.subscribers.append(subscriber)
+            group.bound()
+
+            if group.stream is None or not group.stream.covers(subscriber.services):
+                await self._astart(subscriber.key, group)
+            elif group.stream.done:
+                subscriber.finish()
+
+    async def _astop(self, stream: _Stream) -> None:
+        if stream.task is not None:
+            stream.task.cancel()
+            await asyncio.gather(stream.task, return_exceptions=True)
+
+    async def _aleave(self, subscriber: LogSubscription) -> None:
+        subscriber.leave()
+        async with self._lock:
+            group = self._groups.get(subscriber.key)
+            if group is None or subscriber not in group.subscribers:
+                return
+            group.subscribers.remove(subscriber)
+            group.bound()
+            if not group.subscribers:
+                del self._groups[subscriber.key]
+                if group.stream is not None:
+                    await self._astop(group.stream)
+
+    async def aclose(self) -> None:
+        """Stop every stream, e.g. when the deployment exits."""
+        async with self._lock:
+            groups, self._groups = list(self._groups.values()), {}
+            for group in groups:
+                for subscriber in group.subscribers:
+                    subscriber.leave()
+                    subscriber.finish()
+                if group.stream is not None:
+                    await self._astop(group.stream)
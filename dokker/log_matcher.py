@@ -0,0 +1,153 @@
+import asyncio
+import re
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Pattern, Tuple, Union
+
+_SCOPED_FLAGS = ((re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x"))
+
+PatternKey = Tuple[str, int, Optional[str]]
+
+# How many match positions are kept per pattern; older ones are only counted.
+MAX_MATCH_POSITIONS = 1000
+
+
+class _Tracked:
+    """A pattern the matcher evaluates on every line, with its match index."""
+
+    __slots__ = ("regex", "service", "positions", "matches", "first", "waiters")
+
+    def __init__(self, regex: Pattern[str], service: Optional[str]) -> None:
+        self.regex = regex
+        self.service = service
+        # The (absolute) positions of the most recent matching lines, in
+        # order, and how many lines matched in all.
+        self.positions: Deque[int] = deque(maxlen=MAX_MATCH_POSITIONS)
+        self.matches = 0
+        # The first matching line itself, so waits on it resolve at once.
+        self.first: Optional[Tuple[int, Any]] = None
+        self.waiters: List["asyncio.Future[Tuple[int, Any]]"] = []
+
+    def hit(self, position: int, line: Any) -> None:
+        self.positions.append(position)
+        self.matches += 1
+        if self.first is None:
+            self.first = (position, line)
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result((position, line))
+
+
+def _scoped(regex: Pattern[str]) -> str:
+    flags = "".join(letter for flag, letter in _SCOPED_FLAGS if regex.flags & flag)
+    return f"(?{flags}:{regex.pattern})" if flags else f"(?:{regex.pattern})"
+
+
+class PatternMatcher:
+    """Evaluates a set of regexes incrementally, one line at a time.
+
+    Every tracked pattern is folded into one compiled alternation, so a line
+    that matches none of them (the common case) costs a single ``search``
+    however many patterns are tracked; only lines the alternation hits are
+    checked against every pattern on its own. Per pattern the positions of
+    the last ``MAX_MATCH_POSITIONS`` matching lines and a count of all of them
+    are kept, and waiters are resolved with the first line that matches.
+
+    A pattern with a ``service`` only matches lines of that service. Patterns
+    are matched against the message, without the compose prefix.
+    """
+
+    def __init__(self) -> None:
+        """Create a matcher tracking no patterns."""
+        self._tracked: Dict[PatternKey, _Tracked] = {}
+        self._combined: Optional[Pattern[str]] = None
+        self._stale = False
+        self._closed: Optional[BaseException] = None
+
+    @property
+    def active(self) -> bool:
+        """Whether any pattern is tracked (so lines need to be fed at all)."""
+        return bool(self._tracked)
+
+    @staticmethod
+    def key(pattern: Union[str, Pattern[str]], service: Optional[str] = None) -> PatternKey:
+        """The key a pattern (and service filter) is tracked under."""
+        regex = re.compile(pattern)
+        return regex.pattern, regex.flags, service
+
+    def track(self, pattern: Union[str, Pattern[str]], service: Optional[str], lines: Iterable[Tuple[int, Optional[str], str, Any]]) -> _Tracked:
+        """Track *pattern*, first catching up on the already seen *lines*.
+
+        *lines* are ``(position, service, message, line)`` tuples; they are
+        only scanned the first time a pattern is tracked.
+        """
+        key = self.key(pattern, service)
+        tracked = self._tracked.get(key)
+        if tracked is None:
+            tracked = self._tracked[key] = _Tracked(re.compile(pattern), service)
+            self._stale = True
+            for position, line_service, message, line in lines:
+                if (service is None or service == line_service) and tracked.regex.search(message):
+                    tracked.hit(position, line)
+        return tracked
+
+    def positions(self, pattern: Union[str, Pattern[str]], service: Optional[str] = None) -> List[int]:
+        """The positions of the (at most ``MAX_MATCH_POSITIONS``) most recent lines that matched a tracked pattern."""
+        tracked = self._tracked.get(self.key(pattern, service))
+        return list(tracked.positions) if tracked is not None else []
+
+    def count(self, pattern: Union[str, Pattern[str]], service: Optional[str] = None) -> int:
+        """How many lines matched a tracked pattern so far."""
+        tracked = self._tracked.get(self.key(pattern, service))
+        return tracked.matches if tracked is not None else 0
+
+    def _compile(self) -> Optional[Pattern[str]]:
+        if self._stale:
+            self._stale = False
+            try:
+                self._combined = re.compile("|".join(_scoped(tracked.regex) for tracked in self._tracked.values()))
+            except re.error:
+                # e.g. numbered backreferences, which shift when combined.
+                self._combined = None
+        return self._combined
+
+    def feed(self, position: int, service: Optional[str], message: str, line: Any) -> None:
+        """Evaluate every tracked pattern on one new line."""
+        if not self._tracked:
+            return
+        combined = self._compile()
+        if combined is not None and combined.search(message) is None:
+            return
+        for tracked in self._tracked.values():
+            if (tracked.service is None or tracked.service == service) and tracked.regex.search(message):
+                tracked.hit(position, line)
+
+    async def await_match(self, tracked: _Tracked, timeout: Optional[float] = None) -> Tuple[int, Any]:
+        """Wait for the first line matching *tracked* (at once if one did)."""
+        if tracked.first is not None:
+            return tracked.first
+        if self._closed is not None:
+            raise self._closed
+        waiter: "asyncio.Future[Tuple[int, Any]]" = asyncio.get_running_loop().create_future()
+        tracked.waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            if waiter in tracked.waiters:
+                tracked.waiters.remove(waiter)
+
+    def close(self, error: BaseException) -> None:
+        """Fail every pending (and later) wait with *error*: no more lines will come."""
+        self._closed = error
+        for tracked in self._tracked.values():
+            waiters, tracked.waiters = tracked.waiters, []
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(error)
+
+    def reset(self) -> None:
+        """Forget every tracked pattern, e.g. when a watcher starts again."""
+        self._tracked = {}
+        self._combined = None
+        self._stale = False
+        self._closed = None
@@ -0,0 +1,149 @@
+import re
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, Optional, Tuple, Union
+
+_REPLICA = re.compile(r"^(?P<service>.+?)[-_](?P<replica>\d+)$")
+# The compose prefix ("web-1  | "); its trailing space is gone on empty lines.
+_PREFIX = re.compile(r"^(\S+)\s+\|(?: |$)")
+_RAW_PREFIX = re.compile(rb"^(\S+)\s+\|(?: |$)")
+
+
+def split_prefix(line: str) -> Tuple[Optional[str], str]:
+    """Split a compose log line into its prefix (``web-1``) and the rest.
+
+    Returns ``(None, line)`` for lines without a prefix. Only a prefix at the
+    start of the line counts, so pipes in unprefixed lines are left alone.
+    """
+    match = _PREFIX.match(line)
+    if match is None:
+        return None, line
+    return match.group(1), line[match.end() :]
+
+
+def split_raw_prefix(line: bytes) -> Tuple[Optional[str], bytes]:
+    """Like ``split_prefix``, for raw (bytes) lines; the prefix is decoded."""
+    match = _RAW_PREFIX.match(line)
+    if match is None:
+        return None, line
+    return match.group(1).decode("utf-8", "replace"), line[match.end() :]
+
+
+def parse_prefix(prefix: str) -> Tuple[str, Optional[int]]:
+    """Split a container prefix (``web-1``, ``project_web_1``) into service and replica."""
+    match = _REPLICA.match(prefix)
+    if match is None:
+        return prefix, None
+    return match.group("service"), int(match.group("replica"))
+
+
+class LogRecord:
+    """One compose log line, parsed.
+
+    ``service`` and ``replica`` come from the compose prefix (``web-1  | ``),
+    ``timestamp`` from the leading RFC 3339 time ``--timestamps`` adds
+    (truncated to microseconds), and ``message`` is what is left. ``stream``
+    is ``"STDOUT"`` or ``"STDERR"``. Lines without a prefix (e.g. compose's
+    own warnings) have no service.
+
+    Records use ``__slots__``, so keeping many of them is cheap.
+    """
+
+    __slots__ = ("service", "replica", "stream", "timestamp", "message")
+
+    def __init__(
+        self,
+        service: Optional[str],
+        replica: Optional[int],
+        stream: str,
+        timestamp: Optional[datetime],
+        message: str,
+    ) -> None:
+        """Create a record from its parsed fields."""
+        self.service = service
+        self.replica = replica
+        self.stream = stream
+        self.timestamp = timestamp
+        self.message = message
+
+    @classmethod
+    def parse(cls, log: Tuple[str, Union[str, bytes]], timestamps: bool = False) -> "LogRecord":
+        """Parse a ``(source, line)`` tuple as ``CLI.astream_docker_logs`` yields it.
+
+        Pass *timestamps* when the logs were streamed with ``timestamps=True``.
+        Raw (bytes) lines are decoded, replacing invalid UTF-8.
+        """
+        stream, line = log
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace").strip()
+        prefix, message = split_prefix(line)
+        service, replica = parse_prefix(prefix) if prefix is not None else (None, None)
+
+        timestamp = None
+        if timestamps:
+            stamp, _, rest = message.partition(" ")
+            try:
+                timestamp = datetime.fromisoformat(stamp)
+            except ValueError:
+                pass
+            else:
+                message = rest
+        return cls(service, replica, stream, timestamp, message)
+
+    @property
+    def prefix(self) -> Optional[str]:
+        """The compose prefix of the line (``web-1``), None without a service."""
+        if self.service is None:
+            return None
+        return self.service if self.replica is None else f"{self.service}-{self.replica}"
+
+    def as_log(self) -> Tuple[str, str]:
+        """The record as a ``(source, text)`` tuple, prefixed like compose does."""
+        prefix = self.prefix
+        return self.stream, self.message if prefix is None else f"{prefix}  | {self.message}"
+
+    def __eq__(self, other: object) -> bool:
+        """Records are equal when all their fields are."""
+        if not isinstance(other, LogRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        """Representation of the record."""
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"LogRecord({fields})"
+
+
+def as_utc(timestamp: datetime) -> datetime:
+    """*timestamp*, taken as UTC if it is naive."""
+    return timestamp.replace(tzinfo=timezone.utc) if timestamp.tzinfo is None else timestamp
+
+
+def filter_records(
+    records: Iterable[LogRecord],
+    service: Union[str, Iterable[str], None] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    stream: Optional[str] = None,
+) -> Iterator[LogRecord]:
+    """Yield the records of *service(s)* and *stream* within ``[since, until)``.
+
+    Time bounds only match records that carry a timestamp. Naive bounds (and
+    timestamps) are taken as UTC, the time docker logs in.
+    """
+    services: Any = {service} if isinstance(service, str) else (set(service) if service is not None else None)
+    since = as_utc(since) if since is not None else None
+    until = as_utc(until) if until is not None else None
+    for record in records:
+        if services is not None and record.service not in services:
+            continue
+        if stream is not None and record.stream != stream:
+            continue
+        if since is not None or until is not None:
+            if record.timestamp is None:
+                continue
+            timestamp = as_utc(record.timestamp)
+            if since is not None and timestamp < since:
+                continue
+            if until is not None and timestamp >= until:
+                continue
+        yield record
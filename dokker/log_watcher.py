@@ -1,70 +1,425 @@
+import codecs
 import inspect
+import os
+from array import array
+from collections import deque
+from collections.abc import MutableSequence, Sequence
+from datetime import datetime
 from types import TracebackType
 from koil.composition import KoiledModel
 import asyncio
-from typing import Optional, List, Self, Tuple, Type, Union, Generator
+from typing import Any, Callable, Deque, Iterable, Iterator, Optional, List, Pattern, Self, Tuple, Type, Union, Generator, overload
+from koil import unkoil
 from dokker.cli import CLIBearer
-from pydantic import Field
+from dokker.command import ResourceUsage
+from dokker.errors import LogPatternNotFoundError
+from dokker.log_archive import LogArchive, archive_path
+from dokker.log_hub import LogHub
+from dokker.log_matcher import PatternMatcher
+from dokker.log_record import LogRecord, filter_records, parse_prefix, split_prefix
+from pydantic import Field, PrivateAttr
 
-from dokker.types import LogFunction
+from dokker.types import LogFunction, RawLogFunction, RecordFunction
 
 
 def format_log_watcher_message(watcher: "LogWatcher", exc_val: Optional[BaseException], rich: bool = True) -> str:
-    """Formats the log watcher message for the exception."""
+    """Formats the log watcher message for the exception.
+
+    With a log archive only the last ``traceback_lines`` lines are read back
+    from it, however long the run was.
+    """
+    archive = watcher.log_archive
+    if archive is not None:
+        tail = archive.tail(watcher.traceback_lines)
+        logs: Iterable[Tuple[str, str]] = [record.as_log() for record in tail]
+        dropped = len(archive) - len(tail)
+    else:
+        logs = watcher.collected_logs
+        dropped = watcher.collected_logs.dropped
     extra_info = map(
         lambda x: x[1] if x[0] == "STDERR" or watcher.capture_stdout else "",
-        watcher.collected_logs,
+        logs,
     )
     # Ensure compatibility with different exception types
 
     extra_info_str = "\n".join(extra_info)
-    return f"{str(exc_val)}\n\nDuring the execution Logwatcher captured these logs from the services {watcher.services}:\n{extra_info_str}"
+    if archive is not None and dropped:
+        dropped_str = f" ({dropped} earlier lines are in the archive at {archive.directory})"
+    else:
+        dropped_str = f" ({dropped} earlier lines were dropped)" if dropped else ""
+    return f"{str(exc_val)}\n\nDuring the execution Logwatcher captured these logs from the services {watcher.services}{dropped_str}:\n{extra_info_str}"
+
+
+# Sources are stored as one byte per line; the index is the stored code.
+_SOURCES = ("STDOUT", "STDERR")
+_SOURCE_CODES = {source: code for code, source in enumerate(_SOURCES)}
+
+
+def _decode_errors(exc: UnicodeError) -> Tuple[str, int]:
+    # Text appended as str is stored with "surrogatepass" so lone surrogates
+    # round-trip; bytes appended in raw mode may be any garbage, which is
+    # replaced instead of making every read of the roll raise.
+    try:
+        return codecs.lookup_error("surrogatepass")(exc)
+    except UnicodeDecodeError:
+        return codecs.replace_errors(exc)
+
+
+_DECODE_ERRORS = "dokker.logroll"
+codecs.register_error(_DECODE_ERRORS, _decode_errors)
+
+# Index arrays start out 32-bit and are widened to 64-bit only once a value
+# (an arena offset past 4 GiB) no longer fits.
+_NARROW_INDEX = "I" if array("I").itemsize == 4 else "L"
+
+
+def _index_append(index: array, value: int) -> array:
+    try:
+        index.append(value)
+        return index
+    except OverflowError:
+        wide = array("Q", index)
+        wide.append(value)
+        return wide
+
+
+# Evicted lines stay in the arena until at least this many have piled up (and
+# they outnumber the retained ones); then the arrays are compacted in one go.
+_COMPACT_THRESHOLD = 1024
 
 
-class LogRoll(list[tuple[str, str]]):
+class LogRoll(MutableSequence[Tuple[str, str]]):
     """A class to roll logs from the log watcher.
 
     Besides the collected ``(source, text)`` log lines, a ``LogRoll`` returned
     by ``Deployment.run`` / ``arun`` carries the ``returncode`` of the command
     that produced it, so callers can inspect the exit code even when they chose
-    not to raise on a non-zero result.
+    not to raise on a non-zero result, and its ``usage``: the wall time, CPU
+    time and peak memory of the compose process(es) (see ``ResourceUsage``).
+
+    Lines are stored column-wise rather than as one tuple per line: every line
+    is one packed 32-bit entry holding its source (stdout or stderr) and its
+    position within that stream, and the text lives UTF-8 encoded in an
+    append-only arena per stream (newline separated) with a 32-bit offset
+    index. Text is only decoded when it is read, and ``stdout``/``stderr`` (and
+    their ``_list`` variants) decode just the span of their own stream instead
+    of scanning every line.
+
+    A ``LogRoll`` supports the list operations (``append``, ``extend``,
+    ``insert``, item and slice assignment and deletion, ``pop``, ``remove``,
+    ``reverse``, ``sort``, ``copy``, ``+=``). Appending is cheap; the other
+    mutators rebuild the arenas and cost O(n). It is not a ``list`` subclass
+    though, so ``isinstance(roll, list)`` is false; use ``list(roll)`` where a
+    real list is needed.
+
+    By default a ``LogRoll`` keeps every line. Pass ``max_lines`` and/or
+    ``max_bytes`` to make it a fixed-capacity ring buffer instead: once a cap is
+    reached the oldest lines are evicted (and counted in ``dropped``), so a
+    long-running follow-stream only ever keeps the most recent window. The most
+    recent line is always retained, even if it alone exceeds ``max_bytes``.
     """
 
-    returncode: Optional[int] = None
+    def __init__(
+        self,
+        logs: Iterable[Tuple[str, str]] = (),
+        max_lines: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        """Create a LogRoll, optionally bounded by line count and/or bytes."""
+        if max_lines is not None and max_lines < 1:
+            raise ValueError("max_lines must be at least 1")
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1")
+
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.returncode: Optional[int] = None
+        self.usage: Optional[ResourceUsage] = None
+        self.dropped = 0
+        self._reset()
+        self.extend(logs)
+
+    def _reset(self) -> None:
+        # Per physical line: its position within its stream, shifted left by
+        # one, with its source code in the low bit.
+        self._lines = array(_NARROW_INDEX)
+        # Per stream: the newline-terminated text of its lines, and the offset
+        # at which each line starts (plus the end of the arena).
+        self._arenas = (bytearray(), bytearray())
+        self._offsets = (array(_NARROW_INDEX, [0]), array(_NARROW_INDEX, [0]))
+        # The first physical line, and the first line of each stream, that has
+        # not been evicted.
+        self._head = 0
+        self._stream_heads = [0, 0]
+        # Whether any line contains a newline itself, which rules out splitting
+        # a decoded stream back into its lines.
+        self._multiline = False
+
+    @property
+    def bounded(self) -> bool:
+        """Whether this roll evicts old lines once a cap is reached."""
+        return self.max_lines is not None or self.max_bytes is not None
+
+    @property
+    def nbytes(self) -> int:
+        """The total UTF-8 size of the retained log text."""
+        spans = sum(offsets[-1] - offsets[head] for offsets, head in zip(self._offsets, self._stream_heads))
+        # Every retained line carries one separator byte.
+        return spans - len(self)
+
+    def append(self, log: Tuple[str, str]) -> None:
+        """Append a ``(source, text)`` line, evicting old lines if bounded."""
+        source, text = log
+        self._store(source, text.encode("utf-8", "surrogatepass"))
+
+    def append_bytes(self, log: Tuple[str, bytes]) -> None:
+        """Append a raw ``(source, data)`` line without decoding it.
+
+        The bytes are stored as they are; invalid UTF-8 is only replaced when
+        the line is read back as text.
+        """
+        source, data = log
+        self._store(source, data)
+
+    def _store(self, source: str, data: bytes) -> None:
+        try:
+            code = _SOURCE_CODES[source]
+        except KeyError:
+            raise ValueError(f"Unknown log source {source!r}, expected one of {_SOURCES}") from None
+
+        if b"\n" in data:
+            self._multiline = True
+
+        # The line count is taken from _lines, so it is written last: a reader
+        # never sees a line whose text is not there yet.
+        arena, offsets = self._arenas[code], self._offsets[code]
+        position = len(offsets) - 1
+        arena += data
+        arena += b"\n"
+        widened = _index_append(offsets, len(arena))
+        if widened is not offsets:
+            self._offsets = (widened, self._offsets[1]) if code == 0 else (self._offsets[0], widened)
+        self._lines = _index_append(self._lines, position << 1 | code)
+
+        if self.bounded:
+            self._evict()
+
+    def _evict(self) -> None:
+        while (self.max_lines is not None and len(self) > self.max_lines) or (self.max_bytes is not None and self.nbytes > self.max_bytes and len(self) > 1):
+            # Lines are evicted oldest first, so this is also the oldest line
+            # of its stream.
+            self._stream_heads[self._lines[self._head] & 1] += 1
+            self._head += 1
+            self.dropped += 1
+
+        if self._head >= _COMPACT_THRESHOLD and self._head >= len(self):
+            self._compact()
+
+    def _compact(self) -> None:
+        # Build new arrays instead of deleting in place, so a reader that
+        # captured the old ones (e.g. a watcher's logs read from another
+        # thread) keeps a consistent view.
+        head, (out_head, err_head) = self._head, self._stream_heads
+        out_base, err_base = self._offsets[0][out_head], self._offsets[1][err_head]
+        lines = array(self._lines.typecode, (entry - ((err_head if entry & 1 else out_head) << 1) for entry in self._lines[head:]))
+        self._arenas = (self._arenas[0][out_base:], self._arenas[1][err_base:])
+        self._offsets = (
+            array(self._offsets[0].typecode, (offset - out_base for offset in self._offsets[0][out_head:])),
+            array(self._offsets[1].typecode, (offset - err_base for offset in self._offsets[1][err_head:])),
+        )
+        self._lines = lines
+        self._head = 0
+        self._stream_heads = [0, 0]
+
+    def extend(self, logs: Iterable[Tuple[str, str]]) -> None:
+        """Append every line of *logs*."""
+        for log in logs:
+            self.append(log)
+
+    def clear(self) -> None:
+        """Remove every retained line (``dropped`` is kept)."""
+        self._reset()
+
+    def _raw_lines(self) -> List[Tuple[str, bytes]]:
+        lines, arenas, offsets = self._lines, self._arenas, self._offsets
+        raw = []
+        for line in range(self._head, len(lines)):
+            code, position = lines[line] & 1, lines[line] >> 1
+            raw.append((_SOURCES[code], bytes(arenas[code][offsets[code][position] : offsets[code][position + 1] - 1])))
+        return raw
+
+    def _rebuild(self, edit: Callable[[List[Tuple[str, bytes]]], None]) -> None:
+        # Anything but appending rewrites the arenas. The edit runs on a copy
+        # first, so a failing one (a bad index, an unknown source) leaves the
+        # roll as it was.
+        lines = self._raw_lines()
+        edit(lines)
+        for source, _ in lines:
+            if source not in _SOURCE_CODES:
+                raise ValueError(f"Unknown log source {source!r}, expected one of {_SOURCES}")
+        self._reset()
+        for source, data in lines:
+            self._store(source, data)
+
+    @staticmethod
+    def _encode(log: Tuple[str, str]) -> Tuple[str, bytes]:
+        source, text = log
+        return source, text.encode("utf-8", "surrogatepass")
+
+    @overload
+    def __setitem__(self, index: int, log: Tuple[str, str]) -> None: ...
+
+    @overload
+    def __setitem__(self, index: slice, log: Iterable[Tuple[str, str]]) -> None: ...
+
+    def __setitem__(self, index: Union[int, slice], log: Any) -> None:
+        """Replace a line, or the lines of a slice."""
+        if isinstance(index, slice):
+            logs = [self._encode(line) for line in log]
+
+            def edit(lines: List[Tuple[str, bytes]]) -> None:
+                lines[index] = logs
+
+        else:
+            encoded = self._encode(log)
+
+            def edit(lines: List[Tuple[str, bytes]]) -> None:
+                lines[index] = encoded
+
+        self._rebuild(edit)
+
+    def __delitem__(self, index: Union[int, slice]) -> None:
+        """Remove a line, or the lines of a slice."""
+
+        def edit(lines: List[Tuple[str, bytes]]) -> None:
+            del lines[index]
+
+        self._rebuild(edit)
+
+    def insert(self, index: int, log: Tuple[str, str]) -> None:
+        """Insert a line before *index*, evicting old lines if bounded."""
+        encoded = self._encode(log)
+        self._rebuild(lambda lines: lines.insert(index, encoded))
+
+    def reverse(self) -> None:
+        """Reverse the retained lines in place."""
+        self._rebuild(lambda lines: lines.reverse())
+
+    def sort(self, *, key: Optional[Callable[[Tuple[str, str]], Any]] = None, reverse: bool = False) -> None:
+        """Sort the retained lines in place, like ``list.sort``."""
+        logs = [self._encode(log) for log in sorted(self, key=key, reverse=reverse)]
+
+        def edit(lines: List[Tuple[str, bytes]]) -> None:
+            lines[:] = logs
+
+        self._rebuild(edit)
+
+    def copy(self) -> "LogRoll":
+        """A copy of the roll with the same caps, ``returncode`` and ``usage``."""
+        roll = LogRoll(max_lines=self.max_lines, max_bytes=self.max_bytes)
+        for log in self._raw_lines():
+            roll.append_bytes(log)
+        roll.returncode, roll.usage, roll.dropped = self.returncode, self.usage, self.dropped
+        return roll
+
+    def __add__(self, other: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Concatenate into a plain list, like ``list + list``."""
+        return [*self, *other]
+
+    def _line(self, line: int) -> Tuple[str, str]:
+        entry = self._lines[line]
+        code, position = entry & 1, entry >> 1
+        offsets = self._offsets[code]
+        return _SOURCES[code], self._arenas[code][offsets[position] : offsets[position + 1] - 1].decode("utf-8", _DECODE_ERRORS)
+
+    def __len__(self) -> int:
+        """The number of retained lines."""
+        return len(self._lines) - self._head
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        """Iterate the retained lines, oldest first."""
+        lines, arenas, offsets = self._lines, self._arenas, self._offsets
+        for line in range(self._head, len(lines)):
+            code, position = lines[line] & 1, lines[line] >> 1
+            yield _SOURCES[code], arenas[code][offsets[code][position] : offsets[code][position + 1] - 1].decode("utf-8", _DECODE_ERRORS)
+
+    @overload
+    def __getitem__(self, index: int) -> Tuple[str, str]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Tuple[str, str]]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Tuple[str, str], List[Tuple[str, str]]]:
+        """Return a retained line, or a list of lines for a slice."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("LogRoll index out of range")
+        return self._line(self._head + index)
+
+    def __eq__(self, other: object) -> bool:
+        """Compare the retained lines with another sequence of lines."""
+        if isinstance(other, (LogRoll, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        """Representation of the log roll."""
+        return f"LogRoll({list(self)!r})"
+
+    def _stream_span(self, code: int) -> bytearray:
+        offsets = self._offsets[code]
+        # Without the trailing separator of the last line.
+        return self._arenas[code][offsets[self._stream_heads[code]] : offsets[-1] - 1]
+
+    def _stream_str(self, code: int) -> str:
+        return self._stream_span(code).decode("utf-8", _DECODE_ERRORS)
+
+    def _stream_list(self, code: int) -> List[str]:
+        if len(self._offsets[code]) - 1 == self._stream_heads[code]:
+            return []
+        if not self._multiline:
+            return self._stream_str(code).split("\n")
+
+        arena, offsets = self._arenas[code], self._offsets[code]
+        return [arena[offsets[i] : offsets[i + 1] - 1].decode("utf-8", _DECODE_ERRORS) for i in range(self._stream_heads[code], len(offsets) - 1)]
+
+    def _stream_gen(self, code: int) -> Generator[str, None, None]:
+        yield from self._stream_list(code)
 
     @property
     def stdout_gen(self) -> Generator[str, None, None]:
         """Generator for stdout logs."""
-        for log, x in self:
-            if log == "STDOUT":
-                yield x
+        return self._stream_gen(0)
 
     @property
     def stderr_gen(self) -> Generator[str, None, None]:
         """Generator for stderr logs."""
-        for log, x in self:
-            if log == "STDERR":
-                yield x
+        return self._stream_gen(1)
 
     @property
     def stderr_list(self) -> List[str]:
         """List of stderr logs."""
-        return list(self.stderr_gen)
+        return self._stream_list(1)
 
     @property
     def stdout_list(self) -> List[str]:
         """List of stdout logs."""
-        return list(self.stdout_gen)
+        return self._stream_list(0)
 
     @property
     def stdout(self) -> str:
         """String of stdout logs joined by new lines."""
-        return "\n".join(self.stdout_gen)
+        return self._stream_str(0)
 
     @property
     def stderr(self) -> str:
         """String of stderr logs joined by new lines."""
-        return "\n".join(self.stderr_gen)
+        return self._stream_str(1)
 
     def __str__(self) -> str:
         """String representation of the log roll."""
@@ -72,7 +427,30 @@ class LogRoll(list[tuple[str, str]]):
 
 
 class LogWatcher(KoiledModel):
-    """A class to watch logs from a Docker container."""
+    """A class to watch logs from a Docker container.
+
+    With a ``hub`` (as ``Deployment.create_watcher`` sets up), a following
+    watcher subscribes to the hub's shared log stream instead of spawning a
+    ``docker compose logs`` process of its own.
+
+    With ``structured`` every line is parsed once into a ``LogRecord``
+    (service, replica, stream, timestamp and message): ``log_function`` is
+    called with the records, ``records`` keeps them (up to ``max_lines``) and
+    ``select`` filters them by service, stream or time window.
+    ``collected_logs`` still holds the lines as text.
+
+    ``await_pattern`` waits until a line matches a regex. Waited-for patterns
+    are evaluated incrementally on every new line by one compiled matcher
+    (see ``PatternMatcher``), which also counts the matching lines
+    (``match_count``) and indexes the positions of the most recent ones
+    (``match_positions``).
+
+    With ``archive`` every line is also appended to a ``LogArchive`` on disk
+    (by default under ``.dokker/<project>/logs/<time of enter>``), so a long
+    run can keep only a small window in memory and still be queried in full,
+    during the run or afterwards with ``LogArchive.open``. Tracebacks then
+    only show the last ``traceback_lines`` lines, read back from the archive.
+    """
 
     cli_bearer: CLIBearer
     tail: Optional[int] = None
@@ -87,15 +465,121 @@ class LogWatcher(KoiledModel):
     wait_for_logs: bool = False
     wait_for_logs_timeout: int = 10
     collected_logs: LogRoll = Field(default_factory=LogRoll)
-    log_function: Optional[LogFunction] = None
+    max_lines: Optional[int] = None
+    max_bytes: Optional[int] = None
+    log_function: Optional[Union[LogFunction, RawLogFunction, RecordFunction]] = None
+    raw: bool = False
+    structured: bool = Field(default=False, description="Parse every line into a `LogRecord` (ignores `raw` and `no_log_prefix`).")
+    errors: str = "strict"
     append_to_traceback: bool = True
     capture_stdout: bool = True
     rich_traceback: bool = True
+    hub: Optional[LogHub] = Field(default=None, description="The hub to share follow streams through.")
+    archive: bool = Field(default=False, description="Also append every line to a compressed on-disk `LogArchive`.")
+    archive_dir: Optional[str] = Field(default=None, description="The directory of the archive; by default a new run under `.dokker/<project>/logs`.")
+    archive_segment_bytes: int = Field(default=64 * 1024 * 1024, description="Start a new archive segment once one reaches this size.")
+    traceback_lines: int = Field(default=100, description="How many of the last archived lines to append to a traceback.")
 
     _watch_task: Optional[asyncio.Task[None]] = None
     _just_one_log: Optional[asyncio.Future[bool]] = None
+    _records: Deque[LogRecord] = PrivateAttr(default_factory=deque)
+    _matcher: PatternMatcher = PrivateAttr(default_factory=PatternMatcher)
+    _position: int = PrivateAttr(default=0)
+    _archive: Optional[LogArchive] = PrivateAttr(default=None)
+
+    @property
+    def log_archive(self) -> Optional[LogArchive]:
+        """The archive of the current (or last) run, if ``archive`` is set."""
+        return self._archive
 
-    async def aon_logs(self, log: Tuple[str, str]) -> None:
+    @property
+    def records(self) -> List[LogRecord]:
+        """The parsed records collected in ``structured`` mode, oldest first."""
+        return list(self._records)
+
+    def select(
+        self,
+        service: Union[str, Iterable[str], None] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        stream: Optional[str] = None,
+    ) -> List[LogRecord]:
+        """The collected records of *service(s)* and *stream* within ``[since, until)``.
+
+        Only available in ``structured`` mode; time bounds need ``timestamps``.
+        """
+        return list(filter_records(self._records, service=service, since=since, until=until, stream=stream))
+
+    def _split(self, log: Union[Tuple[str, Union[str, bytes]], LogRecord]) -> Tuple[Optional[str], str]:
+        """The service and the message of a collected line."""
+        if isinstance(log, LogRecord):
+            return log.service, log.message
+        line = log[1]
+        text = line.decode("utf-8", "replace") if isinstance(line, bytes) else line
+        prefix, message = split_prefix(text)
+        if prefix is not None:
+            return parse_prefix(prefix)[0], message
+        services = [self.services] if isinstance(self.services, str) else self.services
+        return (services[0] if len(services) == 1 else None), message
+
+    def _retained(self) -> Iterator[Tuple[int, Optional[str], str, Any]]:
+        lines: Sequence[Any] = self._records if self.structured else self.collected_logs
+        start = self._position - len(lines)
+        for offset, line in enumerate(lines):
+            service, message = self._split(line)
+            yield start + offset, service, message, line
+
+    async def await_pattern(self, pattern: Union[str, Pattern[str]], service: Optional[str] = None, timeout: Optional[float] = None) -> Any:
+        """Wait until a log line matches *pattern*.
+
+        Lines already collected count too, so a "ready" logged before the
+        call is found at once. The regex is searched in the message of every
+        line (without the compose prefix), of *service* only if given.
+
+        Parameters
+        ----------
+        pattern : Union[str, Pattern[str]]
+            The regex to search for.
+        service : Optional[str], optional
+            Only match lines of this service.
+        timeout : Optional[float], optional
+            How long to wait, by default forever.
+
+        Returns
+        -------
+        Union[Tuple[str, str], LogRecord]
+            The first matching line, as collected (a ``LogRecord`` in
+            ``structured`` mode).
+
+        Raises
+        ------
+        LogPatternNotFoundError
+            If no line matched within *timeout*, or the log stream ended.
+        """
+        tracked = self._matcher.track(pattern, service, self._retained())
+        try:
+            _, line = await self._matcher.await_match(tracked, timeout)
+        except asyncio.TimeoutError:
+            where = f" in the logs of {service}" if service else ""
+            raise LogPatternNotFoundError(f"No line matched {tracked.regex.pattern!r}{where} within {timeout}s.") from None
+        return line
+
+    def wait_for_pattern(self, pattern: Union[str, Pattern[str]], service: Optional[str] = None, timeout: Optional[float] = None) -> Any:
+        """Wait until a log line matches *pattern*. (sync)
+
+        See ``await_pattern``.
+        """
+        return unkoil(self.await_pattern, pattern, service=service, timeout=timeout)
+
+    def match_positions(self, pattern: Union[str, Pattern[str]], service: Optional[str] = None) -> List[int]:
+        """The positions (counted from the first line watched) of the most recent lines matching a waited-for pattern."""
+        return self._matcher.positions(pattern, service)
+
+    def match_count(self, pattern: Union[str, Pattern[str]], service: Optional[str] = None) -> int:
+        """How many lines matched a waited-for pattern so far."""
+        return self._matcher.count(pattern, service)
+
+    async def aon_logs(self, log: Any) -> None:
         """Asynchronous function to handle logs."""
         if self.log_function:
             if inspect.iscoroutinefunction(self.log_function):
@@ -105,7 +589,45 @@ class LogWatcher(KoiledModel):
 
     async def awatch_logs(self) -> None:
         """Asynchronous function to watch logs."""
+        try:
+            await self._astream()
+        finally:
+            self._matcher.close(LogPatternNotFoundError(f"The log stream of {self.services or 'all services'} ended."))
+
+    async def _astream(self) -> None:
+        raw = self.raw and not self.structured
+        if self.hub is not None and self.follow:
+            async with self.hub.subscribe(
+                self.services,
+                tail=str(self.tail) if self.tail else None,
+                no_log_prefix=self.no_log_prefix,
+                timestamps=self.timestamps,
+                since=self.since,
+                until=self.until,
+                raw=raw,
+                errors=self.errors,
+                structured=self.structured,
+                max_lines=self.max_lines,
+                max_bytes=self.max_bytes,
+            ) as subscription:
+                async for logtuple in subscription:
+                    await self._acollect(logtuple)
+            return
+
         cli = await self.cli_bearer.aget_cli()
+        if self.structured:
+            async for record in cli.astream_log_records(
+                tail=str(self.tail) if self.tail else None,
+                follow=self.follow,
+                timestamps=self.timestamps,
+                since=self.since,
+                until=self.until,
+                services=self.services,
+                errors=self.errors,
+            ):
+                await self._acollect(record)
+            return
+
         async for logtuple in cli.astream_docker_logs(
             tail=str(self.tail) if self.tail else None,
             follow=self.follow,
@@ -114,15 +636,42 @@ class LogWatcher(KoiledModel):
             since=self.since,
             until=self.until,
             services=self.services,
+            raw=self.raw,
+            errors=self.errors,
         ):
-            if self._just_one_log is not None and not self._just_one_log.done():
-                self._just_one_log.set_result(True)
-            await self.aon_logs(logtuple)
+            await self._acollect(logtuple)
+
+    async def _acollect(self, logtuple: Union[Tuple[str, Union[str, bytes]], LogRecord]) -> None:
+        if self._just_one_log is not None and not self._just_one_log.done():
+            self._just_one_log.set_result(True)
+        await self.aon_logs(logtuple)
+        if isinstance(logtuple, LogRecord):
+            self._records.append(logtuple)
+            self.collected_logs.append(logtuple.as_log())
+        elif self.raw:
+            self.collected_logs.append_bytes(logtuple)
+        else:
             self.collected_logs.append(logtuple)
+        if self._archive is not None:
+            await self._archive.aappend(logtuple if isinstance(logtuple, LogRecord) else LogRecord.parse(logtuple, timestamps=self.timestamps))
+        if self._matcher.active:
+            service, message = self._split(logtuple)
+            self._matcher.feed(self._position, service, message, logtuple)
+        self._position += 1
 
     async def __aenter__(self) -> Self:
         """Asynchronous context manager to enter the log watcher."""
-        self.collected_logs = LogRoll()
+        self.collected_logs = LogRoll(max_lines=self.max_lines, max_bytes=self.max_bytes)
+        self._records = deque(maxlen=self.max_lines)
+        self._matcher.reset()
+        self._position = 0
+        self._archive = None
+        if self.archive:
+            directory = self.archive_dir
+            if directory is None:
+                cli = await self.cli_bearer.aget_cli()
+                directory = archive_path(os.path.join(os.getcwd(), ".dokker"), cli.project_name)
+            self._archive = LogArchive(directory, segment_bytes=self.archive_segment_bytes)
         self._just_one_log = asyncio.Future()
         self._watch_task = asyncio.create_task(self.awatch_logs())
 
@@ -165,3 +714,5 @@ class LogWatcher(KoiledModel):
                     pass
 
             self._watch_task = None
+            if self._archive is not None:
+                await self._archive.aclose()
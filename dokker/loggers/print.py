@@ -1,5 +1,6 @@
 from pydantic import BaseModel, ConfigDict
 from typing import Callable
+from dokker.command import ResourceUsage
 
 LogTuple = tuple[str, str]
 
@@ -60,3 +61,15 @@ class PrintLogger(BaseModel):
             The log to print
         """
         self.print_function(log)
+
+    def on_usage(self, operation: str, usage: ResourceUsage) -> None:
+        """A method for the resource usage of an operation
+
+        Parameters
+        ----------
+        operation : str
+            The operation (e.g. "up") the compose process(es) ran for
+        usage : ResourceUsage
+            What they cost
+        """
+        self.print_function(("USAGE", f"{operation}: {usage}"))
@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from dokker.command import ResourceUsage
 
 LogTuple = tuple[str, str]
 
@@ -56,3 +57,15 @@ class VoidLogger(BaseModel):
             The log to print
         """
         pass
+
+    def on_usage(self, operation: str, usage: ResourceUsage) -> None:
+        """A method for the resource usage of an operation
+
+        Parameters
+        ----------
+        operation : str
+            The operation (e.g. "up") the compose process(es) ran for
+        usage : ResourceUsage
+            What they cost
+        """
+        pass
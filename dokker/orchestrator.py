@@ -0,0 +1,182 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Self, Type, TypeVar
+from types import TracebackType
+
+from koil import unkoil
+from koil.composition import KoiledModel
+from pydantic import Field, PrivateAttr
+
+from dokker.deployment import Deployment
+from dokker.errors import DokkerError
+from dokker.log_watcher import LogRoll
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class OrchestrationError(DokkerError):
+    """Raised when one or more deployments of an orchestrator fail.
+
+    ``errors`` maps the name of every failed deployment to its exception.
+    """
+
+    def __init__(self, message: str, errors: Dict[str, BaseException]) -> None:
+        """Create an OrchestrationError carrying the per-deployment errors."""
+        self.errors = errors
+        super().__init__(message)
+
+
+def _describe(action: str, errors: Dict[str, BaseException]) -> str:
+    details = "\n".join(f"- {name}: {type(error).__name__}: {error}" for name, error in errors.items())
+    return f"{action} failed for {len(errors)} deployment(s):\n{details}"
+
+
+class Orchestrator(KoiledModel):
+    """Brings a set of deployments up and down concurrently.
+
+    Every deployment is entered, pulled (optionally), upped, inspected and
+    health-checked in parallel, with at most ``max_workers`` compose
+    invocations running at once across all of them. The ``LogRoll`` of every
+    pull and up is kept per deployment in ``logs``.
+
+    If any deployment fails to come up, the others are still allowed to
+    finish, then every deployment is downed (whatever its teardown policy)
+    and torn down in parallel, and an ``OrchestrationError`` names the ones
+    that failed. On exit the deployments
+    are torn down in parallel too; what a teardown does is decided by each
+    deployment's own teardown policy (or ``up(...)`` overrides).
+
+    ```python
+    with Orchestrator(deployments={"a": testing("a.yml"), "b": testing("b.yml")}) as stacks:
+        stacks.deployments["a"].spec
+    ```
+    """
+
+    deployments: Dict[str, Deployment] = Field(description="The deployments to orchestrate, by name.")
+    max_workers: Optional[int] = Field(
+        default=None,
+        description="The maximum number of compose invocations (pull, up, inspect, teardown) running at once. Defaults to the smallest `threadpool_workers` of the deployments.",
+    )
+    pull: bool = Field(default=True, description="Pull every deployment before bringing it up.")
+    check_health: bool = Field(default=True, description="Run the health checks of every deployment after bringing it up.")
+
+    _logs: Dict[str, Dict[str, LogRoll]] = PrivateAttr(default_factory=dict)
+    _semaphore: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+    _entered: List[str] = PrivateAttr(default_factory=list)
+
+    @property
+    def workers(self) -> int:
+        """The effective cap on concurrent compose invocations."""
+        if self.max_workers is not None:
+            return self.max_workers
+        return min((d.threadpool_workers for d in self.deployments.values()), default=1)
+
+    @property
+    def logs(self) -> Dict[str, Dict[str, LogRoll]]:
+        """The collected logs: deployment name -> phase ("pull", "up") -> LogRoll."""
+        return self._logs
+
+    async def _alimited(self, call: Callable[[], Awaitable[T]]) -> T:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        async with self._semaphore:
+            return await call()
+
+    async def _aup_one(self, name: str, deployment: Deployment) -> None:
+        await deployment.__aenter__()
+        self._entered.append(name)
+        logs = self._logs.setdefault(name, {})
+        if self.pull:
+            logs["pull"] = await self._alimited(deployment.apull)
+        logs["up"] = await self._alimited(deployment.aup)
+        await self._alimited(deployment.ainspect)
+        if self.check_health:
+            await deployment.acheck_health()
+
+    async def aup(self) -> Dict[str, Dict[str, LogRoll]]:
+        """Bring every deployment up concurrently.
+
+        Returns
+        -------
+        Dict[str, Dict[str, LogRoll]]
+            The pull and up logs of every deployment.
+
+        Raises
+        ------
+        OrchestrationError
+            If any deployment failed to come up. All deployments have been
+            downed and torn down by then.
+        """
+        names = list(self.deployments)
+        results = await asyncio.gather(*(self._aup_one(name, self.deployments[name]) for name in names), return_exceptions=True)
+        errors = {name: result for name, result in zip(names, results) if isinstance(result, BaseException)}
+        if errors:
+            try:
+                await self._ateardown(down=True)
+            except OrchestrationError as e:
+                logger.warning("Tearing down after a failed up also failed: %s", e)
+            raise OrchestrationError(_describe("Bringing up", errors), errors) from next(iter(errors.values()))
+        return self._logs
+
+    def up(self) -> Dict[str, Dict[str, LogRoll]]:
+        """Bring every deployment up concurrently. (sync)
+
+        See ``aup``.
+        """
+        return unkoil(self.aup)
+
+    async def _aexit_one(self, deployment: Deployment, down: bool) -> None:
+        try:
+            if down:
+                await deployment.adown()
+        finally:
+            await deployment.__aexit__(None, None, None)
+
+    async def _ateardown(self, down: bool) -> None:
+        names, self._entered = self._entered, []
+        results = await asyncio.gather(
+            *(self._alimited(lambda d=self.deployments[name]: self._aexit_one(d, down)) for name in names),
+            return_exceptions=True,
+        )
+        errors = {name: result for name, result in zip(names, results) if isinstance(result, BaseException)}
+        if errors:
+            raise OrchestrationError(_describe("Tearing down", errors), errors)
+
+    async def adown(self) -> None:
+        """Tear every entered deployment down concurrently.
+
+        What a teardown does is decided by each deployment's teardown policy.
+
+        Raises
+        ------
+        OrchestrationError
+            If any teardown failed; the others still ran to completion.
+        """
+        await self._ateardown(down=False)
+
+    def down(self) -> None:
+        """Tear every entered deployment down concurrently. (sync)
+
+        See ``adown``.
+        """
+        return unkoil(self.adown)
+
+    async def __aenter__(self) -> Self:
+        """Bring every deployment up (see ``aup``)."""
+        await self.aup()
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]], exc_val: Optional[BaseException], exc_tb: Optional[TracebackType]) -> None:
+        """Tear every deployment down (see ``adown``).
+
+        A teardown failure is only logged when another exception is already
+        propagating, so it cannot mask the original error.
+        """
+        try:
+            await self.adown()
+        except OrchestrationError as e:
+            if exc_type is None:
+                raise
+            logger.warning("Orchestrator teardown failed (while another error was propagating, not raising): %s", e)
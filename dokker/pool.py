@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Iterator, List, Literal, Optional, Self, Tuple, Type, Union
+from types import TracebackType
+
+from koil import unkoil
+from koil.composition import KoiledModel
+from pydantic import Field, PrivateAttr
+
+from dokker.builders import testing
+from dokker.deployment import Deployment, HealthCheck
+from dokker.errors import DokkerError
+from dokker.types import ValidPath
+
+logger = logging.getLogger(__name__)
+
+# What a failed reset or start of a stack raises: dokker's errors (a failed
+# compose call, health check or teardown), OS errors and timeouts.
+_STACK_ERRORS: Tuple[Type[BaseException], ...] = (DokkerError, OSError, asyncio.TimeoutError)
+
+ResetMode = Literal["restart", "volumes", "none"]
+"""How a pooled stack is reset between leases. See ``DeploymentPool``."""
+
+
+class PoolError(DokkerError):
+    """Raised when a deployment pool cannot hand out a stack."""
+
+
+class DeploymentPool(KoiledModel):
+    """A pool of pre-started, identical stacks of one compose project.
+
+    Starting a stack (pull, up, health checks) usually dominates the run time of
+    an integration test. A pool starts ``size`` stacks once, each a ``testing``
+    deployment with its own compose project name, and hands them out to tests
+    one lease at a time. When a lease ends the stack is reset and goes back to
+    the pool:
+
+    - ``"restart"`` restarts every service (fast; state in volumes survives),
+    - ``"volumes"`` downs the stack with its volumes and brings it up again
+      (slower, but every lease starts from a clean state),
+    - ``"none"`` hands the stack on as it is.
+
+    After a reset the health checks (and, with ``wait``, the container
+    readiness) are awaited again. A stack whose reset fails is torn down and
+    replaced by a fresh one; if no replacement starts, the pool shrinks by
+    one stack. On exit every stack is torn down in parallel
+    through the usual ``testing`` teardown policy.
+
+    Every stack runs the same compose files, so with more than one stack the
+    services must not publish fixed host ports (use e.g. ``"80"`` instead of
+    ``"8080:80"``).
+    """
+
+    docker_compose_file: Union[ValidPath, List[ValidPath]] = Field(description="The compose file(s) every stack runs.")
+    size: int = Field(default=2, ge=1, description="The number of stacks kept warm.")
+    health_checks: List[HealthCheck] = Field(default_factory=list, description="The health checks awaited after starting and after every reset.")
+    reset: ResetMode = Field(default="restart", description="How a stack is reset when a lease ends.")
+    pull: bool = Field(default=True, description="Pull the images once before starting the stacks.")
+    wait: bool = Field(default=False, description="Also wait for the compose healthchecks of every container (see `Deployment.await_until_ready`).")
+    wait_timeout: float = Field(default=60, description="How long each service may take to become ready when `wait` is set.")
+    replace_attempts: int = Field(default=2, ge=1, description="How often to try starting a replacement for a stack whose reset failed.")
+    project_prefix: str = Field(default="dokker-pool", description="The prefix of the compose project name of every stack.")
+    shutdown_timeout: Optional[int] = Field(default=4, description="The grace period passed to `stop`/`down` of every stack.")
+    teardown_timeout: Optional[float] = Field(default=10.0, description="The wall-clock guard for tearing every stack down.")
+
+    _deployments: List[Deployment] = PrivateAttr(default_factory=list)
+    # None in the queue marks a pool without stacks, waking every waiter.
+    _idle: Optional["asyncio.Queue[Optional[Deployment]]"] = PrivateAttr(default=None)
+
+    @property
+    def deployments(self) -> List[Deployment]:
+        """Every stack of the pool, leased or idle."""
+        return list(self._deployments)
+
+    def _new_deployment(self) -> Deployment:
+        return testing(
+            self.docker_compose_file,
+            health_checks=list(self.health_checks),
+            shutdown_timeout=self.shutdown_timeout,
+            teardown_timeout=self.teardown_timeout,
+            project_name=f"{self.project_prefix}-{uuid.uuid4().hex[:8]}",
+        )
+
+    async def _astart(self, deployment: Deployment) -> None:
+        await deployment.__aenter__()
+        # Under the `testing` policy the up registers the down (with volumes)
+        # that runs when the deployment exits.
+        await deployment.aup(wait=self.wait, wait_timeout=self.wait_timeout)
+        await deployment.ainspect()
+        await deployment.acheck_health()
+
+    async def _aclose(self, deployments: List[Deployment]) -> None:
+        results = await asyncio.gather(*(deployment.__aexit__(None, None, None) for deployment in deployments), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+
+    async def areset(self, deployment: Deployment) -> None:
+        """Reset a stack according to ``reset`` and wait until it is healthy."""
+        if self.reset == "none":
+            return
+        if self.reset == "volumes":
+            await deployment.adown()
+            await deployment.aup(wait=self.wait, wait_timeout=self.wait_timeout)
+        else:
+            await deployment.arestart(list(deployment.spec.services or {}), await_health=False)
+            if self.wait:
+                await deployment.await_until_ready(timeout=self.wait_timeout)
+        await deployment.acheck_health()
+
+    async def aacquire(self) -> Deployment:
+        """Take a stack out of the pool, waiting until one is free.
+
+        Hand it back with ``arelease`` (or use ``alease``/``lease``).
+
+        Raises
+        ------
+        PoolError
+            If the pool is not started, or has no stack left (also while
+            waiting for one).
+        """
+        if self._idle is None:
+            raise PoolError("The pool is not started. Use it as a context manager first.")
+        if self._deployments:
+            deployment = await self._idle.get()
+            if deployment is not None:
+                return deployment
+            # Pass the mark on to the next waiter.
+            self._idle.put_nowait(None)
+        raise PoolError("Every stack of the pool failed to reset and could not be replaced; there is nothing left to lease.")
+
+    async def _adiscard(self, deployment: Deployment) -> None:
+        self._deployments.remove(deployment)
+        try:
+            await self._aclose([deployment])
+        except _STACK_ERRORS as e:
+            logger.warning("Tearing down the broken stack %s failed: %s", deployment.project, e)
+
+    async def _areplace(self) -> Optional[Deployment]:
+        """Start a fresh stack, trying ``replace_attempts`` times; None if none started."""
+        for attempt in range(1, self.replace_attempts + 1):
+            replacement = self._new_deployment()
+            self._deployments.append(replacement)
+            try:
+                await self._astart(replacement)
+            except BaseException as e:
+                await self._adiscard(replacement)
+                if not isinstance(e, _STACK_ERRORS):
+                    raise
+                logger.warning("Starting a replacement stack failed (attempt %d of %d): %s", attempt, self.replace_attempts, e)
+            else:
+                return replacement
+        return None
+
+    async def arelease(self, deployment: Deployment) -> None:
+        """Reset a leased stack and put it back into the pool.
+
+        If the reset fails, the stack is torn down and replaced by a fresh one.
+        If no replacement starts either, the pool goes on with one stack less;
+        once none is left, ``aacquire`` raises ``PoolError``.
+        """
+        assert self._idle is not None, "Releasing into a pool that is not started"
+        try:
+            await self.areset(deployment)
+        except _STACK_ERRORS as e:
+            logger.warning("Resetting pooled stack %s failed, replacing it: %s", deployment.project, e)
+            await self._adiscard(deployment)
+            replacement = await self._areplace()
+            if replacement is None:
+                logger.warning("No replacement stack started; the pool has %d stack(s) left.", len(self._deployments))
+                if not self._deployments:
+                    self._idle.put_nowait(None)
+                return
+            deployment = replacement
+
+        self._idle.put_nowait(deployment)
+
+    @asynccontextmanager
+    async def alease(self) -> AsyncIterator[Deployment]:
+        """Lease a stack for the duration of the ``async with`` block."""
+        deployment = await self.aacquire()
+        try:
+            yield deployment
+        finally:
+            await self.arelease(deployment)
+
+    @contextmanager
+    def lease(self) -> Iterator[Deployment]:
+        """Lease a stack for the duration of the ``with`` block. (sync)"""
+        deployment = unkoil(self.aacquire)
+        try:
+            yield deployment
+        finally:
+            unkoil(self.arelease, deployment)
+
+    async def __aenter__(self) -> Self:
+        """Start every stack of the pool, pulling the images once first."""
+        self._deployments = [self._new_deployment() for _ in range(self.size)]
+        try:
+            if self.pull:
+                # The stacks share their images, so one pull serves all.
+                async with self._new_deployment() as puller:
+                    await puller.apull()
+            await asyncio.gather(*(self._astart(deployment) for deployment in self._deployments))
+        except BaseException:
+            await self._aclose(self._deployments)
+            self._deployments = []
+            raise
+
+        self._idle = asyncio.Queue()
+        for deployment in self._deployments:
+            self._idle.put_nowait(deployment)
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]], exc_val: Optional[BaseException], exc_tb: Optional[TracebackType]) -> None:
+        """Tear every stack down in parallel."""
+        deployments, self._deployments, self._idle = self._deployments, [], None
+        await self._aclose(deployments)
+
+
+def pool_fixture(
+    docker_compose_file: Union[ValidPath, List[ValidPath]],
+    size: int = 2,
+    scope: Literal["session", "package", "module"] = "session",
+    **pool_kwargs: Any,
+) -> Callable[..., Any]:
+    """Create a pytest fixture that shares a ``DeploymentPool``.
+
+    Assign the result to a name in your ``conftest.py`` to make it a fixture
+    of that name. The pool is started the first time a test requests it and
+    torn down at the end of the ``scope`` (the whole session by default)::
+
+        dokker_pool = pool_fixture("docker-compose.yml", size=4, reset="volumes")
+
+        def test_api(dokker_pool):
+            with dokker_pool.lease() as deployment:
+                ...
+
+    Parameters
+    ----------
+    docker_compose_file : Union[ValidPath, List[ValidPath]]
+        The compose file(s) every stack runs.
+    size : int, optional
+        The number of stacks kept warm, by default 2.
+    scope : str, optional
+        The pytest scope the pool is shared in, by default "session".
+    **pool_kwargs
+        Any other ``DeploymentPool`` field (``health_checks``, ``reset``, ...).
+
+    Returns
+    -------
+    Callable
+        The pytest fixture.
+    """
+    import pytest
+
+    @pytest.fixture(scope=scope)
+    def _pool() -> Iterator[DeploymentPool]:
+        with DeploymentPool(docker_compose_file=docker_compose_file, size=size, **pool_kwargs) as pool:
+            yield pool
+
+    return _pool
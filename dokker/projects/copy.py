@@ -1,10 +1,42 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
+import asyncio
+import logging
 import os
-from typing import Optional
+import threading
+import uuid
+from typing import List, Optional
 import shutil
 from dokker.cli import CLI
+from dokker.log_archive import LOGS_DIR
+from dokker.projects.mirror import DEFAULT_COPY_PATTERNS, MirrorMode, MirrorStats, mirror_tree
 from dokker.types import ValidPath
 
+logger = logging.getLogger(__name__)
+
+TRASH_DIR = ".trash"
+"""The directory in ``base_dir`` torn-down mirrors are moved into before deletion."""
+
+
+def purge_in_background(path: str) -> threading.Thread:
+    """Delete the tree at *path* in a daemon thread and return the thread.
+
+    The thread does not keep the interpreter alive; whatever it did not get
+    to is purged by the next ``sweep_trash``.
+    """
+    thread = threading.Thread(target=shutil.rmtree, args=(path,), kwargs={"ignore_errors": True}, name=f"dokker-purge-{os.path.basename(path)}", daemon=True)
+    thread.start()
+    return thread
+
+
+def sweep_trash(base_dir: str) -> List[threading.Thread]:
+    """Purge everything left in the trash of *base_dir* in the background."""
+    trash = os.path.join(base_dir, TRASH_DIR)
+    try:
+        leftovers = os.listdir(trash)
+    except FileNotFoundError:
+        return []
+    return [purge_in_background(os.path.join(trash, name)) for name in leftovers]
+
 
 class CopyPathProject(BaseModel):
     """A copy path Project.
@@ -12,12 +44,44 @@ class CopyPathProject(BaseModel):
     This project is a project that will mirror a path to a temporary
     directory and run it from there. This is useful for testing projects that
     are in production environments btu should be tested locally.
+
+    The mirror is made off the event loop. By default files are reflinked
+    (copy-on-write clones) where the filesystem supports it, so even a large
+    project mirrors in well under a second; see ``mirror_mode``. The compose
+    files and anything matching ``copy_patterns`` are always copied.
+
+    With ``overwrite`` an existing mirror is re-synced instead of copied
+    again: only files added or changed since the last mirror are mirrored,
+    and files removed from the source are deleted (see
+    ``dokker.projects.mirror``). ``last_mirror`` reports what changed.
+
+    Tearing down takes constant time: the mirror is renamed into
+    ``base_dir/.trash`` and deleted by a background thread, so a large tree
+    never stalls the event loop. Trash left behind by an interrupted run is
+    swept on the next initialize. The log archives of watchers (the ``logs``
+    directory, see ``dokker.log_archive``) are kept.
     """
 
     project_path: ValidPath
     project_name: Optional[str] = None
     base_dir: str = Field(default_factory=lambda: os.path.join(os.getcwd(), ".dokker"))
-    overwrite: bool = False
+    overwrite: bool = Field(default=False, description="Re-sync an existing mirror instead of failing.")
+    mirror_mode: MirrorMode = Field(
+        default="reflink",
+        description=(
+            "How files are mirrored: `copy` copies everything, `reflink` clones files where the "
+            "filesystem supports it (and copies otherwise), `hardlink` clones or else hard links "
+            "them (fastest without reflinks, but in-place writes to a linked file reach the source)."
+        ),
+    )
+    copy_patterns: List[str] = Field(
+        default_factory=lambda: list(DEFAULT_COPY_PATTERNS),
+        description="File name patterns (fnmatch) that are always copied, never cloned or linked.",
+    )
+    mirror_workers: int = Field(default=8, description="The number of threads mirroring files.")
+    last_mirror: Optional[MirrorStats] = Field(default=None, description="How the files of the last mirror were created, and what changed.")
+
+    _purges: List[threading.Thread] = PrivateAttr(default_factory=list)
 
     async def ainititialize(self) -> CLI:
         """A setup method for the project.
@@ -28,17 +92,36 @@ class CopyPathProject(BaseModel):
             The CLI to use for the project.
         """
         os.makedirs(self.base_dir, exist_ok=True)
+        self._purges.extend(sweep_trash(self.base_dir))
 
         if self.project_name is None:
             self.project_name = os.path.basename(self.project_path)
 
         project_dir = os.path.join(self.base_dir, self.project_name)
-        if os.path.exists(project_dir) and not self.overwrite:
+        # A directory holding nothing but the log archives of past runs is no mirror.
+        if os.path.exists(project_dir) and os.listdir(project_dir) != [LOGS_DIR] and not self.overwrite:
             raise Exception(
                 f"Project {self.project_name} already exists in {self.base_dir}. Set overwrite to overwrite."
             )
 
-        shutil.copytree(self.project_path, project_dir, dirs_exist_ok=self.overwrite)
+        self.last_mirror = await asyncio.to_thread(
+            mirror_tree,
+            str(self.project_path),
+            project_dir,
+            mode=self.mirror_mode,
+            copy_patterns=self.copy_patterns,
+            workers=self.mirror_workers,
+        )
+        stats = self.last_mirror
+        logger.info(
+            "Mirrored %s to %s: %d added, %d changed, %d removed, %d unchanged",
+            self.project_path,
+            project_dir,
+            len(stats.added),
+            len(stats.changed),
+            len(stats.removed),
+            stats.unchanged,
+        )
 
         compose_file = os.path.join(project_dir, "docker-compose.yml")
         if not os.path.exists(compose_file):
@@ -70,8 +153,23 @@ class CopyPathProject(BaseModel):
             self.project_name = os.path.basename(self.project_path)
 
         project_dir = os.path.join(self.base_dir, self.project_name)
-        if os.path.exists(project_dir):
-            shutil.rmtree(project_dir)
+        if not os.path.exists(project_dir):
+            return
+
+        trash = os.path.join(self.base_dir, TRASH_DIR)
+        os.makedirs(trash, exist_ok=True)
+        doomed = os.path.join(trash, f"{self.project_name}-{uuid.uuid4().hex[:8]}")
+        try:
+            # Atomic, so the project name is free again right away.
+            os.rename(project_dir, doomed)
+        except OSError as e:
+            logger.debug("Could not move %s to the trash (%s), deleting it in place", project_dir, e)
+            await asyncio.to_thread(shutil.rmtree, project_dir)
+            return
+        if os.path.isdir(os.path.join(doomed, LOGS_DIR)):
+            os.makedirs(project_dir)
+            os.rename(os.path.join(doomed, LOGS_DIR), os.path.join(project_dir, LOGS_DIR))
+        self._purges.append(purge_in_background(doomed))
 
     async def abefore_pull(self) -> None:
         """A setup method for the project.
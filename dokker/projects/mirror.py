@@ -0,0 +1,302 @@
+"""Fast mirroring of a project directory for ``CopyPathProject``.
+
+A mirror only has to look like a copy to docker compose: most of a project
+(build contexts, fixture data, ...) is only ever read. So instead of copying
+every byte, files are reflinked (a copy-on-write clone, ``FICLONE`` on Linux)
+where the filesystem supports it and, in ``"hardlink"`` mode, hard linked
+otherwise. Files that are likely to be edited per mirror, the compose files
+and configuration matched by ``copy_patterns``, are always copied for real.
+The files are mirrored on a thread pool, off the event loop.
+
+Every mirror records a manifest (``MANIFEST_NAME``) of the size, mtime and,
+when it had to be computed, content hash of every file. Mirroring into an
+existing mirror then works like rsync: files whose size and mtime are
+unchanged are skipped (as are files whose content hash turns out unchanged),
+only added and changed files are mirrored, and files removed from the source
+are deleted from the mirror.
+"""
+
+import errno
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Literal, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+MirrorMode = Literal["copy", "reflink", "hardlink"]
+"""How files are mirrored:
+
+- ``"copy"`` copies every file (the slowest, but works everywhere),
+- ``"reflink"`` clones files where the filesystem supports it and copies them
+  otherwise (as safe as a copy: a clone is copy-on-write),
+- ``"hardlink"`` clones or else hard links files. Fastest on filesystems
+  without reflinks, but a container writing into a linked file *in place*
+  changes the source too.
+"""
+
+DEFAULT_COPY_PATTERNS: Tuple[str, ...] = (
+    "docker-compose*.yml",
+    "docker-compose*.yaml",
+    "compose*.yml",
+    "compose*.yaml",
+    ".env",
+    "*.env",
+)
+"""File names that are always copied for real, never cloned or linked."""
+
+FICLONE = 0x40049409
+"""The Linux ``ioctl`` cloning a whole file (``_IOW(0x94, 9, int)``)."""
+
+_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EPERM}
+
+
+MANIFEST_NAME = ".dokker-manifest.json"
+"""The manifest file kept at the root of every mirror."""
+
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class MirrorStats:
+    """How the files of a mirror were created, and what changed since the last one.
+
+    ``added``, ``changed`` and ``removed`` hold paths relative to the mirror
+    root; ``unchanged`` counts the files that were left as they were.
+    """
+
+    cloned: int = 0
+    linked: int = 0
+    copied: int = 0
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+
+@dataclass
+class _Entry:
+    """The manifest record of one mirrored file."""
+
+    size: int
+    mtime_ns: int
+    mirror_size: int
+    mirror_mtime_ns: int
+    sha256: Optional[str] = None
+
+
+@dataclass
+class _Support:
+    """Whether cloning and linking still look possible on this filesystem.
+
+    Cleared the first time either fails as unsupported, so a filesystem
+    without reflinks costs one failed ``ioctl``, not one per file.
+    """
+
+    reflink: bool = field(default_factory=lambda: fcntl is not None and sys.platform.startswith("linux"))
+    hardlink: bool = True
+
+
+def _reflink(src: str, dst: str) -> bool:
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            cloned = False
+        else:
+            cloned = True
+    if not cloned:
+        os.unlink(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def _mirror_file(src: str, dst: str, mode: MirrorMode, real_copy: bool, support: _Support) -> str:
+    # Never write through a file left by an earlier mirror: it may be a hard
+    # link to the source.
+    if os.path.lexists(dst):
+        os.unlink(dst)
+
+    if not real_copy and mode != "copy":
+        if support.reflink:
+            if _reflink(src, dst):
+                return "cloned"
+            support.reflink = False
+        if mode == "hardlink" and support.hardlink:
+            try:
+                os.link(src, dst)
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED and e.errno != errno.EMLINK:
+                    raise
+                support.hardlink = False
+            else:
+                return "linked"
+
+    shutil.copy2(src, dst)
+    return "copied"
+
+
+def _walk(src: str, dst: str, rel: str, directories: List[Tuple[str, str]]) -> Iterator[Tuple[str, str, str]]:
+    """Create the directories of the mirror, yield every (relative path, source, target) file."""
+    os.makedirs(dst, exist_ok=True)
+    directories.append((src, dst))
+    with os.scandir(src) as entries:
+        for entry in entries:
+            path = f"{rel}/{entry.name}" if rel else entry.name
+            if path == MANIFEST_NAME:
+                continue
+            target = os.path.join(dst, entry.name)
+            if entry.is_dir():
+                yield from _walk(entry.path, target, path, directories)
+            else:
+                yield path, entry.path, target
+
+
+def _sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _load_manifest(dst: str) -> Tuple[Optional[str], Dict[str, _Entry]]:
+    """The mode and the entries of the manifest in *dst*."""
+    try:
+        with open(os.path.join(dst, MANIFEST_NAME)) as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            return None, {}
+        return data["mode"], {path: _Entry(**entry) for path, entry in data["files"].items()}
+    except (OSError, ValueError, TypeError, KeyError):
+        # No (or an unreadable) manifest: every file counts as changed.
+        return None, {}
+
+
+def _write_manifest(dst: str, mode: MirrorMode, manifest: Dict[str, _Entry]) -> None:
+    path = os.path.join(dst, MANIFEST_NAME)
+    files = {name: vars(entry) for name, entry in sorted(manifest.items())}
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "mode": mode, "files": files}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def _is_unchanged(source: str, target: str, stat: os.stat_result, entry: Optional[_Entry]) -> Tuple[bool, Optional[_Entry]]:
+    """Whether *target* still mirrors *source*, and the manifest entry to keep if so."""
+    if entry is None:
+        return False, None
+    try:
+        mirrored = os.stat(target)
+    except FileNotFoundError:
+        return False, None
+    if (mirrored.st_size, mirrored.st_mtime_ns) != (entry.mirror_size, entry.mirror_mtime_ns):
+        # Something wrote into the mirror.
+        return False, None
+    if (stat.st_size, stat.st_mtime_ns) == (entry.size, entry.mtime_ns):
+        return True, entry
+    if stat.st_size != entry.size:
+        return False, None
+    # Same size, new mtime (e.g. touched or checked out again): compare content.
+    previous = entry.sha256 or _sha256(target)
+    current = _sha256(source)
+    if current != previous:
+        return False, None
+    return True, _Entry(stat.st_size, stat.st_mtime_ns, mirrored.st_size, mirrored.st_mtime_ns, current)
+
+
+def mirror_tree(
+    src: str,
+    dst: str,
+    mode: MirrorMode = "reflink",
+    copy_patterns: Sequence[str] = DEFAULT_COPY_PATTERNS,
+    workers: int = 8,
+) -> MirrorStats:
+    """Mirror the directory *src* to *dst* (blocking; run it in a thread).
+
+    Like ``shutil.copytree(src, dst, dirs_exist_ok=True)`` (symlinks are
+    followed), but files are cloned or linked according to *mode*, except for
+    the ones whose name matches one of *copy_patterns*, which are copied.
+
+    If *dst* is an earlier mirror, only what changed is synced (see the module
+    docstring): unchanged files are kept, and files the last mirror created
+    but the source no longer has are deleted. Anything else in *dst* is left
+    alone.
+
+    Parameters
+    ----------
+    src : str
+        The directory to mirror.
+    dst : str
+        The directory to mirror into. It is created if missing.
+    mode : MirrorMode, optional
+        How files are mirrored, by default "reflink".
+    copy_patterns : Sequence[str], optional
+        ``fnmatch`` patterns of file names that are always copied.
+    workers : int, optional
+        The number of threads mirroring files, by default 8.
+
+    Returns
+    -------
+    MirrorStats
+        How many files were cloned, linked and copied, and which were added,
+        changed and removed.
+    """
+    support = _Support()
+    previous_mode, previous = _load_manifest(dst)
+    # Files mirrored in another mode (e.g. hard linked, now to be copied) are
+    # all mirrored again.
+    reusable = previous if previous_mode == mode else {}
+    directories: List[Tuple[str, str]] = []
+    files = list(_walk(src, dst, "", directories))
+
+    def sync(item: Tuple[str, str, str]) -> Tuple[str, Optional[str], _Entry]:
+        path, source, target = item
+        stat = os.stat(source)
+        unchanged, entry = _is_unchanged(source, target, stat, reusable.get(path))
+        if unchanged and entry is not None:
+            return path, None, entry
+        name = os.path.basename(source)
+        real_copy = any(fnmatch.fnmatch(name, pattern) for pattern in copy_patterns)
+        kind = _mirror_file(source, target, mode, real_copy, support)
+        mirrored = os.stat(target)
+        return path, kind, _Entry(stat.st_size, stat.st_mtime_ns, mirrored.st_size, mirrored.st_mtime_ns)
+
+    stats = MirrorStats()
+    manifest: Dict[str, _Entry] = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # Iterating re-raises the first error of any file.
+        for path, kind, entry in pool.map(sync, files):
+            manifest[path] = entry
+            if kind is None:
+                stats.unchanged += 1
+                continue
+            setattr(stats, kind, getattr(stats, kind) + 1)
+            (stats.changed if path in previous else stats.added).append(path)
+
+    for path in sorted(previous.keys() - manifest.keys()):
+        target = os.path.join(dst, *path.split("/"))
+        if os.path.lexists(target):
+            os.unlink(target)
+        stats.removed.append(path)
+        # Drop the directories the source no longer has, once they are empty.
+        parent = os.path.dirname(path)
+        while parent and not os.path.isdir(os.path.join(src, parent)):
+            try:
+                os.rmdir(os.path.join(dst, parent))
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+    _write_manifest(dst, mode, manifest)
+    # Last, as creating the files touched the directories.
+    for source, target in directories:
+        shutil.copystat(source, target)
+    return stats
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from dokker.cli import CLI
+from dokker.compose_spec import ComposeSpec
+
+logger = logging.getLogger(__name__)
+
+
+def _hash_file(digest: "hashlib._Hash", path: str) -> None:
+    """Feed the path and (if it exists) the contents of *path* into *digest*."""
+    digest.update(os.path.abspath(path).encode())
+    try:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    except FileNotFoundError:
+        digest.update(b"\0missing")
+
+
+class SpecCache(BaseModel):
+    """A content-addressed cache for the ``ComposeSpec`` of a project.
+
+    ``docker compose config`` costs a subprocess plus a full pydantic parse on
+    every inspect. The cache keys the resolved spec on everything that goes
+    into it from the project side: the contents of the compose files, the env
+    file, the active profiles, the project name and the compose command line.
+    As long as none of these change, ``ainspect`` returns the spec without
+    running compose (and, for in-memory hits, without parsing anything).
+
+    Entries live in memory and, with ``persist=True``, as JSON files under
+    ``<base_dir>/spec-cache`` so separate test runs can share them. Share one
+    instance between deployments to share its entries.
+
+    Note that compose also interpolates variables from the process environment
+    and follows ``include``/``extends`` references; neither is part of the key,
+    so call ``clear`` if you change those between inspects. In-memory hits
+    return the same ``ComposeSpec`` instance, which should not be mutated.
+    """
+
+    persist: bool = False
+    base_dir: str = Field(default_factory=lambda: os.path.join(os.getcwd(), ".dokker"))
+
+    _entries: Dict[str, ComposeSpec] = PrivateAttr(default_factory=dict)
+
+    @property
+    def cache_dir(self) -> str:
+        """The directory persisted entries are stored in."""
+        return os.path.join(self.base_dir, "spec-cache")
+
+    def key_for(self, cli: CLI) -> str:
+        """Compute the cache key for the project *cli* operates on."""
+        digest = hashlib.sha256()
+        digest.update(json.dumps(cli.docker_cmd).encode())
+        digest.update(cli.project_name.encode())
+        digest.update(json.dumps(sorted(str(p) for p in cli.compose_profiles)).encode())
+
+        for compose_file in cli.compose_files:
+            _hash_file(digest, str(compose_file))
+
+        env_files: List[str] = []
+        if cli.compose_env_file is not None:
+            env_files.append(str(cli.compose_env_file))
+        # Compose itself loads the `.env` next to the (first) compose file.
+        project_dir = cli.compose_project_directory or os.path.dirname(os.path.abspath(cli.compose_files[0]))
+        env_files.append(os.path.join(str(project_dir), ".env"))
+        for env_file in env_files:
+            _hash_file(digest, env_file)
+
+        return digest.hexdigest()
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[ComposeSpec]:
+        """Return the cached spec for *key*, or None on a miss."""
+        spec = self._entries.get(key)
+        if spec is not None or not self.persist:
+            return spec
+
+        try:
+            with open(self._path_for(key), "r") as f:
+                spec = ComposeSpec.from_json(f.read())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning("Ignoring corrupt spec cache entry %s", self._path_for(key))
+            return None
+
+        self._entries[key] = spec
+        return spec
+
+    def put(self, key: str, spec: ComposeSpec) -> None:
+        """Store *spec* under *key* (and on disk if ``persist`` is set)."""
+        self._entries[key] = spec
+        if not self.persist:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(spec.model_dump_json())
+        # Atomic, so a concurrent reader never sees a half-written entry.
+        os.replace(tmp_path, path)
+
+    def clear(self) -> None:
+        """Drop every entry, in memory and on disk."""
+        self._entries.clear()
+        if self.persist and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    async def ainspect(self, cli: CLI) -> ComposeSpec:
+        """Return the spec of *cli*'s project, running compose only on a miss.
+
+        Returns
+        -------
+        ComposeSpec
+            The (possibly cached) compose spec of the project.
+        """
+        key = self.key_for(cli)
+        spec = self.get(key)
+        if spec is None:
+            spec = await cli.ainspect_config()
+            self.put(key, spec)
+        return spec
@@ -0,0 +1,317 @@
+"""Timing spans for the phases of a deployment.
+
+A ``Tracer`` attached to a ``Deployment`` records a ``Span`` for every phase
+of its lifecycle (initialize, inspect, pull, up, health checks, down, stop and
+every teardown step), with its start and end time, attributes and status.
+Spans nest: the span current in a task (kept in a ``contextvars`` variable,
+so concurrent tasks each have their own) is the parent of the spans started
+in it. That includes the ``command`` span ``astream_command`` records for
+every ``docker compose`` subprocess, with its argv, exit code and the bytes it
+wrote to stdout and stderr.
+
+Finished spans are kept on the tracer (``timeline``, ``format_timeline``) and
+handed to its exporters. ``OTLPJsonFileExporter`` appends them to a file in
+the OpenTelemetry protocol's JSON encoding, which an OpenTelemetry collector
+(``otlpjsonfile`` receiver) or any other OTLP tooling can read; anything with
+an ``export``/``shutdown`` method (a ``SpanExporter``) works as an exporter.
+An exporter that raises never breaks a deployment: its first failure is
+logged and the span is dropped.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Protocol, Sequence, Set, runtime_checkable
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional["Span"]] = ContextVar("dokker_current_span", default=None)
+
+
+class Span:
+    """One timed operation of a deployment.
+
+    ``start_time`` and ``end_time`` are nanoseconds since the epoch (the end
+    is None while the span runs); the duration is measured with a monotonic
+    clock. ``status`` is ``"unset"`` while running, then ``"ok"`` or
+    ``"error"`` (with the ``error`` message).
+    """
+
+    __slots__ = ("tracer", "name", "span_id", "parent_id", "start_time", "end_time", "attributes", "status", "error", "_started")
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"], attributes: Optional[Dict[str, Any]] = None) -> None:
+        """Start a span of *tracer* (use ``Tracer.span`` or ``Tracer.start_span``)."""
+        self.tracer = tracer
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "unset"
+        self.error: Optional[str] = None
+        self.end_time: Optional[int] = None
+        self.start_time = time.time_ns()
+        self._started = time.perf_counter_ns()
+
+    @property
+    def duration(self) -> Optional[float]:
+        """The seconds the span took, None while it runs."""
+        if self.end_time is None:
+            return None
+        return (self.end_time - self.start_time) / 1e9
+
+    def set(self, **attributes: Any) -> None:
+        """Set attributes of the span."""
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """End the span, failed with *error* if given; ending twice does nothing."""
+        if self.end_time is not None:
+            return
+        self.end_time = self.start_time + time.perf_counter_ns() - self._started
+        if error is None:
+            self.status = "ok"
+        else:
+            self.status = "error"
+            self.error = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+        self.tracer._finish(self)
+
+    def __repr__(self) -> str:
+        """Representation of the span."""
+        duration = f"{self.duration:.3f}s" if self.duration is not None else "running"
+        return f"Span({self.name!r}, {duration}, status={self.status!r}, attributes={self.attributes!r})"
+
+
+@runtime_checkable
+class SpanExporter(Protocol):
+    """Receives the spans of a ``Tracer`` as they finish."""
+
+    def export(self, spans: Sequence[Span]) -> None:
+        """Export finished spans."""
+        ...
+
+    def shutdown(self) -> None:
+        """Flush and release whatever the exporter holds."""
+        ...
+
+
+class Tracer:
+    """Records the spans of one or more deployments.
+
+    Parameters
+    ----------
+    exporters : Iterable[SpanExporter], optional
+        Called with every span as it finishes.
+    service_name : str, optional
+        The ``service.name`` exporters report, by default "dokker".
+    """
+
+    def __init__(self, exporters: Iterable[SpanExporter] = (), service_name: str = "dokker") -> None:
+        """Create a tracer with a new trace id."""
+        self.exporters: List[SpanExporter] = list(exporters)
+        self.service_name = service_name
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+        # The ids of the exporters whose failure was already logged.
+        self._failed: Set[int] = set()
+
+    def start_span(self, name: str, attributes: Optional[Dict[str, Any]] = None, parent: Optional[Span] = None) -> Span:
+        """Start a span without making it current; ``end`` it yourself.
+
+        The parent defaults to the current span, if it belongs to this tracer.
+        """
+        if parent is None:
+            current = _current.get()
+            parent = current if current is not None and current.tracer is self else None
+        return Span(self, name, parent, attributes)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Time the enclosed block as the current span (also in ``async`` code).
+
+        The span fails if the block raises (cancellation included).
+        """
+        span = self.start_span(name, attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(e)
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+
+    def _finish(self, span: Span) -> None:
+        self.spans.append(span)
+        for exporter in self.exporters:
+            try:
+                exporter.export([span])
+            except Exception:
+                # An exporter must never break a deployment; its first failure
+                # is logged, the later ones would only repeat it.
+                if id(exporter) not in self._failed:
+                    self._failed.add(id(exporter))
+                    logger.warning("The span exporter %r failed, its spans are dropped", exporter, exc_info=True)
+
+    def timeline(self) -> List[Span]:
+        """The finished spans ordered by their start."""
+        return sorted(self.spans, key=lambda span: span.start_time)
+
+    def format_timeline(self) -> str:
+        """The timeline as text: every span indented under its parent, with its offset and duration."""
+        spans = self.timeline()
+        if not spans:
+            return ""
+        origin = spans[0].start_time
+        by_id = {span.span_id: span for span in spans}
+
+        def depth(span: Span) -> int:
+            level = 0
+            while span.parent_id is not None and span.parent_id in by_id:
+                span = by_id[span.parent_id]
+                level += 1
+            return level
+
+        lines = []
+        for span in spans:
+            detail = " ".join(f"{key}={value}" for key, value in span.attributes.items() if key != "argv")
+            if "argv" in span.attributes:
+                detail = f"{' '.join(span.attributes['argv'])} {detail}".strip()
+            failed = f" FAILED ({span.error})" if span.status == "error" else ""
+            lines.append(f"{(span.start_time - origin) / 1e6:>10.1f}ms {span.duration or 0:>9.3f}s {'  ' * depth(span)}{span.name}{failed} {detail}".rstrip())
+        return "\n".join(lines)
+
+    def clear(self) -> None:
+        """Forget the finished spans."""
+        self.spans = []
+
+    def shutdown(self) -> None:
+        """Shut every exporter down."""
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+def current_span() -> Optional[Span]:
+    """The span current in this task, if any."""
+    return _current.get()
+
+
+def start_command_span(argv: List[str]) -> Optional[Span]:
+    """Start a ``command`` span for a subprocess, under the current span (if any is)."""
+    parent = _current.get()
+    if parent is None:
+        return None
+    return parent.tracer.start_span("command", {"argv": argv}, parent)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # int64 values are strings in the OTLP JSON encoding.
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class OTLPJsonFileExporter:
+    """Appends spans to a file, one OTLP/JSON ``ExportTraceServiceRequest`` per line.
+
+    ``export`` only queues the spans, as it is called on the event loop for
+    every span that ends. They are written as one request per batch from a
+    background thread, at most ``flush_interval`` seconds after the first of
+    them ended, or at once by ``flush`` and ``shutdown``. The thread is not a
+    daemon, so spans still queued when the program ends are written before it
+    exits.
+
+    Parameters
+    ----------
+    path : str
+        The file to append to; its directory is created if missing.
+    flush_interval : float, optional
+        The seconds spans wait for others to share their write, by default 1.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0) -> None:
+        """Create an exporter appending to *path*."""
+        self.path = str(path)
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._pending: List[Span] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def export(self, spans: Sequence[Span]) -> None:
+        """Queue *spans* for the next write."""
+        if not spans:
+            return
+        with self._lock:
+            self._pending.extend(spans)
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_in_background)
+                self._timer.start()
+
+    def _flush_in_background(self) -> None:
+        try:
+            self.flush()
+        except OSError as e:
+            logger.warning("Could not write spans to %s, they are dropped: %s", self.path, e)
+
+    def flush(self) -> None:
+        """Write every queued span now, as one line."""
+        with self._lock:
+            spans, self._pending = self._pending, []
+            timer, self._timer = self._timer, None
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+        if not spans:
+            return
+        line = json.dumps(self._request(spans)) + "\n"
+        # Keeps concurrent flushes from interleaving their lines.
+        with self._write_lock, open(self.path, "a") as f:
+            f.write(line)
+
+    def _request(self, spans: Sequence[Span]) -> Dict[str, Any]:
+        # One resource per service name, in case tracers share the exporter.
+        by_service: Dict[str, List[Dict[str, Any]]] = {}
+        for span in spans:
+            otlp_span: Dict[str, Any] = {
+                "traceId": span.tracer.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 3 if span.name == "command" else 1,  # CLIENT for subprocesses, else INTERNAL
+                "startTimeUnixNano": str(span.start_time),
+                "endTimeUnixNano": str(span.end_time),
+                "attributes": _otlp_attributes(span.attributes),
+                "status": {"code": 2, "message": span.error} if span.status == "error" else {"code": 1},
+            }
+            if span.parent_id is not None:
+                otlp_span["parentSpanId"] = span.parent_id
+            by_service.setdefault(span.tracer.service_name, []).append(otlp_span)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _otlp_attributes({"service.name": service_name})},
+                    "scopeSpans": [{"scope": {"name": "dokker"}, "spans": otlp_spans}],
+                }
+                for service_name, otlp_spans in by_service.items()
+            ]
+        }
+
+    def shutdown(self) -> None:
+        """Write the queued spans and stop the background thread."""
+        self.flush()
@@ -1,6 +1,13 @@
 from typing import Callable, Union, AsyncIterator, Tuple, Awaitable
 from pathlib import Path
 
+from dokker.log_record import LogRecord
+
 ValidPath = Union[str, Path]
 LogStream = AsyncIterator[Tuple[str, str]]
 LogFunction = Union[Callable[[Tuple[str, str]], Awaitable[None]], Callable[[Tuple[str, str]], None]]
+# In raw mode lines are passed on as undecoded bytes.
+RawLogStream = AsyncIterator[Tuple[str, bytes]]
+RawLogFunction = Union[Callable[[Tuple[str, bytes]], Awaitable[None]], Callable[[Tuple[str, bytes]], None]]
+# In structured mode lines are passed on parsed.
+RecordFunction = Union[Callable[[LogRecord], Awaitable[None]], Callable[[LogRecord], None]]
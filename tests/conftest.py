@@ -1,13 +1,94 @@
-from typing import Generator
-from dokker import testing, HealthCheck, Deployment
+import os
+import stat
+import sys
+from typing import Callable, Generator
+from dokker import CLI, testing, HealthCheck, Deployment
 import pytest
-        
-    
+
+FAKE_CONFIG = {"services": {"web": {"image": "nginx"}, "db": {"image": "redis"}}}
+
+
+class StubProject:
+    """A project handing out the CLI *make_cli* returns; its hooks do nothing."""
+
+    def __init__(self, make_cli: Callable[[], CLI]) -> None:
+        self.make_cli = make_cli
+
+    async def ainititialize(self) -> CLI:
+        return self.make_cli()
+
+    async def atear_down(self, cli) -> None: ...
+
+    async def abefore_pull(self) -> None: ...
+
+    async def abefore_up(self) -> None: ...
+
+    async def abefore_enter(self) -> None: ...
+
+    async def abefore_down(self) -> None: ...
+
+    async def abefore_stop(self) -> None: ...
+
+
+@pytest.fixture
+def stub_project():
+    """``StubProject``, to run a ``Deployment`` over a fake compose CLI."""
+    return StubProject
+
+
+@pytest.fixture
+def fake_docker(tmp_path, monkeypatch):
+    """Put a fake ``docker`` first on ``PATH``.
+
+    It records every invocation as ``<project> <command> <args...>``, answers
+    ``config`` with ``FAKE_CONFIG`` and succeeds for everything else. The
+    environment steers it: ``FAIL_ON`` (commands) and ``FAIL_PROJECT``
+    (project names) make it exit 1, ``DOCKER_DELAY`` makes every call take that
+    many seconds. Yields the path of a compose file and a function returning
+    the recorded calls; ``max_in_flight`` reports the most calls seen at once.
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    calls = tmp_path / "calls"
+    in_flight = tmp_path / "in-flight"
+    in_flight.mkdir()
+    docker = bin_dir / "docker"
+    docker.write_text(
+        f"#!{sys.executable}\n"
+        "import json, os, sys, time\n"
+        "args = sys.argv[1:]\n"
+        "project = args[args.index('--project-name') + 1] if '--project-name' in args else '-'\n"
+        "command = next(a for a in args if a in ('config', 'pull', 'up', 'down', 'restart', 'ps', 'stop'))\n"
+        f"open({str(calls)!r}, 'a').write(project + ' ' + ' '.join(args[args.index(command):]) + '\\n')\n"
+        f"marker = os.path.join({str(in_flight)!r}, str(os.getpid()))\n"
+        "open(marker, 'w').close()\n"
+        f"open({str(tmp_path / 'concurrency')!r}, 'a').write(str(len(os.listdir({str(in_flight)!r}))) + '\\n')\n"
+        "time.sleep(float(os.environ.get('DOCKER_DELAY', '0')))\n"
+        "os.remove(marker)\n"
+        "if command in os.environ.get('FAIL_ON', '').split(',') or project in os.environ.get('FAIL_PROJECT', '').split(','):\n"
+        "    sys.exit(1)\n"
+        "if command == 'config':\n"
+        f"    print(json.dumps({FAKE_CONFIG!r}))\n"
+    )
+    docker.chmod(docker.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text("services: {}\n")
+
+    def read_calls() -> list:
+        return [line.split() for line in calls.read_text().splitlines()] if calls.exists() else []
+
+    def max_in_flight() -> int:
+        return max(int(n) for n in (tmp_path / "concurrency").read_text().split())
+
+    read_calls.max_in_flight = max_in_flight
+    return str(compose_file), read_calls
+
+
 @pytest.fixture(scope="session")
 def basic_project() -> Generator[Deployment, None, None]:
     """A pulled, started, and (on teardown) torn-down lightweight stack."""
     COMPOSE_FILE = "tests/configs/basic-compose.yaml"
-    
 
     with testing(
         COMPOSE_FILE,
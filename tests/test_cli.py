@@ -5,12 +5,23 @@ up-front validation that gives early, clear feedback (missing compose files,
 contradictory flags) before any container is ever started.
 """
 
+import json
+import sys
+
 import pytest
 
 from dokker.cli import CLI
 
 COMPOSE_FILE = "tests/configs/basic-compose.yaml"
 
+# A stand-in for ``docker compose`` that prints every argument it receives on
+# its own line, so tests can assert on the exact argv a command produced.
+ECHO_ARGV = [sys.executable, "-c", "import sys; print(*sys.argv[1:], sep=chr(10))"]
+
+
+async def _argv(stream) -> list[str]:
+    return [line async for _, line in stream]
+
 
 def test_docker_cmd_includes_compose_file():
     cli = CLI(compose_files=[COMPOSE_FILE])
@@ -63,3 +74,47 @@ async def test_run_rejects_empty_command():
     with pytest.raises(ValueError):
         async for _ in cli.astream_run(service="web", command=[]):
             pass
+
+
+def test_docker_cmd_does_not_mutate_client_call():
+    cli = CLI(compose_files=[COMPOSE_FILE])
+    cli.docker_cmd
+    cli.docker_cmd
+    assert cli.client_call == ["docker", "compose"]
+
+
+async def test_flags_with_values_are_separate_argv_entries():
+    # Commands are executed without a shell, so "--timeout 4" as a single entry
+    # would reach docker compose as one (unknown) flag.
+    cli = CLI(compose_files=[COMPOSE_FILE], client_call=ECHO_ARGV)
+    argv = await _argv(cli.astream_down(timeout=4, remove_images="local"))
+    assert argv[argv.index("--timeout") + 1] == "4"
+    assert argv[argv.index("--rmi") + 1] == "local"
+
+    argv = await _argv(cli.astream_up(scales={"web": 2}, pull="never", no_attach_services="db"))
+    assert argv[argv.index("--scale") + 1] == "web=2"
+    assert argv[argv.index("--pull") + 1] == "never"
+    assert argv[argv.index("--no-attach") + 1] == "db"
+
+
+async def test_run_splits_string_command_like_a_shell():
+    cli = CLI(compose_files=[COMPOSE_FILE], client_call=ECHO_ARGV)
+    argv = await _argv(cli.astream_run(service="worker", command="sh -c 'echo boom >&2; exit 7'"))
+    assert argv[-4:] == ["worker", "sh", "-c", "echo boom >&2; exit 7"]
+
+
+async def test_inspect_containers_parses_compose_ps_json_lines():
+    entry = {"ID": "abc", "Name": "proj-web-1", "Service": "web", "Project": "proj", "State": "running", "Health": "healthy", "ExitCode": 0, "Labels": "com.docker.compose.container-number=1,x=y"}
+    script = f"print({json.dumps(json.dumps(entry))})"
+    cli = CLI(compose_files=[COMPOSE_FILE], client_call=[sys.executable, "-c", script])
+    [container] = await cli.ainspect_containers()
+    assert container.service == "web"
+    assert container.number == 1
+    assert container.health == "healthy"
+    assert container.log_prefix == "web-1"
+
+
+async def test_exec_builds_no_tty_argv():
+    cli = CLI(compose_files=[COMPOSE_FILE], client_call=ECHO_ARGV)
+    argv = await _argv(cli.astream_exec("worker", "echo hi", index=2))
+    assert argv[argv.index("exec") :] == ["exec", "--no-TTY", "--index", "2", "worker", "echo", "hi"]
@@ -6,14 +6,24 @@ failure-feedback path: when a command exits non-zero we want the resulting
 ``CommandError`` to carry structured, legible information about what went wrong.
 """
 
+import asyncio
+import os
+import sys
+import uuid
+
 import pytest
 
+from dokker import command
 from dokker.command import CommandError, astream_command
 
 
 async def _collect(command):
-    # ``astream_command`` joins the list with spaces and runs it through a
-    # shell, so the test commands are written as a single shell snippet.
+    # In ``shell`` mode ``astream_command`` joins the list with spaces and runs
+    # it through a shell, so the test commands are written as a single snippet.
+    return [line async for line in astream_command(command, shell=True)]
+
+
+async def _collect_exec(command):
     return [line async for line in astream_command(command)]
 
 
@@ -64,7 +74,223 @@ async def test_successful_command_does_not_raise():
     assert lines == [("STDOUT", "hello")]
 
 
+async def test_exec_mode_streams_stdout_and_stderr():
+    lines = await _collect_exec(["sh", "-c", "echo out; echo err >&2"])
+
+    assert ("STDOUT", "out") in lines
+    assert ("STDERR", "err") in lines
+
+
+async def test_exec_mode_passes_arguments_with_spaces_verbatim():
+    # Without a shell in between, an argument containing spaces (e.g. a compose
+    # file in a directory with a space in its name) must reach the program as a
+    # single argv entry.
+    lines = await _collect_exec([sys.executable, "-c", "import sys; print(sys.argv[1])", "a path/with spaces"])
+    assert lines == [("STDOUT", "a path/with spaces")]
+
+
+async def test_exec_mode_does_not_interpret_shell_syntax():
+    lines = await _collect_exec(["echo", "$HOME;", "exit", "3"])
+    assert lines == [("STDOUT", "$HOME; exit 3")]
+
+
+async def test_exec_mode_failure_carries_quoted_command():
+    with pytest.raises(CommandError) as excinfo:
+        await _collect_exec(["sh", "-c", "echo boom >&2; exit 4"])
+
+    error = excinfo.value
+    assert error.returncode == 4
+    assert error.stderr == ["boom"]
+    assert error.command == "sh -c 'echo boom >&2; exit 4'"
+
+
+async def test_exec_mode_missing_binary_raises_without_returncode():
+    with pytest.raises(CommandError) as excinfo:
+        await _collect_exec(["dokker-definitely-not-a-binary", "compose"])
+
+    assert excinfo.value.returncode is None
+    assert "dokker-definitely-not-a-binary" in str(excinfo.value)
+
+
 def test_command_error_is_dokker_error():
     from dokker.errors import DokkerError
 
     assert issubclass(CommandError, DokkerError)
+
+
+async def test_lines_spanning_read_chunks_are_reassembled(monkeypatch):
+    monkeypatch.setattr(command, "READ_CHUNK_SIZE", 7)
+    script = "import sys; sys.stdout.write('first line\\n' + 'x' * 50 + '\\n\\nlast')"
+    lines = await _collect_exec([sys.executable, "-c", script])
+
+    assert lines == [("STDOUT", "first line"), ("STDOUT", "x" * 50), ("STDOUT", ""), ("STDOUT", "last")]
+
+
+async def test_lines_longer_than_the_stream_limit_are_streamed():
+    # ``async for line in stream`` gave up on lines over 64 KiB.
+    script = "print('y' * 200_000)"
+    lines = await _collect_exec([sys.executable, "-c", script])
+
+    assert lines == [("STDOUT", "y" * 200_000)]
+
+
+async def test_many_lines_keep_their_order():
+    script = "for i in range(50_000): print(i)"
+    lines = await _collect_exec([sys.executable, "-c", script])
+
+    assert [int(text) for _, text in lines] == list(range(50_000))
+
+
+async def test_undecodable_output_raises_instead_of_hanging():
+    script = "import sys; sys.stdout.buffer.write(b'\\xff\\n')"
+    with pytest.raises(UnicodeDecodeError):
+        await asyncio.wait_for(_collect_exec([sys.executable, "-c", script]), timeout=10)
+
+
+async def test_closing_the_stream_early_kills_the_command():
+    # ``yes`` floods stdout; with a bounded queue it would block on the pipe
+    # forever once we stop reading, so closing must tear it down.
+    stream = astream_command(["yes"])
+    assert await stream.__anext__() == ("STDOUT", "y")
+    await asyncio.wait_for(stream.aclose(), timeout=10)
+
+
+async def test_raw_mode_yields_undecoded_lines():
+    script = "import sys; sys.stdout.buffer.write(b'  spaced  \\r\\n\\xff\\xfe\\n'); sys.stderr.buffer.write(b'err')"
+    lines = [line async for line in astream_command([sys.executable, "-c", script], raw=True)]
+
+    assert ("STDOUT", b"  spaced  \r") in lines
+    assert ("STDOUT", b"\xff\xfe") in lines
+    assert ("STDERR", b"err") in lines
+
+
+async def test_replace_errors_tolerates_invalid_utf8():
+    script = "import sys; sys.stdout.buffer.write(b'ok \\xff\\n')"
+    lines = [line async for line in astream_command([sys.executable, "-c", script], errors="replace")]
+
+    assert lines == [("STDOUT", "ok �")]
+
+
+async def test_raw_mode_failure_carries_decoded_streams():
+    script = "import sys; sys.stderr.buffer.write(b'bad \\xff\\n'); sys.exit(2)"
+    with pytest.raises(CommandError) as excinfo:
+        [line async for line in astream_command([sys.executable, "-c", script], raw=True)]
+
+    assert excinfo.value.stderr == ["bad �"]
+
+
+async def test_usage_accounts_cpu_and_peak_memory():
+    # Larger than any child before it, so it raises the children's peak.
+    script = "x = bytearray(256 * 2**20); sum(range(2_000_000)); print('done')"
+    with command.collect_usage() as usages:
+        assert await _collect_exec([sys.executable, "-c", script]) == [("STDOUT", "done")]
+
+    (usage,) = usages
+    assert usage.command.startswith(sys.executable)
+    assert usage.wall_time > 0
+    assert usage.user_time is not None and usage.system_time is not None
+    assert usage.cpu_time is not None and usage.cpu_time > 0
+    assert usage.max_rss is not None and usage.max_rss >= 256 * 2**20
+    assert "max rss" in str(usage)
+
+
+async def test_failing_command_carries_its_usage():
+    with command.collect_usage() as usages:
+        with pytest.raises(CommandError) as excinfo:
+            await _collect(["exit 4"])
+
+    assert excinfo.value.usage is not None
+    assert usages == [excinfo.value.usage]
+
+
+async def test_killed_stream_still_reports_usage():
+    with command.collect_usage() as usages:
+        stream = astream_command(["yes"])
+        await stream.__anext__()
+        await asyncio.wait_for(stream.aclose(), timeout=10)
+
+    (usage,) = usages
+    assert usage.cpu_time is not None
+
+
+async def test_overlapping_commands_only_report_wall_time():
+    with command.collect_usage() as usages:
+        await asyncio.gather(
+            _collect_exec([sys.executable, "-c", "import time; time.sleep(0.5)"]),
+            _collect_exec([sys.executable, "-c", "pass"]),
+        )
+
+    slow = max(usages, key=lambda usage: usage.wall_time)
+    assert slow.wall_time >= 0.5
+    assert slow.cpu_time is None and slow.max_rss is None
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="lists processes through /proc")
+async def test_cancelled_startup_leaves_no_process_behind():
+    marker = uuid.uuid4().hex
+    argv = [sys.executable, "-c", "import time; time.sleep(1234)", marker]
+
+    async def consume() -> None:
+        async for _ in astream_command(argv):
+            pass
+
+    tasks = [asyncio.create_task(consume()) for _ in range(20)]
+    for i, task in enumerate(tasks):
+        for _ in range(i % 5):
+            await asyncio.sleep(0)
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    def alive() -> list:
+        pids = []
+        for pid in filter(str.isdigit, os.listdir("/proc")):
+            try:
+                with open(f"/proc/{pid}/cmdline", "rb") as f:
+                    if marker.encode() in f.read():
+                        pids.append(pid)
+            except OSError:
+                pass
+        return pids
+
+    assert alive() == []
+
+
+def test_combined_usage_adds_times_and_keeps_the_peak():
+    first = command.ResourceUsage("a", 1.0, 0.5, 0.25, 100)
+    second = command.ResourceUsage("b", 2.0, 0.5, 0.25, 300)
+    combined = command.ResourceUsage.combine([first, second])
+    assert combined == command.ResourceUsage("a; b", 3.0, 1.0, 0.5, 300)
+    assert command.ResourceUsage.combine([]) is None
+    assert command.ResourceUsage.combine([first, command.ResourceUsage("c", 1.0)]).user_time is None
+
+
+async def test_deployment_attaches_usage_to_logs_and_logger(tmp_path, stub_project):
+    from dokker import CLI, Deployment
+
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text("services: {}\n")
+
+    class UsageLogger:
+        def __init__(self) -> None:
+            self.usages = []
+
+        def on_pull(self, log) -> None: ...
+
+        def on_up(self, log) -> None: ...
+
+        def on_stop(self, log) -> None: ...
+
+        def on_logs(self, log) -> None: ...
+
+        def on_down(self, log) -> None: ...
+
+        def on_usage(self, operation, usage) -> None:
+            self.usages.append((operation, usage))
+
+    usage_logger = UsageLogger()
+    project = stub_project(lambda: CLI(compose_files=[str(compose_file)], client_call=[sys.executable, "-c", "print('pulled')"]))
+    deployment = Deployment(project=project, logger=usage_logger)
+    logs = await deployment.apull()
+
+    assert logs.usage is not None and logs.usage.cpu_time is not None
+    assert usage_logger.usages == [("pull", logs.usage)]
@@ -5,9 +5,13 @@ fails it should raise a specific, typed dokker error with an actionable message
 (what was asked for, and what is actually available).
 """
 
+import json
+
 import pytest
+from pydantic import ValidationError
 
-from dokker.compose_spec import ComposeSpec
+from dokker import compose_spec
+from dokker.compose_spec import ComposeServicePort, ComposeSpec
 from dokker.errors import (
     LabelNotFoundError,
     PortNotFoundError,
@@ -82,3 +86,99 @@ def test_get_label_missing_lists_available_labels():
 def test_get_label_no_labels():
     with pytest.raises(LabelNotFoundError):
         _spec().find_service("db").get_label("role")
+
+
+CONFIG = {
+    "name": "demo",
+    "services": {
+        "web": {"image": "nginx", "ports": [{"target": 80, "published": 8080}], "labels": {"role": "frontend"}},
+        "db": {"image": "postgres"},
+        "broken": {"ports": "not a list"},
+    },
+    "networks": {"default": {"name": "demo_default"}},
+}
+
+
+def test_from_json_validates_services_on_first_lookup():
+    spec = ComposeSpec.from_json(json.dumps(CONFIG).encode())
+    assert spec.networks["default"].name == "demo_default"
+    assert sorted(spec.services) == ["broken", "db", "web"] and "web" in spec.services
+    assert spec.services.validated == []
+
+    web = spec.find_service("web")
+    assert web.get_port_for_internal(80).published == 8080
+    assert spec.find_service("web") is web
+    assert spec.services.validated == ["web"]
+
+    with pytest.raises(ValidationError):
+        spec.find_service("broken")
+    with pytest.raises(ServiceNotFoundError):
+        spec.find_service("missing")
+
+
+def test_lazy_spec_dumps_and_compares_like_an_eager_one():
+    config = {**CONFIG, "services": {name: service for name, service in CONFIG["services"].items() if name != "broken"}}
+    lazy = ComposeSpec.from_json(json.dumps(config))
+    eager = ComposeSpec.from_json(json.dumps(config), lazy=False)
+    assert isinstance(eager.services, dict)
+    assert lazy.model_dump() == eager.model_dump()
+    assert lazy == eager
+
+
+def test_from_json_without_orjson(monkeypatch):
+    monkeypatch.setattr(compose_spec, "orjson", None)
+    spec = ComposeSpec.from_json(json.dumps(CONFIG))
+    assert spec.find_service("db").image == "postgres"
+
+
+GRAPH = {
+    "services": {
+        "proxy": {"image": "nginx", "labels": {"role": "frontend"}, "depends_on": {"api": {"condition": "service_healthy"}}, "ports": [{"target": 80, "published": "8080"}]},
+        "api": {"image": "app:1", "labels": {"role": "backend", "tier": "core"}, "depends_on": {"db": {}, "cache": {}}, "ports": [{"target": 8000, "published": 18000}, {"target": 9000}]},
+        "worker": {"image": "app:1", "labels": {"role": "backend"}, "depends_on": {"db": {}}},
+        "db": {"image": "postgres"},
+        "cache": {"image": "redis"},
+    }
+}
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_index_queries(lazy):
+    spec = ComposeSpec.from_json(json.dumps(GRAPH), lazy=lazy)
+    assert spec.services_with_label("role") == ["proxy", "api", "worker"]
+    assert spec.services_with_label("role", "backend") == ["api", "worker"]
+    assert spec.services_with_label("missing") == []
+    assert spec.services_with_image("app:1") == ["api", "worker"]
+    assert spec.dependencies("api") == ["db", "cache"]
+    assert spec.dependencies("proxy", recursive=True) == ["db", "cache", "api"]
+    assert spec.dependents("db") == ["api", "worker"]
+    assert spec.dependents("db", recursive=True) == ["proxy", "api", "worker"]
+    with pytest.raises(ServiceNotFoundError):
+        spec.dependencies("missing")
+    if lazy:
+        assert spec.services.validated == []
+
+
+def test_published_ports_validate_only_the_services_asked_for():
+    spec = ComposeSpec.from_json(json.dumps(GRAPH))
+    assert spec.published_ports(["proxy", "api", "db"]) == {"proxy": {80: 8080}, "api": {8000: 18000}, "db": {}}
+    assert sorted(spec.services.validated) == ["api", "db", "proxy"]
+    assert spec.published_port("api", 8000) == 18000
+    with pytest.raises(PortNotFoundError):
+        spec.published_port("api", 9000)
+    with pytest.raises(ServiceNotFoundError):
+        spec.published_ports(["missing"])
+    assert set(spec.published_ports()) == set(GRAPH["services"])
+
+
+def test_indexes_follow_replaced_fields_and_keep_equality():
+    spec, other = _spec(), _spec()
+    web = spec.find_service("web")
+    assert web.port_index[80].published == 8080
+    assert spec.services_with_image("nginx") == ["web"]
+    assert spec == other
+
+    web.ports = [ComposeServicePort(target=443, published=8443)]
+    assert web.get_port_for_internal(443).published == 8443
+    spec.services = {"db": other.find_service("db")}
+    assert spec.services_with_image("nginx") == [] and spec.services_with_image("postgres") == ["db"]
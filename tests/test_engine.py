@@ -0,0 +1,277 @@
+"""Unit tests for ``DockerEngineBackend`` against a fake engine.
+
+The fake is a tiny ``aiohttp.web`` app served over a unix socket that answers
+the handful of engine endpoints the backend uses, so the whole HTTP path
+(pooled ``UnixConnector``, stream demultiplexing, error mapping) is exercised
+without a docker daemon.
+"""
+
+import asyncio
+import json
+import os
+import struct
+import tempfile
+
+import pytest
+from aiohttp import web
+
+from dokker import CLI, CommandError, Deployment, DockerEngineBackend, EngineError, LocalProject
+from dokker.engine import _to_unix_timestamp
+
+COMPOSE_FILE = "tests/configs/basic-compose.yaml"
+PROJECT = "fake-project"
+
+
+def _frame(stream: int, payload: bytes) -> bytes:
+    return struct.pack(">BxxxL", stream, len(payload)) + payload
+
+
+def _container(id: str, service: str, number: int = 1, status: str = "running", project: str = PROJECT) -> dict:
+    return {
+        "Id": id,
+        "Name": f"/{project}-{service}-{number}",
+        "Config": {
+            "Tty": False,
+            "Labels": {
+                "com.docker.compose.project": project,
+                "com.docker.compose.service": service,
+                "com.docker.compose.container-number": str(number),
+            },
+        },
+        "State": {"Status": status, "ExitCode": 0, "Health": {"Status": "healthy"}},
+    }
+
+
+class FakeEngine:
+    """Records requests and serves canned container state over a unix socket."""
+
+    def __init__(self) -> None:
+        self.containers = {
+            "c-echo": _container("c-echo", "echo"),
+            "c-worker": _container("c-worker", "worker"),
+            "c-other": _container("c-other", "echo", project="someone-else"),
+        }
+        self.requests: list[tuple[str, str, dict]] = []
+        self.exit_code = 0
+        self.flood = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/containers/json", self.list)
+        app.router.add_get("/containers/{id}/json", self.inspect)
+        app.router.add_get("/containers/{id}/logs", self.logs)
+        app.router.add_post("/containers/{id}/stop", self.lifecycle)
+        app.router.add_post("/containers/{id}/restart", self.lifecycle)
+        app.router.add_post("/containers/{id}/exec", self.exec_create)
+        app.router.add_post("/exec/{id}/start", self.exec_start)
+        app.router.add_get("/exec/{id}/json", self.exec_inspect)
+        return app
+
+    def _record(self, request: web.Request) -> None:
+        self.requests.append((request.method, request.path, dict(request.query)))
+
+    async def list(self, request: web.Request) -> web.Response:
+        self._record(request)
+        labels = json.loads(request.query["filters"])["label"]
+        project = next(label.split("=", 1)[1] for label in labels if label.startswith("com.docker.compose.project="))
+        listed = [{"Id": c["Id"], "Labels": c["Config"]["Labels"]} for c in self.containers.values() if c["Config"]["Labels"]["com.docker.compose.project"] == project]
+        return web.json_response(listed)
+
+    async def inspect(self, request: web.Request) -> web.Response:
+        self._record(request)
+        container = self.containers.get(request.match_info["id"])
+        if container is None:
+            return web.json_response({"message": "No such container"}, status=404)
+        return web.json_response(container)
+
+    async def logs(self, request: web.Request) -> web.StreamResponse:
+        self._record(request)
+        service = self.containers[request.match_info["id"]]["Config"]["Labels"]["com.docker.compose.service"]
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        if self.flood:
+            await resp.write(b"".join(_frame(1, f"line {i}\n".encode()) for i in range(self.flood)))
+        # A line split across two frames, and a stderr line in between.
+        await resp.write(_frame(1, f"hello from {service}\npart".encode()))
+        await resp.write(_frame(2, b"oops\n"))
+        await resp.write(_frame(1, b"ial line\n"))
+        await resp.write_eof()
+        return resp
+
+    async def lifecycle(self, request: web.Request) -> web.Response:
+        self._record(request)
+        return web.Response(status=204)
+
+    async def exec_create(self, request: web.Request) -> web.Response:
+        self._record(request)
+        self.exec_body = await request.json()
+        return web.json_response({"Id": "exec-1"}, status=201)
+
+    async def exec_start(self, request: web.Request) -> web.StreamResponse:
+        self._record(request)
+        resp = web.StreamResponse(headers={"Content-Type": "application/vnd.docker.raw-stream"})
+        await resp.prepare(request)
+        await resp.write(_frame(1, b"out\n") + _frame(2, b"err\n"))
+        await resp.write_eof()
+        return resp
+
+    async def exec_inspect(self, request: web.Request) -> web.Response:
+        self._record(request)
+        return web.json_response({"ExitCode": self.exit_code})
+
+
+@pytest.fixture
+async def engine():
+    fake = FakeEngine()
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    # Unix socket paths are length-limited, so keep it short.
+    directory = tempfile.mkdtemp(prefix="dokker-")
+    socket_path = os.path.join(directory, "docker.sock")
+    site = web.UnixSite(runner, socket_path)
+    await site.start()
+    backend = DockerEngineBackend(socket_path=socket_path)
+    try:
+        yield fake, backend
+    finally:
+        await backend.aclose()
+        await runner.cleanup()
+
+
+def _cli(backend: DockerEngineBackend) -> CLI:
+    return CLI(compose_files=[COMPOSE_FILE], compose_project_name=PROJECT, backend=backend)
+
+
+async def test_inspect_containers_resolves_project_by_label(engine):
+    fake, backend = engine
+    containers = await _cli(backend).ainspect_containers()
+    assert [c.service for c in containers] == ["echo", "worker"]
+    assert containers[0].name == f"{PROJECT}-echo-1"
+    assert containers[0].health == "healthy"
+
+
+async def test_inspect_containers_filters_services(engine):
+    fake, backend = engine
+    containers = await _cli(backend).ainspect_containers("worker")
+    assert [c.id for c in containers] == ["c-worker"]
+
+
+async def test_logs_are_demultiplexed_and_prefixed(engine):
+    fake, backend = engine
+    lines = [line async for line in _cli(backend).astream_docker_logs(services=["echo"], tail="5")]
+    assert lines == [
+        ("STDOUT", "echo-1  | hello from echo"),
+        ("STDERR", "echo-1  | oops"),
+        ("STDOUT", "echo-1  | partial line"),
+    ]
+    logs_request = next(r for r in fake.requests if r[1].endswith("/logs"))
+    assert logs_request[2]["tail"] == "5"
+    assert logs_request[2]["follow"] == "0"
+
+
+async def test_raw_logs_are_prefixed_bytes(engine):
+    fake, backend = engine
+    lines = [line async for line in _cli(backend).astream_docker_logs(services=["echo"], raw=True)]
+    assert ("STDERR", b"echo-1  | oops") in lines
+    assert all(isinstance(line, bytes) for _, line in lines)
+
+
+async def test_logs_without_prefix(engine):
+    fake, backend = engine
+    lines = [line async for line in _cli(backend).astream_docker_logs(services="worker", no_log_prefix=True)]
+    assert ("STDOUT", "hello from worker") in lines
+
+
+async def test_a_consumer_stopping_early_leaves_no_pump_waiting(engine, monkeypatch):
+    fake, backend = engine
+    fake.flood = 5000
+    monkeypatch.setattr("dokker.engine.MAX_QUEUED_LINES", 10)
+
+    async def first_lines() -> list:
+        stream = backend.astream_docker_logs(_cli(backend))
+        lines = [await anext(stream) for _ in range(3)]
+        # Let the pumps fill the queue up again.
+        await asyncio.sleep(0.05)
+        await stream.aclose()
+        return lines
+
+    assert len(await asyncio.wait_for(first_lines(), 5)) == 3
+
+
+async def test_stop_posts_to_every_running_container(engine):
+    fake, backend = engine
+    lines = [line async for line in _cli(backend).astream_stop(timeout=3)]
+    stops = [r for r in fake.requests if r[1].endswith("/stop")]
+    assert sorted(r[1] for r in stops) == ["/containers/c-echo/stop", "/containers/c-worker/stop"]
+    assert all(r[2] == {"t": "3"} for r in stops)
+    assert ("STDERR", f"Container {PROJECT}-echo-1  Stopped") in lines
+
+
+async def test_restart_only_targets_requested_services(engine):
+    fake, backend = engine
+    [line async for line in _cli(backend).astream_restart(services=["echo"])]
+    assert [r[1] for r in fake.requests if r[1].endswith("/restart")] == ["/containers/c-echo/restart"]
+
+
+async def test_exec_streams_output(engine):
+    fake, backend = engine
+    lines = [line async for line in _cli(backend).astream_exec("worker", "echo 'hello world'")]
+    assert lines == [("STDOUT", "out"), ("STDERR", "err")]
+    assert fake.exec_body["Cmd"] == ["echo", "hello world"]
+
+
+async def test_exec_nonzero_exit_raises_command_error(engine):
+    fake, backend = engine
+    fake.exit_code = 5
+    with pytest.raises(CommandError) as excinfo:
+        [line async for line in _cli(backend).astream_exec("worker", ["false"])]
+    assert excinfo.value.returncode == 5
+    assert excinfo.value.stderr == ["err"]
+
+
+async def test_exec_without_running_container_raises(engine):
+    fake, backend = engine
+    with pytest.raises(EngineError):
+        [line async for line in _cli(backend).astream_exec("missing", ["true"])]
+
+
+async def test_engine_error_carries_message(engine):
+    fake, backend = engine
+    with pytest.raises(EngineError) as excinfo:
+        await backend._arequest("GET", "/containers/nope/json")
+    assert "No such container" in str(excinfo.value)
+
+
+async def test_session_is_reused_across_calls(engine):
+    fake, backend = engine
+    cli = _cli(backend)
+    await cli.ainspect_containers()
+    session = backend._session
+    await cli.ainspect_containers()
+    assert backend._session is session
+
+
+async def test_deployment_attaches_and_closes_backend(engine):
+    fake, backend = engine
+    deployment = Deployment(project=LocalProject(compose_files=[COMPOSE_FILE], project_name=PROJECT), backend=backend)
+    async with deployment:
+        cli = await deployment.aget_cli()
+        assert cli.backend is backend
+        await deployment.astop()
+        assert backend._session is not None
+    assert backend._session is None
+    assert any(r[1].endswith("/stop") for r in fake.requests)
+
+
+def test_project_name_defaults_to_normalized_directory(monkeypatch):
+    monkeypatch.delenv("COMPOSE_PROJECT_NAME", raising=False)
+    assert CLI(compose_files=[COMPOSE_FILE]).project_name == "configs"
+    assert CLI(compose_files=[COMPOSE_FILE], compose_project_name="pinned").project_name == "pinned"
+
+
+def test_timestamps_are_converted_for_the_engine():
+    assert _to_unix_timestamp("1700000000") == "1700000000"
+    assert _to_unix_timestamp("2024-01-01T00:00:00Z") == "1704067200"
+    assert int(_to_unix_timestamp("1h30m")) < int(_to_unix_timestamp("1m"))
+    with pytest.raises(EngineError):
+        _to_unix_timestamp("yesterday")
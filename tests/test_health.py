@@ -0,0 +1,177 @@
+"""Unit tests for the health-check runner and retry schedule.
+
+A small ``aiohttp.web`` app on a local TCP port plays the service under test.
+It records which client connection every request arrived on and how many
+requests were in flight at once, so the tests can assert connection reuse and
+the concurrency limit without any containers.
+"""
+
+import asyncio
+import itertools
+import time
+
+import pytest
+from aiohttp import web
+
+from dokker import CLI, Deployment, HealthCheck, HealthCheckError, HealthCheckRunner, LocalProject
+from dokker.compose_spec import ComposeSpec
+
+SPEC = ComposeSpec(services={})
+
+
+class FakeService:
+    """Answers ``/ok`` and ``/fail`` and records connections and concurrency."""
+
+    def __init__(self) -> None:
+        self.peers: set = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delay = 0.0
+        self.fail_first = 0
+        self.requests = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.peers.add(request.transport.get_extra_info("peername"))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        self.requests += 1
+        if request.path == "/fail" or self.requests <= self.fail_first:
+            return web.Response(status=503)
+        return web.Response(text="ok")
+
+
+@pytest.fixture
+async def service():
+    fake = FakeService()
+    app = web.Application()
+    app.router.add_get("/{name}", fake.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    yield fake, f"http://127.0.0.1:{port}"
+    await runner.cleanup()
+
+
+async def test_runner_reuses_one_connection(service):
+    fake, base = service
+    runner = HealthCheckRunner()
+    check = HealthCheck(url=f"{base}/ok", service="web")
+    try:
+        for _ in range(5):
+            assert await runner.acheck(check, SPEC) == "ok"
+    finally:
+        await runner.aclose()
+    assert len(fake.peers) == 1
+
+
+async def test_runner_limits_concurrent_requests(service):
+    fake, base = service
+    fake.delay = 0.05
+    runner = HealthCheckRunner(max_concurrency=2)
+    checks = [HealthCheck(url=f"{base}/ok", service=f"web{i}") for i in range(6)]
+    try:
+        await asyncio.gather(*(runner.acheck(check, SPEC) for check in checks))
+    finally:
+        await runner.aclose()
+    assert fake.max_in_flight == 2
+
+
+async def test_runner_maps_bad_status_to_health_check_error(service):
+    fake, base = service
+    runner = HealthCheckRunner()
+    try:
+        with pytest.raises(HealthCheckError):
+            await runner.acheck(HealthCheck(url=f"{base}/fail", service="web"), SPEC)
+    finally:
+        await runner.aclose()
+
+
+async def test_check_without_runner_still_works(service):
+    fake, base = service
+    assert await HealthCheck(url=f"{base}/ok", service="web").acheck(SPEC) == "ok"
+
+
+def test_ssl_contexts_are_shared_per_ca_file():
+    first = HealthCheck(url="https://a", service="a").resolve_ssl_context()
+    second = HealthCheck(url="https://b", service="b").resolve_ssl_context()
+    assert first is second
+
+
+async def test_deployment_owns_and_closes_the_runner(service):
+    fake, base = service
+    deployment = Deployment(project=LocalProject(), threadpool_workers=3)
+    deployment.add_health_check(url=f"{base}/ok", service="web")
+    deployment.add_health_check(url=f"{base}/ok", service="worker")
+
+    async with deployment:
+        deployment._spec = SPEC
+        deployment._cli = CLI(compose_files=["tests/configs/basic-compose.yaml"])
+        await deployment.acheck_health()
+        await deployment.acheck_health()
+        runner = deployment.health_check_runner
+        assert runner.max_concurrency == 3
+        session = await runner.asession()
+
+    assert session.closed
+    # One connection per concurrent check, reused by the second round.
+    assert len(fake.peers) == 2
+
+
+def _ready_deployment() -> Deployment:
+    deployment = Deployment(project=LocalProject())
+    deployment._spec = SPEC
+    deployment._cli = CLI(compose_files=["tests/configs/basic-compose.yaml"])
+    return deployment
+
+
+def test_fixed_schedule_retries_every_timeout():
+    check = HealthCheck(url="http://a", service="a", initial_interval=None, max_retries=3, timeout=2)
+    assert check.budget is None
+    assert list(check.schedule()) == [2.0, 2.0, 2.0]
+
+
+def test_backoff_schedule_grows_up_to_timeout():
+    check = HealthCheck(url="http://a", service="a", jitter=0, timeout=4)
+    assert check.budget == 12.0
+    assert list(itertools.islice(check.schedule(), 7)) == [0.25, 0.5, 1.0, 2.0, 4.0, 4.0, 4.0]
+
+
+def test_jitter_only_shortens_intervals():
+    check = HealthCheck(url="http://a", service="a", initial_interval=1.0, backoff_factor=1.0, jitter=0.5)
+    intervals = list(itertools.islice(check.schedule(), 200))
+    assert all(0.5 <= interval <= 1.0 for interval in intervals)
+    assert len(set(intervals)) > 1
+
+
+async def test_check_passes_as_soon_as_the_service_is_up(service):
+    fake, base = service
+    fake.fail_first = 3
+    deployment = _ready_deployment()
+    check = HealthCheck(url=f"{base}/ok", service="web", initial_interval=0.01, timeout=10)
+
+    started = time.monotonic()
+    await deployment.arun_check(check)
+    await deployment.health_check_runner.aclose()
+
+    assert fake.requests == 4
+    assert time.monotonic() - started < 1
+
+
+async def test_check_gives_up_at_the_deadline(service):
+    fake, base = service
+    deployment = _ready_deployment()
+    check = HealthCheck(url=f"{base}/fail", service="web", initial_interval=0.02, deadline=0.3, error_with_logs=False)
+
+    started = time.monotonic()
+    with pytest.raises(HealthCheckError, match="attempts"):
+        await deployment.arun_check(check)
+    await deployment.health_check_runner.aclose()
+
+    assert 0.3 <= time.monotonic() - started < 1
+    assert fake.requests > 3
@@ -24,6 +24,7 @@ import pytest
 from dokker import CommandError, Deployment
 from dokker.compose_spec import ComposeSpec
 from dokker.errors import NotInitializedError, TearDownError
+from dokker.tracing import Tracer
 
 
 # --------------------------------------------------------------------------- #
@@ -207,6 +208,75 @@ async def test_manual_cleanups_run_in_lifo_order():
     assert order == ["second", "first"]
 
 
+def _sleeper(order: list, value: str, seconds: float):
+    """Return a cleanup factory that records its start and end around a sleep."""
+
+    async def _cleanup() -> None:
+        order.append(f"{value}:start")
+        await asyncio.sleep(seconds)
+        order.append(f"{value}:end")
+
+    return _cleanup
+
+
+async def test_grouped_cleanups_run_concurrently():
+    rec = Recorder()
+    order: list[str] = []
+    async with make_deployment(rec) as d:
+        d._register_cleanup(_appender(order, "last"))
+        d._register_cleanup(_sleeper(order, "a", 0.05), key="a", group="g")
+        d._register_cleanup(_sleeper(order, "b", 0.05), key="b", group="g")
+    assert order[:2] == ["b:start", "a:start"]
+    assert order[-1] == "last"
+    assert set(d.teardown_durations) == {"a", "b", "_appender.<locals>._cleanup"}
+    assert d.teardown_durations["a"] >= 0.05
+
+
+async def test_after_waits_only_for_its_dependencies():
+    rec = Recorder()
+    order: list[str] = []
+    async with make_deployment(rec) as d:
+        d._register_cleanup(_appender(order, "files"), key="files", after=["down"])
+        d._register_cleanup(_sleeper(order, "down", 0.05), key="down")
+        d._register_cleanup(_sleeper(order, "other", 0.05), key="other", after=[])
+    assert order.index("down:end") < order.index("files")
+    assert order.index("other:start") < order.index("down:end")
+
+
+async def test_failed_step_skips_its_dependents_only():
+    rec = Recorder()
+    order: list[str] = []
+
+    async def _fail() -> None:
+        raise CommandError("down failed")
+
+    with pytest.raises(CommandError, match="down failed"):
+        async with make_deployment(rec) as d:
+            d._register_cleanup(_appender(order, "files"), key="files", after=["down"])
+            d._register_cleanup(_fail, key="down")
+            d._register_cleanup(_appender(order, "other"), key="other", after=[])
+    assert order == ["other"]
+    assert "down" not in d.teardown_durations
+
+
+async def test_cyclic_cleanups_raise():
+    rec = Recorder()
+    with pytest.raises(TearDownError, match="wait for each other"):
+        async with make_deployment(rec) as d:
+            d._register_cleanup(_appender([], "a"), key="a", after=["b"])
+            d._register_cleanup(_appender([], "b"), key="b", after=["a"])
+
+
+async def test_timeout_cancels_concurrent_cleanups():
+    rec = Recorder()
+    order: list[str] = []
+    with pytest.raises(TearDownError):
+        async with make_deployment(rec, teardown_timeout=0.05) as d:
+            d._register_cleanup(_sleeper(order, "a", 1), group="g")
+            d._register_cleanup(_sleeper(order, "b", 1), group="g")
+    assert order == ["b:start", "a:start"]
+
+
 async def test_up_down_on_exit_downs_on_exit():
     rec = Recorder()
     async with make_deployment(rec) as d:
@@ -547,3 +617,19 @@ def test_sync_context_registers_and_tears_down():
     with make_deployment(rec) as d:
         d.up(down_on_exit=True)
     assert rec.count("astream_down") == 1
+
+
+async def test_independent_teardown_steps_overlap_down():
+    rec = Recorder()
+    tracer = Tracer()
+    async with make_deployment(rec, sleep_on={"astream_down": 0.1}, policy="testing", tracer=tracer) as d:
+        await d.ainitialize()
+        d.log_hub
+        await d.aup()
+
+    steps = {span.attributes["step"]: span for span in tracer.spans if span.name == "teardown_step"}
+    assert set(steps) == {"down", "log_hub", "project_teardown"}
+    # The log hub does not wait for down; the project teardown does.
+    assert steps["log_hub"].end_time < steps["down"].end_time
+    assert steps["project_teardown"].start_time >= steps["down"].end_time
+    assert rec.events[-2:] == ["astream_down", "atear_down"]
@@ -0,0 +1,182 @@
+"""Unit tests for the on-disk ``LogArchive`` and archiving watchers."""
+
+import asyncio
+import os
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+from dokker import CLI, LogArchive, LogRecord, LogWatcher
+from dokker.log_archive import archive_path, archived_runs
+from dokker.log_watcher import format_log_watcher_message
+from dokker.projects.copy import CopyPathProject
+
+
+def _at(second: int) -> datetime:
+    return datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc) + timedelta(seconds=second)
+
+
+def _fill(archive: LogArchive, count: int) -> None:
+    for i in range(count):
+        archive.append(LogRecord("web" if i % 2 else "db", 1, "STDERR" if i % 3 == 0 else "STDOUT", _at(i), f"line {i}"))
+
+
+def test_round_trips_every_field_across_blocks_and_segments(tmp_path):
+    archive = LogArchive(tmp_path / "run", segment_bytes=600, block_bytes=200)
+    records = [
+        LogRecord("web", 2, "STDOUT", _at(1).replace(microsecond=123456), "tabs\tand\nnewlines \\n"),
+        LogRecord(None, None, "STDERR", None, "WARN no prefix"),
+        LogRecord("db", None, "STDOUT", datetime(2024, 5, 1, 14, 0, tzinfo=timezone(timedelta(hours=2))), ""),
+    ]
+    for record in records:
+        archive.append(record)
+    _fill(archive, 200)
+    archive.close()
+
+    segments = sorted(name for name in os.listdir(tmp_path / "run") if name.endswith(".log"))
+    assert len(segments) > 1
+    reopened = LogArchive.open(tmp_path / "run")
+    assert len(reopened) == 203
+    assert list(reopened)[:3] == records
+    assert list(reopened) == list(archive)
+
+
+def test_tail_only_decompresses_the_last_blocks(tmp_path):
+    archive = LogArchive(tmp_path, block_bytes=300)
+    _fill(archive, 1000)
+    archive.append(LogRecord("web", 1, "STDOUT", None, "pending"))
+
+    tail = archive.tail(5)
+    assert [r.message for r in tail] == ["line 996", "line 997", "line 998", "line 999", "pending"]
+    assert archive.tail(0) == []
+    assert len(archive.tail(5000)) == 1001
+
+    decompressed = []
+    reads = archive._read
+    archive._read = lambda blocks: (decompressed.append(len(blocks)), reads(blocks))[1]  # type: ignore[method-assign]
+    archive.tail(20)
+    assert decompressed[0] <= 3
+
+
+def test_between_skips_blocks_by_their_index(tmp_path):
+    archive = LogArchive(tmp_path, block_bytes=300)
+    _fill(archive, 1000)
+    archive.append(LogRecord(None, None, "STDERR", None, "no timestamp"))
+    archive.close()
+
+    window = list(LogArchive.open(tmp_path).between(_at(500), _at(510), service="web"))
+    assert [r.message for r in window] == [f"line {i}" for i in range(501, 510, 2)]
+
+    selected = []
+    reads = archive._read
+    archive._read = lambda blocks: (selected.append(len(blocks)), reads(blocks))[1]  # type: ignore[method-assign]
+    assert len(list(archive.between(_at(500), _at(510)))) == 10
+    assert selected[0] < len(archive._blocks) // 10
+    assert [r.message for r in archive.between(until=_at(2))] == ["line 0", "line 1"]
+    naive = [r.message for r in archive.between(_at(500).replace(tzinfo=None), _at(503).replace(tzinfo=None))]
+    assert naive == ["line 500", "line 501", "line 502"]
+
+
+def test_stream_generators_and_unflushed_records(tmp_path):
+    archive = LogArchive(tmp_path)
+    _fill(archive, 6)
+    assert archive._blocks == []
+    assert list(archive.stderr_gen) == ["db-1  | line 0", "web-1  | line 3"]
+    assert archive.stdout == "web-1  | line 1\ndb-1  | line 2\ndb-1  | line 4\nweb-1  | line 5"
+
+    archive.close()
+    assert list(LogArchive.open(tmp_path).stderr_gen) == ["db-1  | line 0", "web-1  | line 3"]
+
+
+def test_reopening_for_writing_appends(tmp_path):
+    first = LogArchive(tmp_path, block_bytes=50)
+    _fill(first, 10)
+    first.close()
+    second = LogArchive(tmp_path, block_bytes=50)
+    second.append(LogRecord("web", 1, "STDOUT", None, "again"))
+    second.close()
+    assert [r.message for r in LogArchive.open(tmp_path).tail(2)] == ["line 9", "again"]
+
+
+async def test_async_appends_write_blocks_off_the_loop(tmp_path, monkeypatch):
+    archive = LogArchive(tmp_path / "run", block_bytes=200)
+    loop_thread = threading.get_ident()
+    writers = set()
+    write = archive._write
+
+    def recording_write(records, text):
+        writers.add(threading.get_ident())
+        return write(records, text)
+
+    monkeypatch.setattr(archive, "_write", recording_write)
+    for i in range(100):
+        await archive.aappend(LogRecord("web", 1, "STDOUT", _at(i), f"line {i}"))
+    await archive.aclose()
+
+    assert writers and loop_thread not in writers
+    assert [r.message for r in LogArchive.open(tmp_path / "run")] == [f"line {i}" for i in range(100)]
+
+
+async def test_cancelled_flush_still_records_its_block(tmp_path):
+    archive = LogArchive(tmp_path / "run")
+    for i in range(10):
+        await archive.aappend(LogRecord("web", 1, "STDOUT", _at(i), f"line {i}"))
+    flush = asyncio.ensure_future(archive.aflush())
+    await asyncio.sleep(0)
+    flush.cancel()
+    assert len(archive) == 10
+    await archive.aclose()
+
+    assert len(archive._blocks) == 1
+    assert len(LogArchive.open(tmp_path / "run")) == 10
+
+
+def test_archived_runs_sort_by_time(tmp_path):
+    for run in ("20240501-120000-000000", "20240430-090000-000000"):
+        LogArchive(archive_path(tmp_path, "demo", run)).close()
+    assert [os.path.basename(run) for run in archived_runs(tmp_path, "demo")] == ["20240430-090000-000000", "20240501-120000-000000"]
+    assert archived_runs(tmp_path, "missing") == []
+
+
+async def test_watcher_archives_and_formats_the_tail(tmp_path):
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text("services: {}\n")
+    script = "import sys\nfor i in range(50): print(f'web-1  | 2024-05-01T12:00:{i:02d}Z line {i}')\nsys.stdout.flush()\n"
+
+    class Bearer:
+        async def aget_cli(self) -> CLI:
+            return CLI(compose_files=[str(compose_file)], client_call=[sys.executable, "-c", script], compose_project_name="demo")
+
+    watcher = LogWatcher(cli_bearer=Bearer(), follow=False, timestamps=True, archive=True, archive_dir=str(tmp_path / "run"), max_lines=5, traceback_lines=3)
+    async with watcher:
+        assert watcher._watch_task is not None
+        await watcher._watch_task
+
+    assert len(watcher.collected_logs) == 5
+    archived = LogArchive.open(tmp_path / "run")
+    assert len(archived) == 50
+    assert [r.message for r in archived.between(_at(10), _at(12))] == ["line 10", "line 11"]
+
+    message = format_log_watcher_message(watcher, ValueError("boom"))
+    assert "47 earlier lines are in the archive" in message
+    assert message.endswith("web-1  | line 47\nweb-1  | line 48\nweb-1  | line 49")
+
+
+async def test_mirror_teardown_keeps_the_log_archives(tmp_path):
+    source = tmp_path / "project"
+    source.mkdir()
+    (source / "docker-compose.yml").write_text("services: {}\n")
+    project = CopyPathProject(project_path=str(source), base_dir=str(tmp_path / ".dokker"))
+
+    cli = await project.ainititialize()
+    run = archive_path(tmp_path / ".dokker", "project")
+    archive = LogArchive(run)
+    archive.append(LogRecord("web", 1, "STDOUT", None, "kept"))
+    archive.close()
+    await project.atear_down(cli)
+
+    assert os.listdir(tmp_path / ".dokker" / "project") == ["logs"]
+    assert [r.message for r in LogArchive.open(run)] == ["kept"]
+    # The leftover archives do not block the next mirror.
+    await project.ainititialize()
+    assert (tmp_path / ".dokker" / "project" / "docker-compose.yml").exists()
@@ -0,0 +1,188 @@
+"""Unit tests for ``LogHub``, the shared follow stream of log watchers.
+
+A python script stands in for ``docker compose``: ``logs`` records its
+arguments, prints one prefixed line per requested service (all of ``web`` and
+``db`` when none are given) and, with ``--follow``, waits to be killed. The
+tests count the recorded invocations to see how many processes were spawned.
+"""
+
+import asyncio
+import sys
+
+from dokker import CLI, Deployment, LocalProject, LogWatcher
+from dokker.log_hub import DEFAULT_HISTORY, LogHub
+
+SCRIPT = """
+import sys, time
+args = sys.argv[1:]
+open({calls!r}, "a").write(" ".join(args) + "\\n")
+index = args.index("logs")
+services = [a for a in args[index + 1:] if not a.startswith("--")] or ["web", "db"]
+for service in services:
+    print(f"{{service}}-1  | hello from {{service}}", flush=True)
+print("no prefix here", flush=True)
+if "--follow" in args:
+    time.sleep(30)
+"""
+
+
+class Bearer:
+    """Hands out a CLI running the fake compose script."""
+
+    def __init__(self, tmp_path) -> None:
+        self.calls = tmp_path / "calls"
+        self.calls.touch()
+        self.script = tmp_path / "compose.py"
+        self.script.write_text(SCRIPT.format(calls=str(self.calls)))
+        self.compose_file = tmp_path / "docker-compose.yml"
+        self.compose_file.write_text("services: {}\n")
+
+    async def aget_cli(self) -> CLI:
+        return CLI(compose_files=[str(self.compose_file)], client_call=[sys.executable, str(self.script)])
+
+    @property
+    def invocations(self) -> list:
+        return self.calls.read_text().splitlines()
+
+
+async def _drain(subscription, count: int) -> list:
+    logs = []
+    async for log in subscription:
+        logs.append(log)
+        if len(logs) == count:
+            break
+    return logs
+
+
+async def test_overlapping_watchers_share_one_process(tmp_path):
+    bearer = Bearer(tmp_path)
+    hub = LogHub(bearer)
+    both = LogWatcher(cli_bearer=bearer, hub=hub, services=["web", "db"])
+    web = LogWatcher(cli_bearer=bearer, hub=hub, services=["web"])
+
+    async with both:
+        async with web:
+            await asyncio.sleep(0.1)
+            assert hub.streams == 1
+
+    assert len(bearer.invocations) == 1
+    assert ("STDOUT", "web-1  | hello from web") in web.collected_logs
+    assert not any("db" in line for _, line in web.collected_logs)
+    assert {line for _, line in both.collected_logs} >= {"web-1  | hello from web", "db-1  | hello from db"}
+    assert hub.streams == 0
+
+
+async def test_new_services_widen_the_one_stream(tmp_path):
+    bearer = Bearer(tmp_path)
+    hub = LogHub(bearer)
+
+    async with hub.subscribe(["web"]) as web:
+        await _drain(web, 1)
+        async with hub.subscribe(["web", "db"]) as both:
+            logs = await _drain(both, 3)
+            assert hub.streams == 1
+        await asyncio.sleep(0.1)
+
+    # The stream restarts over web and db; the web line it prints again is
+    # skipped, the one the newcomer gets is replayed from the history.
+    assert sorted(line for _, line in logs if "|" in line) == ["db-1  | hello from db", "web-1  | hello from web"]
+    assert [call.split("--follow")[-1].split() for call in bearer.invocations] == [["web"], ["web", "db"]]
+    assert [item for item, _ in web._queue if item is not None and "|" in item[1]] == []
+    assert hub.streams == 0
+
+
+async def test_a_slow_subscriber_holds_the_stream_back(tmp_path):
+    bearer = Bearer(tmp_path)
+    bearer.script.write_text(MANY)
+    hub = LogHub(bearer)
+
+    async with hub.subscribe(max_lines=10) as slow:
+        await asyncio.sleep(0.5)
+        assert len(slow._queue) == 10
+        assert len(await _drain(slow, 5000)) == 5000
+
+
+async def test_late_subscriber_gets_the_history(tmp_path):
+    bearer = Bearer(tmp_path)
+    hub = LogHub(bearer)
+
+    async with hub.subscribe() as first:
+        await _drain(first, 3)
+        async with hub.subscribe(["db"], no_log_prefix=True) as late:
+            assert await _drain(late, 2) == [("STDOUT", "hello from db"), ("STDOUT", "no prefix here")]
+
+    assert len(bearer.invocations) == 1
+
+
+async def test_different_options_do_not_share(tmp_path):
+    bearer = Bearer(tmp_path)
+    hub = LogHub(bearer)
+
+    async with hub.subscribe(["web"]), hub.subscribe(["web"], timestamps=True):
+        assert hub.streams == 2
+
+
+async def test_deployment_watchers_use_the_hub_and_close_it(tmp_path):
+    bearer = Bearer(tmp_path)
+    deployment = Deployment(project=LocalProject())
+    deployment._cli = await bearer.aget_cli()
+
+    async with deployment:
+        deployment._cli = await bearer.aget_cli()
+        hub = deployment.log_hub
+        watcher = deployment.create_watcher("web")
+        assert watcher.hub is hub
+        assert deployment.create_watcher("web", share=False).hub is None
+        await watcher.__aenter__()
+        assert hub.streams == 1
+
+    assert hub.streams == 0
+    await watcher.__aexit__(None, None, None)
+
+
+async def test_structured_subscribers_get_records(tmp_path):
+    bearer = Bearer(tmp_path)
+    hub = LogHub(bearer)
+
+    async with hub.subscribe(["web", "db"], structured=True) as records:
+        logs = await _drain(records, 3)
+
+    assert sorted((r.service, r.message) for r in logs if r.service) == [("db", "hello from db"), ("web", "hello from web")]
+
+
+MANY = """
+import sys, time
+for i in range(5000):
+    print(f"web-1  | line {i}")
+sys.stdout.flush()
+time.sleep(30)
+"""
+
+
+async def test_history_is_bounded_by_the_subscribers_caps(tmp_path):
+    bearer = Bearer(tmp_path)
+    bearer.script.write_text(MANY)
+    hub = LogHub(bearer)
+
+    watcher = LogWatcher(cli_bearer=bearer, hub=hub, max_lines=10)
+    async with watcher:
+        await watcher.await_pattern("line 4999$", timeout=10)
+        (group,) = hub._groups.values()
+        assert len(watcher.collected_logs) == 10
+        assert len(group.history) == 10
+
+        # An uncapped subscriber raises the bound to the hub's history only.
+        async with hub.subscribe() as late:
+            assert len(await _drain(late, 10)) == 10
+            assert group.max_lines == DEFAULT_HISTORY
+
+    async with hub.subscribe(max_bytes=50) as small:
+        await _drain(small, 5000)
+        (group,) = hub._groups.values()
+        assert 0 < group.history_bytes <= 50
+
+    unbounded = LogHub(bearer, history=None)
+    async with unbounded.subscribe() as subscription:
+        await _drain(subscription, 5000)
+        (group,) = unbounded._groups.values()
+        assert len(group.history) == 5000
@@ -0,0 +1,101 @@
+"""Unit tests for ``PatternMatcher`` and ``LogWatcher.await_pattern``."""
+
+import re
+import sys
+
+import pytest
+
+from dokker import CLI, LogPatternNotFoundError, LogWatcher
+from dokker.log_matcher import MAX_MATCH_POSITIONS, PatternMatcher
+
+
+def test_matcher_indexes_every_tracked_pattern():
+    matcher = PatternMatcher()
+    matcher.track("ready", None, [])
+    matcher.track(re.compile("ERROR", re.IGNORECASE), "db", [])
+    for position, (service, message) in enumerate([("web", "booting"), ("db", "error: disk"), ("web", "ready"), ("db", "ready, error free")]):
+        matcher.feed(position, service, message, message)
+
+    assert matcher.positions("ready") == [2, 3]
+    assert matcher.positions(re.compile("ERROR", re.IGNORECASE), "db") == [1, 3]
+    assert matcher.positions("never") == []
+
+
+def test_matcher_catches_up_once_and_falls_back_without_combining():
+    matcher = PatternMatcher()
+    # A numbered backreference cannot be folded into the alternation.
+    matcher.track(r"(\w)\1", None, [(0, "web", "hello", "hello"), (1, "web", "bye", "bye")])
+    matcher.feed(2, "web", "moon", "moon")
+
+    assert matcher.positions(r"(\w)\1") == [0, 2]
+
+
+def test_matcher_keeps_only_the_most_recent_positions():
+    matcher = PatternMatcher()
+    tracked = matcher.track("tick", None, [])
+    for position in range(MAX_MATCH_POSITIONS + 50):
+        matcher.feed(position, None, "tick", "tick")
+
+    assert matcher.count("tick") == MAX_MATCH_POSITIONS + 50
+    assert matcher.positions("tick") == list(range(50, MAX_MATCH_POSITIONS + 50))
+    # The first match still resolves waits at once.
+    assert tracked.first == (0, "tick")
+
+
+async def test_closed_matcher_fails_waits():
+    matcher = PatternMatcher()
+    tracked = matcher.track("ready", None, [])
+    matcher.close(LogPatternNotFoundError("gone"))
+    with pytest.raises(LogPatternNotFoundError, match="gone"):
+        await matcher.await_match(tracked)
+
+
+def _watcher(tmp_path, script: str, **kwargs) -> LogWatcher:
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text("services: {}\n")
+
+    class Bearer:
+        async def aget_cli(self) -> CLI:
+            return CLI(compose_files=[str(compose_file)], client_call=[sys.executable, "-c", script])
+
+    return LogWatcher(cli_bearer=Bearer(), **kwargs)
+
+
+SCRIPT = """
+import time
+print("db-1  | ready to accept connections", flush=True)
+print("web-1  | starting", flush=True)
+time.sleep(0.2)
+print("web-1  | listening on :80", flush=True)
+time.sleep(30)
+"""
+
+
+async def test_await_pattern_waits_for_a_new_line(tmp_path):
+    async with _watcher(tmp_path, SCRIPT) as watcher:
+        assert await watcher.await_pattern(r"listening on :\d+", service="web", timeout=5) == ("STDOUT", "web-1  | listening on :80")
+        assert watcher.match_positions(r"listening on :\d+", service="web") == [2]
+
+
+async def test_await_pattern_finds_lines_logged_before_the_call(tmp_path):
+    async with _watcher(tmp_path, SCRIPT) as watcher:
+        await watcher.await_pattern("listening", timeout=5)
+        assert await watcher.await_pattern("ready", service="db", timeout=0.01) == ("STDOUT", "db-1  | ready to accept connections")
+
+
+async def test_await_pattern_times_out(tmp_path):
+    async with _watcher(tmp_path, SCRIPT) as watcher:
+        with pytest.raises(LogPatternNotFoundError, match="ready.*web"):
+            await watcher.await_pattern("ready", service="web", timeout=0.3)
+
+
+async def test_await_pattern_fails_when_the_stream_ends(tmp_path):
+    async with _watcher(tmp_path, "print('web-1  | bye')", follow=False) as watcher:
+        with pytest.raises(LogPatternNotFoundError, match="ended"):
+            await watcher.await_pattern("ready", timeout=5)
+
+
+async def test_await_pattern_returns_records_in_structured_mode(tmp_path):
+    async with _watcher(tmp_path, SCRIPT, structured=True) as watcher:
+        record = await watcher.await_pattern("listening", service="web", timeout=5)
+    assert (record.service, record.message) == ("web", "listening on :80")
@@ -0,0 +1,84 @@
+"""Unit tests for ``LogRecord`` parsing and the structured watcher mode."""
+
+import asyncio
+import sys
+from datetime import datetime, timezone
+
+from dokker import CLI, LogRecord, LogWatcher
+from dokker.log_record import filter_records, split_prefix, split_raw_prefix
+
+
+def _at(second: int) -> datetime:
+    return datetime(2024, 5, 1, 12, 0, second, tzinfo=timezone.utc)
+
+
+def test_parse_prefix_and_timestamp():
+    record = LogRecord.parse(("STDOUT", "web-2  | 2024-05-01T12:00:03.123456789Z GET / 200"), timestamps=True)
+    assert (record.service, record.replica, record.stream) == ("web", 2, "STDOUT")
+    assert record.timestamp == _at(3).replace(microsecond=123456)
+    assert record.message == "GET / 200"
+    assert record.as_log() == ("STDOUT", "web-2  | GET / 200")
+
+
+def test_parse_without_prefix_or_timestamp():
+    record = LogRecord.parse(("STDERR", "WARN[0000] the attribute `version` is obsolete"), timestamps=True)
+    assert (record.service, record.replica, record.timestamp) == (None, None, None)
+    assert record.message == "WARN[0000] the attribute `version` is obsolete"
+
+
+def test_parse_keeps_pipes_in_the_message_and_decodes_bytes():
+    record = LogRecord.parse(("STDOUT", b"my_app_db_1  | a | b \xff"))
+    assert (record.service, record.replica) == ("my_app_db", 1)
+    assert record.message == "a | b �"
+
+
+def test_prefix_only_at_the_start_of_the_line():
+    record = LogRecord.parse(("STDERR", "WARN[0000] a | b"))
+    assert (record.service, record.message) == (None, "WARN[0000] a | b")
+    assert split_prefix("no prefix | here") == (None, "no prefix | here")
+
+
+def test_prefixed_empty_line_keeps_its_service():
+    record = LogRecord.parse(("STDOUT", b"web-1  | \n"))
+    assert (record.service, record.replica, record.message) == ("web", 1, "")
+    assert split_prefix("web-1  |") == ("web-1", "")
+    assert split_raw_prefix(b"web-1  | \n") == ("web-1", b"\n")
+
+
+def test_records_are_slotted():
+    record = LogRecord("web", 1, "STDOUT", None, "hi")
+    assert not hasattr(record, "__dict__")
+
+
+def test_filter_by_service_stream_and_window():
+    records = [
+        LogRecord("web", 1, "STDOUT", _at(1), "a"),
+        LogRecord("db", 1, "STDOUT", _at(2), "b"),
+        LogRecord("web", 1, "STDERR", _at(3), "c"),
+        LogRecord(None, None, "STDERR", None, "d"),
+    ]
+    assert [r.message for r in filter_records(records, service="web")] == ["a", "c"]
+    assert [r.message for r in filter_records(records, stream="STDERR")] == ["c", "d"]
+    assert [r.message for r in filter_records(records, since=_at(2), until=_at(3))] == ["b"]
+    assert [r.message for r in filter_records(records, service=["web", "db"], since=_at(2))] == ["b", "c"]
+
+
+async def test_structured_watcher_collects_records(tmp_path):
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text("services: {}\n")
+    script = "print('web-1  | 2024-05-01T12:00:01Z up'); print('db-1  | 2024-05-01T12:00:02Z ready')"
+
+    class Bearer:
+        async def aget_cli(self) -> CLI:
+            return CLI(compose_files=[str(compose_file)], client_call=[sys.executable, "-c", script])
+
+    seen = []
+    watcher = LogWatcher(cli_bearer=Bearer(), follow=False, timestamps=True, structured=True, log_function=seen.append)
+    async with watcher:
+        while len(seen) < 2:
+            await asyncio.sleep(0.01)
+
+    assert seen == watcher.records
+    assert [r.message for r in watcher.select(service="db")] == ["ready"]
+    assert [r.service for r in watcher.select(since=_at(1), until=_at(2))] == ["web"]
+    assert watcher.collected_logs.stdout_list == ["web-1  | up", "db-1  | ready"]
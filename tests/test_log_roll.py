@@ -5,6 +5,8 @@ service, so the stdout/stderr split has to be correct -- a container's error
 output lives on stderr, and confusing the two hides failures.
 """
 
+import sys
+
 from dokker.cli import CLI
 from dokker.log_watcher import LogRoll, LogWatcher, format_log_watcher_message
 
@@ -71,3 +73,207 @@ def test_format_log_watcher_message_respects_capture_stdout_false():
     # With stdout capture disabled, only stderr lines should be carried over.
     assert "something broke" in message
     assert "starting up" not in message
+
+
+def test_roll_compares_equal_to_a_list_of_lines():
+    assert _sample_roll() == [("STDOUT", "starting up"), ("STDERR", "something broke"), ("STDOUT", "done")]
+    assert _sample_roll()[1] == ("STDERR", "something broke")
+
+
+def test_bounded_by_lines_keeps_most_recent_window():
+    roll = LogRoll(max_lines=2)
+    for i in range(5):
+        roll.append(("STDOUT", f"line {i}"))
+
+    assert list(roll) == [("STDOUT", "line 3"), ("STDOUT", "line 4")]
+    assert roll.dropped == 3
+    assert roll.stdout == "line 3\nline 4"
+
+
+def test_bounded_by_bytes_evicts_oldest_first():
+    roll = LogRoll(max_bytes=10)
+    roll.append(("STDOUT", "aaaa"))
+    roll.append(("STDERR", "bbbb"))
+    roll.append(("STDOUT", "cccc"))
+
+    assert roll.stdout_list == ["cccc"]
+    assert roll.stderr_list == ["bbbb"]
+    assert roll.nbytes == 8
+    assert roll.dropped == 1
+
+
+def test_bounded_by_bytes_counts_utf8_and_keeps_newest_line():
+    roll = LogRoll(max_bytes=4)
+    roll.append(("STDOUT", "ok"))
+    roll.append(("STDOUT", "ééé"))  # 6 bytes, larger than the cap on its own
+
+    assert list(roll) == [("STDOUT", "ééé")]
+    assert roll.dropped == 1
+
+
+def test_unbounded_roll_never_drops():
+    roll = LogRoll()
+    roll.extend(("STDOUT", str(i)) for i in range(1000))
+    assert len(roll) == 1000
+    assert roll.dropped == 0
+
+
+def test_format_log_watcher_message_mentions_dropped_lines():
+    watcher = LogWatcher(cli_bearer=_DummyBearer(), services=["mikro"])
+    watcher.collected_logs = LogRoll(max_lines=1)
+    watcher.collected_logs.extend(_sample_roll())
+
+    message = format_log_watcher_message(watcher, ValueError("request failed"))
+
+    assert "2 earlier lines were dropped" in message
+    assert "done" in message
+    assert "starting up" not in message
+
+
+def test_deployment_threads_log_caps_into_watchers():
+    from dokker import Deployment, LocalProject
+
+    deployment = Deployment(project=LocalProject(), max_log_lines=100, max_log_bytes=1000)
+    watcher = deployment.create_watcher("mikro")
+    assert (watcher.max_lines, watcher.max_bytes) == (100, 1000)
+    assert deployment.create_watcher("mikro", max_lines=5).max_lines == 5
+    assert deployment._new_log_roll().max_lines == 100
+
+
+def test_unknown_source_is_rejected():
+    import pytest
+
+    with pytest.raises(ValueError):
+        LogRoll().append(("STDIN", "nope"))
+
+
+def test_indexing_and_slicing_follow_list_semantics():
+    roll = _sample_roll()
+    assert roll[-1] == ("STDOUT", "done")
+    assert roll[1:] == [("STDERR", "something broke"), ("STDOUT", "done")]
+    assert roll[::-1][0] == ("STDOUT", "done")
+
+
+def test_non_utf8_safe_text_round_trips():
+    roll = LogRoll()
+    roll.append(("STDOUT", "snowman ☃ and a lone surrogate \udcff"))
+    assert roll.stdout == "snowman ☃ and a lone surrogate \udcff"
+
+
+def test_bounded_roll_stays_consistent_across_compactions():
+    roll = LogRoll(max_lines=10)
+    for i in range(5000):
+        roll.append(("STDERR" if i % 3 == 0 else "STDOUT", f"line {i}"))
+
+    expected = [("STDERR" if i % 3 == 0 else "STDOUT", f"line {i}") for i in range(4990, 5000)]
+    assert list(roll) == expected
+    assert roll.stderr_list == [text for source, text in expected if source == "STDERR"]
+    assert roll.stdout_list == [text for source, text in expected if source == "STDOUT"]
+    assert roll.dropped == 4990
+    # Evicted lines do not pile up in the arena.
+    assert len(roll._lines) < 2 * 1024
+
+
+def test_lines_containing_newlines_stay_separate():
+    roll = LogRoll()
+    roll.append(("STDOUT", "first\nstill first"))
+    roll.append(("STDOUT", ""))
+    roll.append(("STDOUT", "second"))
+    assert roll.stdout_list == ["first\nstill first", "", "second"]
+    assert roll.stdout == "first\nstill first\n\nsecond"
+
+
+def test_nbytes_tracks_retained_text_across_streams():
+    roll = _sample_roll()
+    assert roll.nbytes == len("starting up") + len("something broke") + len("done")
+
+
+def test_raw_lines_are_stored_and_read_leniently():
+    roll = LogRoll()
+    roll.append_bytes(("STDOUT", b"caf\xc3\xa9"))
+    roll.append_bytes(("STDERR", b"bad \xff"))
+    roll.append(("STDOUT", "text \ud800"))
+
+    assert roll.stdout_list == ["café", "text \ud800"]
+    assert roll.stderr == "bad �"
+    assert roll[1] == ("STDERR", "bad �")
+
+
+async def test_raw_watcher_forwards_bytes(tmp_path):
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text("services: {}\n")
+    script = "import sys; sys.stdout.buffer.write(b'web-1  | \\xff\\xfe binary\\n')"
+
+    class Bearer:
+        async def aget_cli(self) -> CLI:
+            return CLI(compose_files=[str(compose_file)], client_call=[sys.executable, "-c", script])
+
+    forwarded = []
+    watcher = LogWatcher(cli_bearer=Bearer(), follow=False, raw=True, log_function=forwarded.append)
+    async with watcher:
+        pass
+
+    assert forwarded == [("STDOUT", b"web-1  | \xff\xfe binary")]
+    assert watcher.collected_logs.stdout == "web-1  | �� binary"
+
+
+def test_list_mutators_keep_working():
+    roll = _sample_roll()
+    roll[0] = ("STDERR", "replaced")
+    roll.insert(1, ("STDOUT", "inserted"))
+    del roll[-1]
+    roll += [("STDOUT", "tail")]
+
+    assert roll == [("STDERR", "replaced"), ("STDOUT", "inserted"), ("STDERR", "something broke"), ("STDOUT", "tail")]
+    assert roll.stderr_list == ["replaced", "something broke"]
+    assert roll.stdout_list == ["inserted", "tail"]
+
+    roll[1:3] = [("STDOUT", "middle")]
+    assert roll.pop() == ("STDOUT", "tail")
+    roll.remove(("STDERR", "replaced"))
+    assert roll == [("STDOUT", "middle")]
+    assert roll + [("STDERR", "x")] == [("STDOUT", "middle"), ("STDERR", "x")]
+
+
+def test_sort_reverse_and_copy():
+    roll = _sample_roll()
+    roll.returncode = 3
+    copy = roll.copy()
+    roll.sort(key=lambda log: log[1])
+    assert [text for _, text in roll] == ["done", "something broke", "starting up"]
+    roll.reverse()
+    assert roll[0] == ("STDOUT", "starting up")
+
+    assert copy == _sample_roll()
+    assert copy.returncode == 3
+
+
+def test_a_failing_mutation_leaves_the_roll_intact():
+    import pytest
+
+    roll = _sample_roll()
+    with pytest.raises(IndexError):
+        roll[7] = ("STDOUT", "nope")
+    with pytest.raises(ValueError):
+        roll[0] = ("STDIN", "nope")
+    assert roll == _sample_roll()
+
+
+def test_mutating_a_bounded_roll_respects_its_cap():
+    roll = LogRoll(max_lines=2)
+    roll.extend([("STDOUT", "a"), ("STDOUT", "b")])
+    roll.insert(0, ("STDOUT", "first"))
+    assert roll == [("STDOUT", "a"), ("STDOUT", "b")]
+    assert roll.dropped == 1
+
+
+def test_index_arrays_widen_when_a_value_no_longer_fits():
+    from array import array
+
+    from dokker.log_watcher import _index_append
+
+    narrow = array("I", [1])
+    assert _index_append(narrow, 2) is narrow
+    wide = _index_append(narrow, 2**40)
+    assert wide.typecode == "Q"
+    assert list(wide) == [1, 2, 2**40]
@@ -0,0 +1,159 @@
+"""Unit tests for the fast project mirror of ``CopyPathProject``.
+
+The test filesystem may or may not support reflinks, so the tests only pin
+what holds either way: the mirror has the same content as the source, compose
+and config files are real copies, and ``"hardlink"`` mode links every other
+file when the filesystem cannot clone it.
+"""
+
+import os
+
+from dokker.projects.copy import CopyPathProject
+from dokker.projects.mirror import MANIFEST_NAME, mirror_tree
+
+
+def _make_project(root) -> None:
+    (root / "data").mkdir(parents=True)
+    (root / "docker-compose.yml").write_text("services: {}\n")
+    (root / ".env").write_text("A=1\n")
+    (root / "app.py").write_text("print('hi')\n")
+    (root / "data" / "fixture.bin").write_bytes(os.urandom(4096))
+
+
+def _files(root) -> dict:
+    return {str(path.relative_to(root)): path.read_bytes() for path in root.rglob("*") if path.is_file() and path.name != MANIFEST_NAME}
+
+
+def _same_inode(a, b) -> bool:
+    return os.stat(a).st_ino == os.stat(b).st_ino
+
+
+def test_copy_mode_copies_everything(tmp_path):
+    _make_project(tmp_path / "src")
+    stats = mirror_tree(str(tmp_path / "src"), str(tmp_path / "dst"), mode="copy")
+
+    assert _files(tmp_path / "dst") == _files(tmp_path / "src")
+    assert (stats.copied, stats.cloned, stats.linked) == (4, 0, 0)
+
+
+def test_hardlink_mode_links_all_but_compose_and_config(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    _make_project(src)
+    stats = mirror_tree(str(src), str(dst), mode="hardlink")
+
+    assert _files(dst) == _files(src)
+    assert not _same_inode(src / "docker-compose.yml", dst / "docker-compose.yml")
+    assert not _same_inode(src / ".env", dst / ".env")
+    assert stats.copied == 2 and stats.cloned + stats.linked == 2
+    if stats.linked:
+        assert _same_inode(src / "data" / "fixture.bin", dst / "data" / "fixture.bin")
+
+
+def test_remirroring_never_writes_through_a_link(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    _make_project(src)
+    mirror_tree(str(src), str(dst), mode="hardlink")
+    mirror_tree(str(src), str(dst), mode="copy")
+
+    (dst / "app.py").write_text("changed\n")
+    assert (src / "app.py").read_text() == "print('hi')\n"
+
+
+async def test_project_mirrors_off_the_event_loop(tmp_path):
+    _make_project(tmp_path / "src")
+    project = CopyPathProject(project_path=tmp_path / "src", project_name="proj", base_dir=str(tmp_path / ".dokker"))
+
+    cli = await project.ainititialize()
+
+    assert cli.compose_files == [str(tmp_path / ".dokker" / "proj" / "docker-compose.yml")]
+    assert _files(tmp_path / ".dokker" / "proj") == _files(tmp_path / "src")
+    assert project.last_mirror is not None and project.last_mirror.copied >= 2
+
+    await project.atear_down(cli)
+    assert not (tmp_path / ".dokker" / "proj").exists()
+
+
+def test_resync_only_touches_what_changed(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    _make_project(src)
+    first = mirror_tree(str(src), str(dst), mode="copy")
+    assert sorted(first.added) == [".env", "app.py", "data/fixture.bin", "docker-compose.yml"]
+
+    (src / "app.py").write_text("print('bye')\n")
+    (src / "new.txt").write_text("new\n")
+    (src / "data" / "fixture.bin").unlink()
+    (src / "data").rmdir()
+    second = mirror_tree(str(src), str(dst), mode="copy")
+
+    assert second.added == ["new.txt"]
+    assert second.changed == ["app.py"]
+    assert second.removed == ["data/fixture.bin"]
+    assert second.unchanged == 2 and second.copied == 2
+    assert _files(dst) == _files(src)
+    assert not (dst / "data").exists()
+
+
+def test_resync_compares_content_when_only_the_mtime_changed(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    _make_project(src)
+    mirror_tree(str(src), str(dst), mode="copy")
+
+    os.utime(src / "app.py", ns=(0, 0))
+    stats = mirror_tree(str(src), str(dst), mode="copy")
+    assert stats.changed == [] and stats.unchanged == 4
+
+    # The content hash is remembered, so the next run only stats the file.
+    assert mirror_tree(str(src), str(dst), mode="copy").unchanged == 4
+
+
+def test_resync_restores_files_changed_in_the_mirror(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    _make_project(src)
+    mirror_tree(str(src), str(dst), mode="copy")
+
+    (dst / "app.py").write_text("written by a container\n")
+    (dst / "runtime.log").write_text("kept\n")
+    stats = mirror_tree(str(src), str(dst), mode="copy")
+
+    assert stats.changed == ["app.py"]
+    assert (dst / "app.py").read_text() == "print('hi')\n"
+    assert (dst / "runtime.log").exists()
+
+
+async def test_project_resyncs_an_existing_mirror_with_overwrite(tmp_path):
+    _make_project(tmp_path / "src")
+    kwargs = dict(project_path=tmp_path / "src", project_name="proj", base_dir=str(tmp_path / ".dokker"))
+    await CopyPathProject(**kwargs).ainititialize()
+
+    (tmp_path / "src" / "app.py").write_text("print('bye')\n")
+    project = CopyPathProject(overwrite=True, **kwargs)
+    await project.ainititialize()
+
+    assert project.last_mirror is not None
+    assert project.last_mirror.changed == ["app.py"] and project.last_mirror.unchanged == 3
+
+
+async def test_teardown_moves_the_mirror_to_the_trash_and_purges_it(tmp_path):
+    _make_project(tmp_path / "src")
+    project = CopyPathProject(project_path=tmp_path / "src", project_name="proj", base_dir=str(tmp_path / ".dokker"))
+    cli = await project.ainititialize()
+
+    await project.atear_down(cli)
+
+    assert not (tmp_path / ".dokker" / "proj").exists()
+    for thread in project._purges:
+        thread.join(5)
+    assert list((tmp_path / ".dokker" / ".trash").iterdir()) == []
+
+
+async def test_initialize_sweeps_leftover_trash(tmp_path):
+    _make_project(tmp_path / "src")
+    leftover = tmp_path / ".dokker" / ".trash" / "old-1234"
+    _make_project(leftover)
+    project = CopyPathProject(project_path=tmp_path / "src", project_name="proj", base_dir=str(tmp_path / ".dokker"))
+
+    await project.ainititialize()
+
+    for thread in project._purges:
+        thread.join(5)
+    assert not leftover.exists()
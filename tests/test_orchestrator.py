@@ -0,0 +1,69 @@
+"""Unit tests for ``Orchestrator``.
+
+The deployments run against the ``fake_docker`` fixture (see ``conftest.py``),
+which records every compose call and how many ran at once.
+"""
+
+import pytest
+
+import dokker
+from dokker import Deployment, LocalProject, OrchestrationError, Orchestrator
+
+
+def _stacks(compose_file: str, *names: str) -> dict:
+    return {name: dokker.testing(compose_file, project_name=name) for name in names}
+
+
+async def test_deployments_come_up_and_down_concurrently_within_the_cap(fake_docker, monkeypatch):
+    compose_file, calls = fake_docker
+    monkeypatch.setenv("DOCKER_DELAY", "0.1")
+    orchestrator = Orchestrator(deployments=_stacks(compose_file, "a", "b", "c", "d"), max_workers=2)
+
+    async with orchestrator:
+        assert set(orchestrator.logs) == {"a", "b", "c", "d"}
+        assert orchestrator.logs["a"]["up"].returncode is None
+        assert all(d.spec.find_service("web").image == "nginx" for d in orchestrator.deployments.values())
+
+    assert calls.max_in_flight() == 2
+    downs = {call[0] for call in calls() if call[1] == "down"}
+    assert downs == {"a", "b", "c", "d"}
+
+
+async def test_failed_up_tears_everything_down(fake_docker, monkeypatch):
+    compose_file, calls = fake_docker
+    monkeypatch.setenv("FAIL_PROJECT", "bad")
+    orchestrator = Orchestrator(deployments=_stacks(compose_file, "good", "bad"), pull=False)
+
+    with pytest.raises(OrchestrationError) as excinfo:
+        await orchestrator.aup()
+
+    assert set(excinfo.value.errors) == {"bad"}
+    assert "bad" in str(excinfo.value)
+    assert [call[1] for call in calls() if call[0] == "good"] == ["up", "config", "down"]
+
+
+async def test_failed_up_downs_deployments_of_any_policy(fake_docker, monkeypatch):
+    compose_file, calls = fake_docker
+    monkeypatch.setenv("FAIL_PROJECT", "bad")
+    stacks = {name: Deployment(project=LocalProject(compose_files=[compose_file], project_name=name)) for name in ("good", "bad")}
+    orchestrator = Orchestrator(deployments=stacks, pull=False)
+
+    with pytest.raises(OrchestrationError):
+        await orchestrator.aup()
+
+    assert stacks["good"].policy == "manual"
+    assert [call[1] for call in calls() if call[0] == "good"] == ["up", "config", "down"]
+
+
+async def test_default_cap_is_the_smallest_threadpool_setting(fake_docker):
+    compose_file, _ = fake_docker
+    stacks = _stacks(compose_file, "a", "b")
+    stacks["b"].threadpool_workers = 3
+    assert Orchestrator(deployments=stacks).workers == 3
+
+
+def test_sync_up_and_down(fake_docker):
+    compose_file, calls = fake_docker
+    with Orchestrator(deployments=_stacks(compose_file, "x")) as orchestrator:
+        assert isinstance(orchestrator.deployments["x"], Deployment)
+    assert [call[1] for call in calls()] == ["pull", "up", "config", "down"]
@@ -0,0 +1,96 @@
+"""Unit tests for ``DeploymentPool``.
+
+The ``fake_docker`` fixture (see ``conftest.py``) puts a fake ``docker`` first
+on ``PATH`` that records every invocation, so the tests can follow what the
+pool asks compose to do without starting containers.
+"""
+
+import asyncio
+
+import pytest
+
+from dokker import DeploymentPool, PoolError
+
+
+def _commands(calls, project=None) -> list:
+    return [call[1] for call in calls if project is None or call[0] == project]
+
+
+async def test_pool_starts_every_stack_once_and_pulls_once(fake_docker):
+    compose_file, calls = fake_docker
+    async with DeploymentPool(docker_compose_file=compose_file, size=3) as pool:
+        projects = {d.project.project_name for d in pool.deployments}
+        assert len(projects) == 3
+        assert _commands(calls()).count("pull") == 1
+        for project in projects:
+            assert _commands(calls(), project) == ["up", "config"]
+
+    downs = [call for call in calls() if call[1] == "down"]
+    assert {call[0] for call in downs} == projects
+    assert all("--volumes" in call for call in downs)
+
+
+async def test_leases_hand_out_distinct_stacks_and_restart_them(fake_docker):
+    compose_file, calls = fake_docker
+    async with DeploymentPool(docker_compose_file=compose_file, size=2, pull=False) as pool:
+        async with pool.alease() as first, pool.alease() as second:
+            assert first is not second
+        project = first.project.project_name
+        restart = next(call for call in calls() if call[0] == project and call[1] == "restart")
+        assert sorted(restart[2:]) == ["db", "web"]
+
+        async with pool.alease() as again:
+            assert again in (first, second)
+
+
+async def test_volume_reset_downs_and_ups_again(fake_docker):
+    compose_file, calls = fake_docker
+    async with DeploymentPool(docker_compose_file=compose_file, size=1, pull=False, reset="volumes") as pool:
+        async with pool.alease() as deployment:
+            pass
+        assert _commands(calls(), deployment.project.project_name) == ["up", "config", "down", "up"]
+
+
+async def test_failed_reset_replaces_the_stack(fake_docker, monkeypatch):
+    compose_file, calls = fake_docker
+    async with DeploymentPool(docker_compose_file=compose_file, size=1, pull=False) as pool:
+        async with pool.alease() as broken:
+            monkeypatch.setenv("FAIL_ON", "restart")
+        monkeypatch.delenv("FAIL_ON")
+
+        async with pool.alease() as replacement:
+            assert replacement is not broken
+        assert pool.deployments == [replacement]
+    assert "down" in _commands(calls(), broken.project.project_name)
+
+
+async def test_failed_replacement_shrinks_the_pool_and_wakes_waiters(fake_docker, monkeypatch):
+    compose_file, calls = fake_docker
+    async with DeploymentPool(docker_compose_file=compose_file, size=1, pull=False) as pool:
+        leased = await pool.aacquire()
+        waiter = asyncio.ensure_future(pool.aacquire())
+        await asyncio.sleep(0.05)
+        monkeypatch.setenv("FAIL_ON", "restart,up")
+        await pool.arelease(leased)
+        monkeypatch.delenv("FAIL_ON")
+
+        with pytest.raises(PoolError):
+            await waiter
+        with pytest.raises(PoolError):
+            await pool.aacquire()
+        assert pool.deployments == []
+    assert _commands(calls()).count("up") == 1 + pool.replace_attempts
+
+
+async def test_unstarted_pool_cannot_lease(fake_docker):
+    compose_file, _ = fake_docker
+    with pytest.raises(PoolError):
+        await DeploymentPool(docker_compose_file=compose_file).aacquire()
+
+
+def test_sync_lease(fake_docker):
+    compose_file, calls = fake_docker
+    with DeploymentPool(docker_compose_file=compose_file, size=1, pull=False) as pool:
+        with pool.lease() as deployment:
+            assert deployment.spec.find_service("web").image == "nginx"
+    assert _commands(calls())[-2:] == ["restart", "down"]
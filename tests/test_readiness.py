@@ -0,0 +1,158 @@
+"""Unit tests for the readiness mode of ``Deployment.aup``.
+
+A stub stands in for ``docker compose``: ``ps`` answers with the next entry of
+a scripted sequence of container states (repeating the last one), every other
+command just succeeds. That lets the tests walk containers through
+``starting -> healthy`` without docker.
+"""
+
+import json
+import sys
+
+import pytest
+
+from dokker import CLI, ComposeContainer, Deployment, NotReadyError
+
+
+def _ps(service: str, state: str = "running", health: str = "", exit_code: int = 0) -> dict:
+    return {"ID": f"id-{service}", "Name": f"proj-{service}-1", "Service": service, "State": state, "Health": health, "ExitCode": exit_code, "Labels": "com.docker.compose.container-number=1"}
+
+
+class Stub:
+    """A fake compose binary replaying scripted ``ps`` answers."""
+
+    def __init__(self, tmp_path, polls: list) -> None:
+        self.polls = tmp_path / "polls.json"
+        self.polls.write_text(json.dumps(polls))
+        self.counter = tmp_path / "count"
+        self.calls = tmp_path / "calls"
+        self.script = tmp_path / "compose.py"
+        self.script.write_text(
+            "import json, os, sys\n"
+            f"open({str(self.calls)!r}, 'a').write(' '.join(sys.argv[1:]) + '\\n')\n"
+            "if 'ps' not in sys.argv:\n"
+            "    sys.exit(0)\n"
+            f"n = int(open({str(self.counter)!r}).read()) if os.path.exists({str(self.counter)!r}) else 0\n"
+            f"open({str(self.counter)!r}, 'w').write(str(n + 1))\n"
+            f"polls = json.load(open({str(self.polls)!r}))\n"
+            "print(json.dumps(polls[min(n, len(polls) - 1)]))\n"
+        )
+        self.compose_file = tmp_path / "docker-compose.yml"
+        self.compose_file.write_text("services: {}\n")
+
+    @property
+    def commands(self) -> list:
+        return self.calls.read_text().splitlines()
+
+    def cli(self) -> CLI:
+        return CLI(compose_files=[str(self.compose_file)], client_call=[sys.executable, str(self.script)])
+
+
+class RecordingLogger:
+    """Collects everything passed to ``on_up``."""
+
+    def __init__(self) -> None:
+        self.up: list = []
+
+    def on_pull(self, log) -> None:
+        pass
+
+    def on_up(self, log) -> None:
+        self.up.append(log)
+
+    def on_stop(self, log) -> None:
+        pass
+
+    def on_logs(self, log) -> None:
+        pass
+
+    def on_down(self, log) -> None:
+        pass
+
+
+async def test_up_waits_until_every_service_is_healthy(tmp_path, stub_project):
+    stub = Stub(
+        tmp_path,
+        [
+            [_ps("web", health="starting"), _ps("db", health="starting")],
+            [_ps("web", health="healthy"), _ps("db", health="starting")],
+            [_ps("web", health="healthy"), _ps("db", health="healthy")],
+        ],
+    )
+    logger = RecordingLogger()
+    deployment = Deployment(project=stub_project(stub.cli), logger=logger)
+
+    containers = await deployment.await_until_ready(poll_interval=0.01)
+
+    assert all(c.is_ready for c in containers)
+    transitions = [text for _, text in logger.up]
+    assert transitions[:4] == ["proj-web-1: running (starting)", "proj-db-1: running (starting)", "proj-web-1: running (healthy)", "proj-db-1: running (healthy)"]
+
+
+async def test_up_in_readiness_mode_polls_after_up(tmp_path, stub_project):
+    stub = Stub(tmp_path, [[_ps("web", health="healthy")]])
+    deployment = Deployment(project=stub_project(stub.cli))
+
+    await deployment.aup(wait=True)
+
+    up, ps = stub.commands[-2:]
+    assert "up" in up.split() and "ps" in ps.split()
+
+
+async def test_service_timeouts_are_per_service(tmp_path, stub_project):
+    stub = Stub(tmp_path, [[_ps("web"), _ps("slow", health="starting")]])
+    deployment = Deployment(project=stub_project(stub.cli))
+
+    with pytest.raises(NotReadyError, match="slow: proj-slow-1 running \\(starting\\)"):
+        await deployment.await_until_ready(timeout=60, service_timeouts={"slow": 0.05}, poll_interval=0.01)
+
+
+async def test_failed_container_raises_immediately(tmp_path, stub_project):
+    stub = Stub(tmp_path, [[_ps("web", state="exited", exit_code=3)]])
+    deployment = Deployment(project=stub_project(stub.cli))
+
+    with pytest.raises(NotReadyError, match="exit code 3"):
+        await deployment.await_until_ready(timeout=60)
+
+
+async def test_missing_service_is_not_ready(tmp_path, stub_project):
+    stub = Stub(tmp_path, [[_ps("web")]])
+    deployment = Deployment(project=stub_project(stub.cli))
+
+    with pytest.raises(NotReadyError, match="ghost: no containers"):
+        await deployment.await_until_ready(["web", "ghost"], timeout=0.05, poll_interval=0.01)
+
+
+async def test_no_containers_yet_is_not_ready(tmp_path, stub_project):
+    stub = Stub(tmp_path, [[], [], [_ps("web")]])
+    deployment = Deployment(project=stub_project(stub.cli))
+
+    containers = await deployment.await_until_ready(poll_interval=0.01)
+
+    assert [c.service for c in containers] == ["web"]
+    assert sum("ps" in command.split() for command in stub.commands) == 3
+
+
+async def test_no_containers_at_all_times_out(tmp_path, stub_project):
+    stub = Stub(tmp_path, [[]])
+    deployment = Deployment(project=stub_project(stub.cli))
+
+    with pytest.raises(NotReadyError, match="No containers appeared"):
+        await deployment.await_until_ready(timeout=0.05, poll_interval=0.01)
+
+
+async def test_compose_wait_passes_the_flag(tmp_path, stub_project):
+    stub = Stub(tmp_path, [[]])
+    deployment = Deployment(project=stub_project(stub.cli))
+
+    await deployment.aup(compose_wait=True)
+
+    assert any(command.split()[-3:] == ["up", "--detach", "--wait"] for command in stub.commands)
+
+
+def test_container_readiness():
+    assert ComposeContainer.from_ps(_ps("web")).is_ready
+    assert not ComposeContainer.from_ps(_ps("web", health="starting")).is_ready
+    assert ComposeContainer.from_ps(_ps("job", state="exited")).is_ready
+    assert ComposeContainer.from_ps(_ps("web", health="unhealthy")).has_failed
+    assert not ComposeContainer.from_ps(_ps("web", state="created")).has_failed
@@ -0,0 +1,108 @@
+"""Unit tests for ``SpecCache``.
+
+A stub stands in for ``docker compose``: it prints a fixed ``config`` JSON and
+appends a line to a counter file on every invocation, so the tests can assert
+exactly when the cache skipped the subprocess.
+"""
+
+import json
+import os
+import sys
+
+from dokker import CLI, Deployment, SpecCache
+
+CONFIG = {"services": {"web": {"image": "nginx", "ports": [{"target": 80, "published": 8080}]}}}
+
+
+class Stub:
+    """A fake compose binary that counts how often it is called."""
+
+    def __init__(self, tmp_path) -> None:
+        self.counter = tmp_path / "calls"
+        self.script = tmp_path / "compose.py"
+        self.script.write_text(f"import json\nopen({str(self.counter)!r}, 'a').write('x\\n')\nprint(json.dumps({CONFIG!r}))\n")
+        self.compose_file = tmp_path / "docker-compose.yml"
+        self.compose_file.write_text("services:\n  web:\n    image: nginx\n")
+
+    @property
+    def calls(self) -> int:
+        return len(self.counter.read_text().splitlines()) if self.counter.exists() else 0
+
+    def cli(self, **kwargs) -> CLI:
+        return CLI(compose_files=[str(self.compose_file)], client_call=[sys.executable, str(self.script)], **kwargs)
+
+
+async def test_unchanged_project_skips_subprocess(tmp_path):
+    stub = Stub(tmp_path)
+    cache = SpecCache(base_dir=str(tmp_path / ".dokker"))
+    first = await cache.ainspect(stub.cli())
+    second = await cache.ainspect(stub.cli())
+    assert stub.calls == 1
+    assert second is first
+    assert first.find_service("web").get_port_for_internal(80).published == 8080
+
+
+async def test_changed_compose_file_invalidates(tmp_path):
+    stub = Stub(tmp_path)
+    cache = SpecCache(base_dir=str(tmp_path / ".dokker"))
+    await cache.ainspect(stub.cli())
+    stub.compose_file.write_text("services:\n  web:\n    image: nginx:alpine\n")
+    await cache.ainspect(stub.cli())
+    assert stub.calls == 2
+
+
+async def test_env_file_profiles_and_project_name_are_part_of_the_key(tmp_path):
+    stub = Stub(tmp_path)
+    cache = SpecCache(base_dir=str(tmp_path / ".dokker"))
+    base = cache.key_for(stub.cli())
+
+    assert cache.key_for(stub.cli(compose_project_name="other")) != base
+    assert cache.key_for(stub.cli(compose_profiles=["debug"])) != base
+
+    (tmp_path / ".env").write_text("PORT=1\n")
+    assert cache.key_for(stub.cli()) != base
+
+
+async def test_persisted_entries_survive_a_new_cache(tmp_path):
+    stub = Stub(tmp_path)
+    base_dir = str(tmp_path / ".dokker")
+    await SpecCache(persist=True, base_dir=base_dir).ainspect(stub.cli())
+    assert len(os.listdir(os.path.join(base_dir, "spec-cache"))) == 1
+
+    spec = await SpecCache(persist=True, base_dir=base_dir).ainspect(stub.cli())
+    assert stub.calls == 1
+    assert spec.find_service("web").image == "nginx"
+
+
+async def test_corrupt_persisted_entry_is_ignored(tmp_path):
+    stub = Stub(tmp_path)
+    cache = SpecCache(persist=True, base_dir=str(tmp_path / ".dokker"))
+    key = cache.key_for(stub.cli())
+    os.makedirs(cache.cache_dir)
+    with open(os.path.join(cache.cache_dir, f"{key}.json"), "w") as f:
+        f.write("{not json")
+
+    await cache.ainspect(stub.cli())
+    assert stub.calls == 1
+    with open(os.path.join(cache.cache_dir, f"{key}.json")) as f:
+        assert json.load(f)["services"]["web"]["image"] == "nginx"
+
+
+async def test_clear_drops_memory_and_disk(tmp_path):
+    stub = Stub(tmp_path)
+    cache = SpecCache(persist=True, base_dir=str(tmp_path / ".dokker"))
+    await cache.ainspect(stub.cli())
+    cache.clear()
+    assert os.listdir(cache.cache_dir) == []
+    await cache.ainspect(stub.cli())
+    assert stub.calls == 2
+
+
+async def test_deployments_share_a_cache(tmp_path, stub_project):
+    stub = Stub(tmp_path)
+    cache = SpecCache(base_dir=str(tmp_path / ".dokker"))
+    for _ in range(3):
+        async with Deployment(project=stub_project(lambda: stub.cli(compose_project_name="cached")), spec_cache=cache) as deployment:
+            await deployment.ainspect()
+            assert deployment.spec.find_service("web").image == "nginx"
+    assert stub.calls == 1
@@ -0,0 +1,150 @@
+"""Unit tests for the lifecycle timing spans of ``dokker.tracing``."""
+
+import asyncio
+import json
+import logging
+import sys
+import time
+
+import pytest
+
+from dokker import CLI, CommandError, Deployment
+from dokker.command import astream_command
+from dokker.tracing import OTLPJsonFileExporter, Tracer
+
+FAKE_COMPOSE = """
+import sys
+print("compose", " ".join(sys.argv[1:]))
+print("warning", file=sys.stderr)
+sys.exit(3 if "stop" in sys.argv else 0)
+"""
+
+
+def _script_cli(tmp_path):
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text("services: {}\n")
+    script = tmp_path / "compose.py"
+    script.write_text(FAKE_COMPOSE)
+    return lambda: CLI(compose_files=[str(compose_file)], client_call=[sys.executable, str(script)])
+
+
+def _by_id(tracer: Tracer):
+    return {span.span_id: span for span in tracer.spans}
+
+
+async def test_phases_nest_their_subprocess_spans(tmp_path, stub_project):
+    tracer = Tracer()
+    deployment = Deployment(project=stub_project(_script_cli(tmp_path)), tracer=tracer, policy="testing")
+    async with deployment:
+        await deployment.apull()
+        await deployment.aup()
+
+    spans = _by_id(tracer)
+    names = [span.name for span in deployment.timeline]
+    assert names[:3] == ["pull", "initialize", "command"]
+    assert {"up", "teardown", "teardown_step", "down"} <= set(names)
+
+    pull_command = next(span for span in tracer.spans if span.name == "command" and "pull" in span.attributes["argv"])
+    assert spans[pull_command.parent_id].name == "pull"
+    assert pull_command.attributes["exit_code"] == 0
+    assert pull_command.attributes["stdout_bytes"] == len(f"compose {' '.join(pull_command.attributes['argv'][2:])}\n")
+    assert pull_command.attributes["stderr_bytes"] == len("warning\n")
+
+    down = next(span for span in tracer.spans if span.name == "down")
+    step = spans[down.parent_id]
+    assert step.name == "teardown_step" and step.attributes["step"] == "down"
+    assert spans[step.parent_id].name == "teardown"
+    assert all(span.status == "ok" and span.duration is not None and span.duration >= 0 for span in tracer.spans)
+
+
+async def test_failed_phase_records_the_error_and_exit_code(tmp_path, stub_project):
+    tracer = Tracer()
+    deployment = Deployment(project=stub_project(_script_cli(tmp_path)), tracer=tracer)
+    with pytest.raises(CommandError):
+        await deployment.astop()
+
+    stop = next(span for span in tracer.spans if span.name == "stop")
+    command = next(span for span in tracer.spans if span.name == "command" and "stop" in span.attributes["argv"])
+    assert (stop.status, command.status) == ("error", "error")
+    assert command.attributes["exit_code"] == 3
+    assert stop.error is not None and stop.error.startswith("CommandError")
+    assert "stop FAILED" in tracer.format_timeline()
+
+
+async def test_concurrent_tasks_keep_their_own_parents():
+    tracer = Tracer()
+
+    async def phase(name: str) -> None:
+        with tracer.span(name):
+            await asyncio.sleep(0.01)
+            with tracer.span(f"{name}.inner"):
+                await asyncio.sleep(0)
+
+    await asyncio.gather(phase("a"), phase("b"))
+    spans = _by_id(tracer)
+    for inner in (span for span in tracer.spans if span.name.endswith(".inner")):
+        assert spans[inner.parent_id].name == inner.name.split(".")[0]
+
+
+async def test_commands_outside_a_span_are_not_recorded():
+    tracer = Tracer()
+    async for _ in astream_command([sys.executable, "-c", "print(1)"]):
+        pass
+    assert tracer.spans == []
+
+
+def test_otlp_file_exporter_writes_a_batch_per_request(tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    tracer = Tracer(exporters=[OTLPJsonFileExporter(str(path), flush_interval=60)], service_name="ci")
+    with tracer.span("up", services=["web", "db"], attempts=2):
+        with tracer.span("command", argv=["docker", "compose", "up"]):
+            pass
+
+    # Nothing is written on the event loop; shutdown writes the batch.
+    assert not path.exists()
+    tracer.shutdown()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 1
+    resource = lines[0]["resourceSpans"][0]
+    assert resource["resource"]["attributes"] == [{"key": "service.name", "value": {"stringValue": "ci"}}]
+    command, up = resource["scopeSpans"][0]["spans"]
+    assert command["parentSpanId"] == up["spanId"] and "parentSpanId" not in up
+    assert command["traceId"] == up["traceId"] == tracer.trace_id
+    assert int(up["endTimeUnixNano"]) >= int(command["endTimeUnixNano"]) >= int(command["startTimeUnixNano"])
+    assert {"key": "attempts", "value": {"intValue": "2"}} in up["attributes"]
+    assert up["status"] == {"code": 1}
+
+
+def test_otlp_file_exporter_writes_from_a_thread(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = OTLPJsonFileExporter(str(path), flush_interval=0.01)
+    Tracer(exporters=[exporter], service_name="a").start_span("up").end()
+    Tracer(exporters=[exporter], service_name="b").start_span("down").end()
+
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    exporter.shutdown()
+
+    requests = [json.loads(line) for line in path.read_text().splitlines()]
+    resources = [resource for request in requests for resource in request["resourceSpans"]]
+    assert sorted(resource["resource"]["attributes"][0]["value"]["stringValue"] for resource in resources) == ["a", "b"]
+
+
+def test_a_failing_exporter_is_logged_once(caplog):
+    class Broken:
+        def export(self, spans):
+            raise RuntimeError("collector is down")
+
+        def shutdown(self):
+            pass
+
+    tracer = Tracer(exporters=[Broken()])
+    with caplog.at_level(logging.WARNING, logger="dokker.tracing"):
+        for name in ("pull", "up"):
+            with tracer.span(name):
+                pass
+
+    assert [span.name for span in tracer.spans] == ["pull", "up"]
+    assert len([record for record in caplog.records if "span exporter" in record.message]) == 1